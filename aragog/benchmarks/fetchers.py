@@ -0,0 +1,39 @@
+"""
+Benchmarks serial vs concurrent page fetching of `DRFFetcher` against the local stub server
+
+    $ python -m aragog.benchmarks.fetchers
+"""
+import time
+
+from aragog.benchmarks.stub_server import StubAPIServer, make_records
+from aragog.fetchers.api import DRFFetcher
+
+
+def time_fetch(url, concurrency):
+    start = time.time()
+    records = list(DRFFetcher(url, concurrency=concurrency))
+    return time.time() - start, records
+
+
+def run(num_records=5000, page_size=100, latency=0.02, concurrency_levels=(1, 4, 8, 16)):
+    results = []
+    for pagination in ('page', 'limit_offset'):
+        with StubAPIServer(make_records(num_records), page_size=page_size, pagination=pagination,
+                           latency=latency) as server:
+            url = server.base_url + '/drf/'
+            serial_time, expected = time_fetch(url, 1)
+            for concurrency in concurrency_levels:
+                elapsed, records = time_fetch(url, concurrency)
+                assert records == expected, 'concurrent fetch returned different records'
+                results.append({
+                    'pagination': pagination,
+                    'concurrency': concurrency,
+                    'seconds': elapsed,
+                    'speedup': serial_time / elapsed,
+                })
+    return results
+
+
+if __name__ == '__main__':
+    for result in run():
+        print('pagination:%(pagination)s concurrency:%(concurrency)s %(seconds).2fs speedup:%(speedup).1fx' % result)
@@ -0,0 +1,85 @@
+"""
+Synthetic datasets with a given number of rows and columns, mix of column types, rate of nulls and cardinality
+"""
+import datetime
+
+import numpy
+import pandas as pd
+
+COLUMN_TYPES = ('int', 'float', 'string', 'bool', 'date', 'datetime')
+DEFAULT_TYPE_MIX = {'int': 3, 'float': 2, 'string': 3, 'bool': 1, 'date': 1}
+EPOCH = datetime.datetime(2000, 1, 1)
+
+
+def get_column_types(num_columns, type_mix=None):
+    """
+    spreads `num_columns` over the types of `type_mix` ({type: weight}), in proportion to their weights
+    """
+    type_mix = type_mix or DEFAULT_TYPE_MIX
+    unknown = set(type_mix) - set(COLUMN_TYPES)
+    if unknown:
+        raise ValueError('unknown column type(s):%s' % ', '.join(sorted(unknown)))
+    types = sorted(type_mix)
+    weights = numpy.array([type_mix[t] for t in types], dtype=float)
+    cumulative = numpy.cumsum(weights / weights.sum())
+    return [types[min(numpy.searchsorted(cumulative, (i + 0.5) / num_columns), len(types) - 1)]
+            for i in range(num_columns)]
+
+
+def make_column(column_type, codes):
+    """
+    maps integer `codes` to values of `column_type`, so that the same code always gives the same value
+    """
+    if column_type == 'int':
+        return codes
+    if column_type == 'float':
+        return codes * 1.25
+    if column_type == 'string':
+        return numpy.array(['value-%s' % code for code in codes], dtype=object)
+    if column_type == 'bool':
+        return codes % 2 == 0
+    if column_type == 'date':
+        return numpy.array([(EPOCH + datetime.timedelta(days=int(code))).strftime('%Y-%m-%d') for code in codes],
+                           dtype=object)
+    return numpy.array([(EPOCH + datetime.timedelta(seconds=int(code) * 37)).strftime('%Y-%m-%dT%H:%M:%S')
+                        for code in codes], dtype=object)
+
+
+def make_frame(num_rows=10000, num_columns=10, type_mix=None, null_rate=0.0, cardinality=None, seed=0):
+    """
+    returns a dataframe of `num_rows` rows and `num_columns` columns named `<type>_<idx>`. every column holds
+    `cardinality` distinct values (or as many as there are rows), and `null_rate` of its values are null.
+    dates and datetimes are strings, like they are in CSV files and APIs
+    """
+    rng = numpy.random.RandomState(seed)
+    data = {}
+    for idx, column_type in enumerate(get_column_types(num_columns, type_mix)):
+        name = '%s_%s' % (column_type, idx)
+        num_values = cardinality or num_rows
+        codes = rng.randint(0, num_values, size=num_rows)
+        values = pd.Series(make_column(column_type, codes))
+        if null_rate:
+            # ints and booleans would be turned into floats by NaNs
+            values = values.astype(object) if column_type in ('int', 'bool') else values
+            values = values.where(rng.random_sample(num_rows) >= null_rate)
+        data[name] = values
+    return pd.DataFrame(data, columns=sorted(data, key=lambda name: int(name.rsplit('_', 1)[1])))
+
+
+def to_records(df):
+    """
+    returns the rows of `df` as dicts, with `None` for nulls like a JSON API would
+    """
+    df = df.astype(object).where(df.notnull(), None)
+    return df.to_dict(orient='records')
+
+
+def write_csv(df, path):
+    df.to_csv(path, index=False)
+    return path
+
+
+def write_json(df, path):
+    # one record per line, which dask reads in blocks
+    df.to_json(path, orient='records', lines=True)
+    return path
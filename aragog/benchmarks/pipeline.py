@@ -0,0 +1,211 @@
+"""
+Times every stage of the ingest pipeline on synthetic CSV, JSON and API (served by the local stub server)
+datasets, and compares the timings with those of a baseline run
+
+    $ ./manage.py benchmark --output results.json --baseline baseline.json
+"""
+from collections import OrderedDict
+from contextlib import contextmanager
+import datetime
+import itertools
+import os
+import platform
+import shutil
+import tempfile
+import time
+
+import numpy
+from django.conf import settings
+from django.contrib import admin
+from django.contrib.auth.models import User
+from django.core.exceptions import ImproperlyConfigured
+from django.db import connections
+from django.test import RequestFactory
+from sqlalchemy.engine.url import make_url
+
+from aragog.benchmarks.generators import make_frame, to_records, write_csv, write_json
+from aragog.benchmarks.stub_server import StubAPIServer
+from aragog.coercion import get_coercions
+from aragog.loader import BulkLoader
+from aragog.model_generation import (get_index_name, get_model_config_from_schema, get_model_from_model_config,
+                                     get_sqla_schema_from_schema)
+from aragog.type_detection import get_schema_for_dataframe, merge_schemas
+
+SOURCES = ('csv', 'json', 'api_drf', 'api_generic')
+STAGES = ('fetch', 'get_schema_for_dataframe', 'merge_schemas', 'model_generation', 'write_to_db', 'index_build',
+          'admin_changelist')
+DB_ALIAS = 'aragog_benchmark'
+_MODEL_IDS = itertools.count(1)
+
+
+class StageTimer(object):
+    def __init__(self):
+        self.timings = OrderedDict()
+
+    @contextmanager
+    def stage(self, name):
+        start = time.time()
+        yield
+        self.timings[name] = time.time() - start
+
+
+class BenchmarkModelAdmin(admin.ModelAdmin):
+    """
+    reads from the benchmark database, which isn't necessarily the default one
+    """
+    list_per_page = 100
+    show_full_result_count = True
+
+    def get_queryset(self, request):
+        return super(BenchmarkModelAdmin, self).get_queryset(request).using(DB_ALIAS)
+
+
+def get_django_database(db_url):
+    url = make_url(db_url)
+    if url.drivername.startswith('sqlite'):
+        return {'ENGINE': 'django.db.backends.sqlite3', 'NAME': url.database}
+    if url.drivername.startswith('postgresql'):
+        return {'ENGINE': 'django.db.backends.postgresql', 'NAME': url.database, 'USER': url.username or '',
+                'PASSWORD': url.password or '', 'HOST': url.host or '', 'PORT': url.port or ''}
+    raise ImproperlyConfigured('cannot benchmark the admin against database:%s' % url.drivername)
+
+
+def get_dataset_params(source, df, tmp_dir, num_files, server=None):
+    """
+    returns the `(type, params)` of a dataset reading `df` from `source`
+    """
+    if source in ('csv', 'json'):
+        writer = write_csv if source == 'csv' else write_json
+        for idx, chunk in enumerate(numpy.array_split(df, num_files)):
+            writer(chunk, os.path.join(tmp_dir, 'part-%s.%s' % (idx, source)))
+        return source, {'path': os.path.join(tmp_dir, '*.%s' % source)}
+    if source == 'api_drf':
+        return source, {'url': server.base_url + '/drf/', 'concurrency': 4}
+    if source == 'api_generic':
+        return source, {'url': server.base_url + '/generic/'}
+    raise ValueError('unknown benchmark source:%s' % source)
+
+
+def time_changelist(model, list_filter, num_rows):
+    """
+    runs the queries of the changelist (without rendering it) for its first page, a deep page and a filtered page
+    """
+    model_admin = type(str('%sAdmin' % model.__name__), (BenchmarkModelAdmin,), {
+        'list_display': ['id'] + [f.name for f in model._meta.concrete_fields if not f.primary_key][:5],
+        'list_filter': list_filter,
+    })(model, admin.site)
+    user = User(username='benchmark', is_active=True, is_staff=True, is_superuser=True)
+    factory = RequestFactory()
+    queries = [{}, {'p': max(num_rows // model_admin.list_per_page - 1, 0)}]
+    if list_filter:
+        queries.append({'%s__exact' % list_filter[0]: 1})
+    for query in queries:
+        request = factory.get('/admin/aragog/%s/' % model._meta.model_name, query)
+        request.user = user
+        changelist = model_admin.get_changelist(request)(
+            request, model, model_admin.get_list_display(request), model_admin.get_list_display_links(request, []),
+            model_admin.get_list_filter(request), model_admin.date_hierarchy, model_admin.get_search_fields(request),
+            model_admin.get_list_select_related(request), model_admin.list_per_page,
+            model_admin.list_max_show_all, model_admin.list_editable, model_admin)
+        list(changelist.result_list)
+
+
+def run_pipeline(source, df, tmp_dir, db_url, num_files=4, num_indexes=3, server=None):
+    """
+    ingests `df` from `source`, stage by stage, and returns the time taken by every stage
+    """
+    # deferred, as the dataset model module ingests packages on import
+    from aragog.models import Dataset
+
+    timer = StageTimer()
+    name = str('Benchmark%s%s' % (source.title().replace('_', ''), next(_MODEL_IDS)))
+    table_name = name.lower()
+    ds_type, params = get_dataset_params(source, df, tmp_dir, num_files, server)
+    ds = Dataset(ds_type, params, name=name)
+    try:
+        with timer.stage('fetch'):
+            ddf = ds.get_data_frame().persist()
+        with timer.stage('get_schema_for_dataframe'):
+            schemas = ddf.map_partitions(get_schema_for_dataframe).compute()
+        with timer.stage('merge_schemas'):
+            schema = merge_schemas(schemas)
+        with timer.stage('model_generation'):
+            model_config = get_model_config_from_schema(schema)
+            model = get_model_from_model_config(name, model_config, {'app_label': 'aragog', 'db_table': table_name},
+                                                schema)
+        loader = BulkLoader(db_url, table_name, get_sqla_schema_from_schema(schema), coercions=get_coercions(schema))
+        with timer.stage('write_to_db'):
+            loader.load(ddf)
+        bool_columns = [c for c in ddf.columns if c.startswith('bool_')]
+        index_columns = (bool_columns[:1] + [c for c in ddf.columns if c not in bool_columns])[:num_indexes]
+        with timer.stage('index_build'):
+            loader.create_indexes([(get_index_name(table_name, [c]), [c]) for c in index_columns])
+        with timer.stage('admin_changelist'):
+            time_changelist(model, bool_columns[:1], len(df))
+    finally:
+        ds.cleanup()
+    return timer.timings
+
+
+def run(sources=SOURCES, num_rows=100000, num_columns=10, type_mix=None, null_rate=0.1, cardinality=None,
+        num_files=4, page_size=1000, repeat=1, db_url=None, seed=0):
+    """
+    returns the timings of every stage for every source (the best of `repeat` runs), along with the parameters
+    of the benchmark
+    """
+    params = OrderedDict([('num_rows', num_rows), ('num_columns', num_columns), ('type_mix', type_mix),
+                          ('null_rate', null_rate), ('cardinality', cardinality), ('num_files', num_files),
+                          ('page_size', page_size), ('repeat', repeat), ('seed', seed)])
+    df = make_frame(num_rows, num_columns, type_mix=type_mix, null_rate=null_rate, cardinality=cardinality,
+                    seed=seed)
+    tmp_dir = tempfile.mkdtemp(prefix='aragog-benchmark-')
+    db_url = db_url or 'sqlite:///%s' % os.path.join(tmp_dir, 'benchmark.db')
+    connections.databases[DB_ALIAS] = get_django_database(db_url)
+    results = []
+    try:
+        with StubAPIServer(to_records(df), page_size=page_size) as server:
+            for source in sources:
+                runs = []
+                for idx in range(repeat):
+                    source_dir = tempfile.mkdtemp(dir=tmp_dir)
+                    runs.append(run_pipeline(source, df, source_dir, db_url, num_files=num_files, server=server))
+                stages = OrderedDict((stage, min(timings[stage] for timings in runs)) for stage in STAGES)
+                results.append({'source': source, 'stages': stages, 'total': sum(stages.values())})
+    finally:
+        connections[DB_ALIAS].close()
+        del connections.databases[DB_ALIAS]
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+    return {
+        'meta': {
+            'created_at': datetime.datetime.utcnow().isoformat(),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'dask_scheduler': settings.DASK_SCHEDULER,
+            'dask_num_workers': settings.DASK_NUM_WORKERS,
+            'params': params,
+        },
+        'results': results,
+    }
+
+
+def find_regressions(results, baseline, threshold=0.25, min_seconds=0.05):
+    """
+    returns the stages that took over `threshold` (a fraction) longer than in `baseline`. differences under
+    `min_seconds` are noise
+    """
+    baseline_stages = dict((result['source'], result['stages']) for result in baseline['results'])
+    regressions = []
+    for result in results['results']:
+        for stage, seconds in result['stages'].items():
+            baseline_seconds = baseline_stages.get(result['source'], {}).get(stage)
+            if baseline_seconds is None:
+                continue
+            if seconds > baseline_seconds * (1 + threshold) and seconds - baseline_seconds > min_seconds:
+                regressions.append({
+                    'source': result['source'],
+                    'stage': stage,
+                    'baseline': baseline_seconds,
+                    'seconds': seconds,
+                    'ratio': seconds / baseline_seconds if baseline_seconds else None,
+                })
+    return regressions
@@ -0,0 +1,121 @@
+"""
+A local stub of a DRF / generic paginated API serving synthetic records, used to benchmark the fetchers
+without the network
+"""
+import hashlib
+import json
+import threading
+import time
+try:
+    from http.server import BaseHTTPRequestHandler, HTTPServer
+    from socketserver import ThreadingMixIn
+    from urllib.parse import parse_qs, urlparse
+except ImportError:
+    from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+    from SocketServer import ThreadingMixIn
+    from urlparse import parse_qs, urlparse
+
+
+def make_records(num_records):
+    return [{'id': i, 'name': 'name-%s' % i, 'value': i * 1.5} for i in range(num_records)]
+
+
+class StubAPIHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, *args):
+        pass
+
+    def get_page_url(self, **params):
+        # like DRF, the other params of the request are kept
+        params = dict(dict((k, v[0]) for k, v in self.query.items()), **params)
+        query = '&'.join('%s=%s' % (k, v) for k, v in sorted(params.items()))
+        return 'http://%s:%s%s?%s' % (self.server.server_name, self.server.server_port, self.path_only, query)
+
+    def get_drf_page(self, query):
+        server = self.server
+        records = server.records
+        count = len(records)
+        if server.pagination == 'limit_offset':
+            limit = int(query.get('limit', [server.page_size])[0])
+            offset = int(query.get('offset', [0])[0])
+            next_url = self.get_page_url(limit=limit, offset=offset + limit) if offset + limit < count else None
+        else:
+            limit = server.page_size
+            page = int(query.get('page', [1])[0])
+            offset = (page - 1) * limit
+            next_url = self.get_page_url(page=page + 1) if offset + limit < count else None
+        return {'count': count, 'next': next_url, 'previous': None, 'results': records[offset:offset + limit]}
+
+    def project(self, records):
+        """
+        keeps the comma separated `fields` of the request, if any
+        """
+        if 'fields' not in self.query:
+            return records
+        fields = self.query['fields'][0].split(',')
+        return [dict((k, v) for k, v in record.items() if k in fields) for record in records]
+
+    def do_GET(self):
+        parsed = urlparse(self.path)
+        self.path_only = parsed.path
+        self.query = parse_qs(parsed.query)
+        if self.server.latency:
+            time.sleep(self.server.latency)
+        if parsed.path == '/drf/':
+            data = self.get_drf_page(self.query)
+            data['results'] = self.project(data['results'])
+        elif parsed.path == '/generic/':
+            data = self.project(self.server.records)
+        else:
+            self.send_error(404)
+            return
+        body = json.dumps(data).encode('utf-8')
+        etag = '"%s"' % hashlib.sha1(body).hexdigest()
+        self.server.num_requests += 1
+        if self.headers.get('If-None-Match') == etag:
+            self.server.num_not_modified += 1
+            self.send_response(304)
+            self.send_header('ETag', etag)
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+            return
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.send_header('ETag', etag)
+        self.end_headers()
+        self.wfile.write(body)
+
+
+class StubAPIServer(ThreadingMixIn, HTTPServer):
+    """
+    serves `records` at /drf/ (paginated like DRF) and /generic/ (all at once) with ETags, and only their
+    `fields` when the param is given. `latency` seconds are added to every request
+    """
+    daemon_threads = True
+    request_queue_size = 128
+
+    def __init__(self, records, page_size=100, pagination='page', latency=0, port=0):
+        HTTPServer.__init__(self, ('127.0.0.1', port), StubAPIHandler)
+        self.records = records
+        self.page_size = page_size
+        self.pagination = pagination
+        self.latency = latency
+        self.num_requests = 0
+        self.num_not_modified = 0
+        self.thread = None
+
+    @property
+    def base_url(self):
+        return 'http://127.0.0.1:%s' % self.server_port
+
+    def __enter__(self):
+        self.thread = threading.Thread(target=self.serve_forever)
+        self.thread.daemon = True
+        self.thread.start()
+        return self
+
+    def __exit__(self, *args):
+        self.shutdown()
+        self.server_close()
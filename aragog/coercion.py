@@ -0,0 +1,255 @@
+"""
+Vectorized coercion of string columns to numbers, booleans, dates and datetimes. It types the columns during
+inference, and converts partitions to those types before they are loaded so that tables get native columns
+"""
+import logging
+import re
+
+import pandas as pd
+from django.conf import settings
+from pandas.api.types import infer_dtype
+
+_LOG = logging.getLogger(__name__)
+INTEGER_STRING_RE = re.compile(r'^\s*[-+]?\d+\s*$')
+# strings that could be dates in any of the supported formats
+DATE_LIKE_RE = re.compile(r'^\s*\d{1,4}[-/.]\d{1,2}[-/.]\d{1,4}')
+# number of values of a column checked before all of them are, and its date format is detected from
+SAMPLE_SIZE = 100
+COERCED_TYPES = ('integer', 'number', 'boolean', 'date', 'datetime')
+FORMAT_DIRECTIVE_RES = {'Y': r'\d{4}', 'm': r'\d{1,2}', 'd': r'\d{1,2}', 'H': r'\d{1,2}', 'M': r'\d{1,2}',
+                        'S': r'\d{1,2}', 'f': r'\d{1,6}'}
+
+
+def is_parsed(parsed):
+    """
+    whether enough of the values were parsed (the others are null in `parsed`)
+    """
+    if not len(parsed):
+        return True
+    return parsed.notnull().mean() >= settings.TYPE_DETECTION_MIN_PARSE_RATE
+
+
+def get_boolean_tokens():
+    return tuple(settings.TYPE_DETECTION_TRUE_TOKENS), tuple(settings.TYPE_DETECTION_FALSE_TOKENS)
+
+
+def coerce_boolean_strings(values):
+    """
+    returns the booleans of string `values` if all of them are boolean tokens (case insensitive), `None` otherwise
+    """
+    true_tokens, false_tokens = get_boolean_tokens()
+    if not values.iloc[:SAMPLE_SIZE].str.strip().str.lower().isin(true_tokens + false_tokens).all():
+        return None
+    tokens = values.str.strip().str.lower()
+    if not tokens.isin(true_tokens + false_tokens).all():
+        return None
+    return tokens.isin(true_tokens)
+
+
+def coerce_numeric_strings(values):
+    """
+    returns `(json_type, numbers)` for string `values`, or `(None, None)` if too few of them are numbers
+    """
+    if not is_parsed(pd.to_numeric(values.iloc[:SAMPLE_SIZE], errors='coerce')):
+        return None, None
+    numbers = pd.to_numeric(values, errors='coerce')
+    if not numbers.notnull().any() or not is_parsed(numbers):
+        return None, None
+    if values[numbers.notnull()].str.match(INTEGER_STRING_RE).all():
+        return 'integer', numbers
+    return 'number', numbers
+
+
+def get_date_type(date_format):
+    return 'date' if date_format in settings.TYPE_DETECTION_DATE_FORMATS else 'datetime'
+
+
+def get_format_re(date_format):
+    """
+    regex of the strings in `date_format`
+    """
+    parts = re.split(r'%(\w)', date_format)
+    # literals are at even positions, directives at odd ones
+    return re.compile('^%s$' % ''.join(FORMAT_DIRECTIVE_RES[part] if idx % 2 else re.escape(part)
+                                       for idx, part in enumerate(parts)))
+
+
+def parse_dates(values, date_format):
+    return pd.to_datetime(values, format=date_format, errors='coerce')
+
+
+def matches_format(values, date_format):
+    """
+    pandas parses any ISO 8601 string with any ISO format, so dates would parse as datetimes and the other way
+    round without this check
+    """
+    return values.str.match(get_format_re(date_format)).all()
+
+
+def detect_date_format(values):
+    """
+    returns the format of string `values` that parses a sample of them, or `None`. formats that share a sample
+    (eg: `%d/%m/%Y` and `%m/%d/%Y` when no day is past 12) are told apart by all the values, which are left as
+    strings if they still parse in more than one way
+    """
+    sample = values.iloc[:SAMPLE_SIZE]
+    if not sample.str.match(DATE_LIKE_RE).all():
+        return None
+    date_formats = [date_format for date_format in
+                    tuple(settings.TYPE_DETECTION_DATE_FORMATS) + tuple(settings.TYPE_DETECTION_DATETIME_FORMATS)
+                    if matches_format(sample, date_format) and parse_dates(sample, date_format).notnull().all()]
+    if len(date_formats) <= 1:
+        return date_formats[0] if date_formats else None
+    parsed = [(date_format, parse_dates(values, date_format)) for date_format in date_formats]
+    parsed = [(date_format, dates) for date_format, dates in parsed if is_parsed(dates)]
+    if not parsed:
+        return None
+    if any(not dates.equals(parsed[0][1]) for _, dates in parsed[1:]):
+        _LOG.info('column:%s is ambiguous between date formats %s, leaving it as strings', values.name,
+                  ', '.join(date_format for date_format, _ in parsed))
+        return None
+    return parsed[0][0]
+
+
+def coerce_date_strings(values):
+    """
+    returns `(json_type, format, timestamps)` for string `values`, or `(None, None, None)` if too few of them
+    are dates. the format is detected from `values` alone: it isn't shared across partitions, loaders parse them
+    with the format of the dataset's schema first (see `to_timestamps`)
+    """
+    date_format = detect_date_format(values)
+    if date_format is None:
+        return None, None, None
+    parsed = parse_dates(values, date_format)
+    if not is_parsed(parsed):
+        return None, None, None
+    return get_date_type(date_format), date_format, parsed
+
+
+def coerce_strings(values):
+    """
+    returns `(json_type, typed_values, format)` for null-free string `values`. values that don't parse are null
+    in `typed_values`
+    """
+    booleans = coerce_boolean_strings(values)
+    if booleans is not None:
+        return 'boolean', booleans, None
+    field_type, numbers = coerce_numeric_strings(values)
+    if field_type is not None:
+        return field_type, numbers, None
+    field_type, date_format, timestamps = coerce_date_strings(values)
+    if field_type is not None:
+        return field_type, timestamps, date_format
+    return 'string', values, None
+
+
+def get_string_mask(series):
+    if series.dtype != object:
+        return pd.Series(False, index=series.index)
+    return series.map(lambda v: isinstance(v, basestring))
+
+
+def to_integers(numbers):
+    """
+    integers with nulls are kept as python ints rather than turned into floats by NaNs
+    """
+    nulls = numbers.isnull()
+    if not nulls.any():
+        return numbers.astype('int64')
+    integers = pd.Series(numbers.fillna(0).astype('int64').values.astype(object), index=numbers.index)
+    integers[nulls] = None
+    return integers
+
+
+def to_booleans(series):
+    if series.dtype == bool:
+        return series
+    true_tokens, false_tokens = get_boolean_tokens()
+    booleans = pd.Series(None, index=series.index, dtype=object)
+    # actual booleans (and 0/1)
+    is_boolean = series.isin([True, False])
+    booleans[is_boolean] = series[is_boolean].astype(bool)
+    strings = get_string_mask(series)
+    if strings.any():
+        tokens = series[strings].str.strip().str.lower()
+        booleans[tokens[tokens.isin(true_tokens)].index] = True
+        booleans[tokens[tokens.isin(false_tokens)].index] = False
+    if booleans.notnull().all():
+        return booleans.astype(bool)
+    return booleans.where(booleans.notnull(), None)
+
+
+def to_timestamps(series, date_format=None):
+    if series.dtype.kind == 'M':
+        return series
+    if infer_dtype(series, skipna=True) in ('date', 'datetime', 'datetime64'):
+        return pd.to_datetime(series, errors='coerce')
+    strings = get_string_mask(series)
+    timestamps = pd.Series(pd.NaT, index=series.index)
+    if date_format is not None:
+        timestamps[strings] = parse_dates(series[strings], date_format)
+    # partitions can hold dates in another format than the one of the schema
+    unparsed = strings & timestamps.isnull() & (series != '')
+    if unparsed.any():
+        _, _, parsed = coerce_date_strings(series[unparsed])
+        if parsed is not None:
+            timestamps[unparsed] = parsed
+    return timestamps
+
+
+def to_dates(timestamps):
+    dates = pd.Series(timestamps.dt.date.values, index=timestamps.index)
+    return dates.where(timestamps.notnull(), None)
+
+
+def coerce_series(series, field_type, date_format=None):
+    """
+    converts `series` to `field_type`. values that don't convert are turned into nulls
+    """
+    if field_type in ('integer', 'number'):
+        if series.dtype.kind in 'iub':
+            return series
+        numbers = series if series.dtype.kind == 'f' else pd.to_numeric(series, errors='coerce')
+        if field_type == 'integer' and (numbers.dropna() % 1 == 0).all():
+            coerced = to_integers(numbers)
+        else:
+            coerced = numbers
+    elif field_type == 'boolean':
+        coerced = to_booleans(series)
+    elif field_type == 'date':
+        coerced = to_dates(to_timestamps(series, date_format))
+    elif field_type == 'datetime':
+        coerced = to_timestamps(series, date_format)
+    else:
+        return series
+    num_lost = int((coerced.isnull() & series.notnull() & (series != '')).sum())
+    if num_lost:
+        _LOG.warning('%s values of column:%s could not be converted to %s and are loaded as nulls',
+                     num_lost, series.name, field_type)
+    return coerced
+
+
+def get_coercions(schema):
+    """
+    returns the `(type, format)` of the columns of `schema` that are coerced before they are loaded
+    """
+    coercions = {}
+    for field, field_config in schema.get('properties', {}).items():
+        if field_config.get('type') in COERCED_TYPES:
+            coercions[field] = (field_config['type'], field_config.get('format'))
+    return coercions
+
+
+def coerce_dataframe(df_chunk, coercions):
+    """
+    converts the columns of `df_chunk` to the types of `coercions` (see `get_coercions`)
+    """
+    columns = dict((column, coerce_series(df_chunk[column], *coercions[column]))
+                   for column in df_chunk.columns if column in coercions)
+    if not columns:
+        return df_chunk
+    df_chunk = df_chunk.copy()
+    for column, values in columns.items():
+        df_chunk[column] = values
+    return df_chunk
+
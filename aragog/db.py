@@ -0,0 +1,96 @@
+import os
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from sqlalchemy import create_engine, event
+from sqlalchemy.engine.url import URL, make_url
+from sqlalchemy.pool import QueuePool
+
+_ENGINES = {}
+# sqlalchemy dialects of the django database backends
+DJANGO_DIALECTS = {
+    'django.db.backends.sqlite3': 'sqlite',
+    'django.db.backends.postgresql': 'postgresql',
+    'django.db.backends.postgresql_psycopg2': 'postgresql',
+    'django.db.backends.mysql': 'mysql',
+}
+
+
+def get_database_url():
+    """
+    returns the url of the database datasets are ingested into: `settings.INGEST_DATABASE_URL` or, by default,
+    the `settings.INGEST_DATABASE` alias of `settings.DATABASES` so that the admin reads the tables that are loaded
+    """
+    if settings.INGEST_DATABASE_URL:
+        return settings.INGEST_DATABASE_URL
+    database = settings.DATABASES.get(settings.INGEST_DATABASE)
+    if database is None:
+        raise ImproperlyConfigured('unknown INGEST_DATABASE:%s' % settings.INGEST_DATABASE)
+    return get_django_database_url(database)
+
+
+def get_django_database_url(database):
+    """
+    returns the sqlalchemy url of `database`, an entry of `settings.DATABASES`
+    """
+    dialect = DJANGO_DIALECTS.get(database['ENGINE'])
+    if dialect is None:
+        raise ImproperlyConfigured('no sqlalchemy dialect for database backend:%s' % database['ENGINE'])
+    if dialect == 'sqlite':
+        return 'sqlite:///%s' % database['NAME']
+    return str(URL(dialect, username=database.get('USER') or None, password=database.get('PASSWORD') or None,
+                   host=database.get('HOST') or None, port=database.get('PORT') or None,
+                   database=database['NAME']))
+
+
+def get_sqlite_pragmas(bulk=False):
+    # readers (eg: the admin) don't block the writers of a WAL database, which stays in WAL mode
+    pragmas = ['PRAGMA journal_mode = WAL']
+    if bulk:
+        # staging tables are written without syncing to the disk, through a large page cache and memory-mapped I/O
+        pragmas += ['PRAGMA synchronous = OFF',
+                    # negative sizes are in KiB
+                    'PRAGMA cache_size = -%d' % (settings.INGEST_SQLITE_CACHE_SIZE // 1024),
+                    'PRAGMA mmap_size = %d' % settings.INGEST_SQLITE_MMAP_SIZE]
+    return pragmas
+
+
+def get_engine_params(url, bulk=False):
+    params = {'pool_pre_ping': True}
+    if url.drivername.startswith('sqlite'):
+        # concurrent writers wait for the database lock instead of failing
+        params['connect_args'] = {'timeout': 600}
+        if url.database and url.database != ':memory:':
+            # sqlite file databases aren't pooled by default, which would run the pragmas on every checkout
+            params['connect_args']['check_same_thread'] = False
+            params['poolclass'] = QueuePool
+    elif url.drivername.startswith('postgresql') and bulk:
+        # a crash can lose the last commits of a load, which is then run again, but can't corrupt the database
+        params['connect_args'] = {'options': '-c synchronous_commit=off'}
+    if 'poolclass' in params or not url.drivername.startswith('sqlite'):
+        params.update(pool_size=settings.INGEST_DATABASE_POOL_SIZE,
+                      max_overflow=settings.INGEST_DATABASE_MAX_OVERFLOW)
+    return params
+
+
+def get_engine(db_url, bulk=False):
+    """
+    returns the pooled engine for `db_url` that is shared by the current process. engines (and their pooled
+    connections) must not be shared with forked dask workers. the connections of `bulk` engines are tuned for
+    loading staging tables, at the expense of durability
+    """
+    key = (os.getpid(), db_url, bulk)
+    if key not in _ENGINES:
+        url = make_url(db_url)
+        engine = create_engine(url, **get_engine_params(url, bulk))
+        if url.drivername.startswith('sqlite'):
+            pragmas = get_sqlite_pragmas(bulk)
+
+            @event.listens_for(engine, 'connect')
+            def set_pragmas(dbapi_connection, connection_record):
+                cursor = dbapi_connection.cursor()
+                for pragma in pragmas:
+                    cursor.execute(pragma)
+                cursor.close()
+        _ENGINES[key] = engine
+    return _ENGINES[key]
@@ -0,0 +1,91 @@
+from django.contrib import admin
+from django.core.exceptions import ImproperlyConfigured
+from django.core.paginator import Paginator
+from django.db import connections, router
+from django.utils.functional import cached_property
+
+COUNT_SOURCES = ('statistics', 'metadata')
+FAST_ADMIN_DEFAULTS = {
+    'count': 'statistics',
+    'keyset': True,
+    'keyset_after_page': 10,
+}
+KEYSET_ORDERINGS = (['pk'], ['-pk'], ['id'], ['-id'])
+
+
+def get_fast_admin_config(config):
+    """
+    `fast: true` under `admin:` uses the defaults, which can be overridden with a dict
+    """
+    if not isinstance(config, dict):
+        config = {}
+    config = dict(FAST_ADMIN_DEFAULTS, **config)
+    if config['count'] not in COUNT_SOURCES:
+        raise ImproperlyConfigured('unknown count source:%s, expected one of %s' % (config['count'], COUNT_SOURCES))
+    return config
+
+
+def get_approximate_count(model, source='statistics'):
+    """
+    `metadata` is the number of rows at ingest time. `statistics` is the planner's estimate on postgres, and
+    otherwise the largest id, which the loader assigns sequentially
+    """
+    if source == 'metadata':
+        return model.source_config['schema'].get('total', 0)
+
+    connection = connections[router.db_for_read(model)]
+    quote = connection.ops.quote_name
+    count = None
+    with connection.cursor() as cursor:
+        if connection.vendor == 'postgresql':
+            cursor.execute('SELECT reltuples::bigint FROM pg_class WHERE oid = %s::regclass', [model._meta.db_table])
+            row = cursor.fetchone()
+            # tables that were never analyzed have no estimate
+            count = row[0] if row and row[0] > 0 else None
+        if count is None:
+            cursor.execute('SELECT MAX(%s) FROM %s' % (quote(model._meta.pk.column), quote(model._meta.db_table)))
+            count = cursor.fetchone()[0]
+    return count or 0
+
+
+class FastPaginator(Paginator):
+    """
+    counts unfiltered changelists with `approximate_count` and, past `keyset_after_page`, seeks pages ordered by id
+    through the primary key index instead of making the database skip over `OFFSET` full rows
+    """
+    def __init__(self, object_list, per_page, orphans=0, allow_empty_first_page=True, approximate_count=None,
+                 keyset_after_page=None):
+        super(FastPaginator, self).__init__(object_list, per_page, orphans, allow_empty_first_page)
+        self.approximate_count = approximate_count
+        self.keyset_after_page = keyset_after_page
+
+    @cached_property
+    def count(self):
+        if self.approximate_count is not None and not self.object_list.query.has_filters():
+            return self.approximate_count()
+        return super(FastPaginator, self).count
+
+    def page(self, number):
+        number = self.validate_number(number)
+        ordering = list(self.object_list.query.order_by)
+        if self.keyset_after_page is None or number <= self.keyset_after_page or ordering not in KEYSET_ORDERINGS:
+            return super(FastPaginator, self).page(number)
+
+        offset = (number - 1) * self.per_page
+        boundary = list(self.object_list.values_list('pk', flat=True)[offset:offset + 1])
+        if not boundary:
+            return self._get_page([], number, self)
+        lookup = 'pk__lte' if ordering[0].startswith('-') else 'pk__gte'
+        return self._get_page(self.object_list.filter(**{lookup: boundary[0]})[:self.per_page], number, self)
+
+
+class FastModelAdmin(admin.ModelAdmin):
+    show_full_result_count = False
+    paginator = FastPaginator
+    fast_admin_config = FAST_ADMIN_DEFAULTS
+
+    def get_paginator(self, request, queryset, per_page, orphans=0, allow_empty_first_page=True):
+        config = self.fast_admin_config
+        return self.paginator(queryset, per_page, orphans, allow_empty_first_page,
+                              approximate_count=lambda: get_approximate_count(self.model, config['count']),
+                              keyset_after_page=config['keyset_after_page'] if config['keyset'] else None)
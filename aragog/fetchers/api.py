@@ -1,56 +1,140 @@
 import logging
+import math
+from multiprocessing.pool import ThreadPool
+try:
+    from urllib.parse import parse_qs, urlencode, urlparse, urlunparse
+except ImportError:
+    from urllib import urlencode
+    from urlparse import parse_qs, urlparse, urlunparse
 
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 
 from aragog.fetchers.base import Fetcher
 
 _LOG = logging.getLogger(__name__)
+# requests failing to connect, or with a gateway error, are retried with an exponential backoff
+MAX_RETRIES = 3
+RETRY_BACKOFF = 0.5
+RETRY_STATUSES = (502, 503, 504)
+
+
+def get_session(pool_size=1):
+    session = requests.Session()
+    # the last response is returned once retries are exhausted, for `raise_for_status` to raise
+    retries = Retry(total=MAX_RETRIES, backoff_factor=RETRY_BACKOFF, status_forcelist=RETRY_STATUSES,
+                    raise_on_status=False)
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=retries)
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    return session
+
+
+def set_query_param(url, **params):
+    parsed = urlparse(url)
+    query = parse_qs(parsed.query)
+    query.update((k, [str(v)]) for k, v in params.items())
+    return urlunparse(parsed._replace(query=urlencode(query, doseq=True)))
 
 
 class DRFFetcher(Fetcher):
-    def __init__(self, url, credentials=None):
+    """
+    Fetches every page of a DRF list endpoint. With `concurrency > 1`, the urls of the remaining pages are
+    worked out from the first one (page number or limit/offset pagination) and fetched by a pool of threads
+    sharing a keep-alive session. Records are still returned in order
+    """
+    def __init__(self, url, credentials=None, concurrency=1, cache=None, metrics=None, fields=None):
         self.credentials = credentials
+        self.concurrency = concurrency
+        self.session = get_session(concurrency)
         self.total = None
         self.next_url = url
         self.current_iterable = None
-        super(DRFFetcher, self).__init__(url)
+        self.pool = None
+        self.pages = None
+        self.num_pending_pages = 0
+        super(DRFFetcher, self).__init__(url, cache=cache, metrics=metrics, fields=fields)
+
+    def request(self, url, headers=None):
+        _LOG.info('fetching url:[%s]', url)
+        return self.session.get(url, auth=self.credentials, headers=headers)
+
+    def get_page_urls(self, data):
+        """
+        returns the urls of all pages after the first one, or `None` if they can't be predicted
+        """
+        if not data.get('next'):
+            return []
+        page_size = len(data['results'])
+        if not page_size:
+            return None
+        query = parse_qs(urlparse(data['next']).query)
+        if 'page' in query:
+            num_pages = int(math.ceil(data['count'] / float(page_size)))
+            return [set_query_param(data['next'], page=page)
+                    for page in range(int(query['page'][0]), num_pages + 1)]
+        elif 'offset' in query:
+            limit = int(query.get('limit', [page_size])[0])
+            return [set_query_param(data['next'], offset=offset, limit=limit)
+                    for offset in range(int(query['offset'][0]), data['count'], limit)]
+        return None
+
+    def start_concurrent_fetch(self, urls):
+        self.next_url = None
+        self.num_pending_pages = len(urls)
+        self.pool = ThreadPool(self.concurrency)
+        # imap yields pages in the order of `urls` regardless of the order in which they complete
+        self.pages = self.pool.imap(self.get_json, urls)
 
     def get_next_data(self):
-        _LOG.info('fetching url:[%s]', self.next_url)
-        response = requests.get(self.next_url, auth=self.credentials)
-        response.raise_for_status()
-        data = response.json()
-        self.next_url = data.get('next')
+        if self.pages is not None:
+            data = next(self.pages)
+            self.num_pending_pages -= 1
+            if not self.num_pending_pages:
+                self.pool.close()
+        else:
+            data = self.get_json(self.next_url)
+            self.next_url = data.get('next')
         if self.total is None:
             self.total = data['count']
-        return iter(data['results'])
+            if self.concurrency > 1:
+                urls = self.get_page_urls(data)
+                if urls is not None:
+                    self.start_concurrent_fetch(urls)
+        return iter(self.project(data['results']))
+
+    def has_next_page(self):
+        return bool(self.next_url) or self.num_pending_pages > 0
 
     def next(self):
         if self.current_iterable is None:
             self.current_iterable = self.get_next_data()
-        try:
-            return next(self.current_iterable)
-        except StopIteration as ex:
-            if self.next_url:
-                self.current_iterable = self.get_next_data()
+        while True:
+            try:
                 return next(self.current_iterable)
-            else:
-                raise ex
+            except StopIteration:
+                if not self.has_next_page():
+                    raise
+                self.current_iterable = self.get_next_data()
 
 
 class GenericAPIFetcher(Fetcher):
-    def __init__(self, url, credentials=None):
+    def __init__(self, url, credentials=None, cache=None, metrics=None, fields=None):
         self.credentials = credentials
         self.url = url
         self.iterable = None
-        super(GenericAPIFetcher, self).__init__(url)
+        self.session = get_session()
+        super(GenericAPIFetcher, self).__init__(url, cache=cache, metrics=metrics, fields=fields)
+
+    def request(self, url, headers=None):
+        _LOG.info('fetching url:[%s]', url)
+        return self.session.get(url, auth=self.credentials, headers=headers)
 
     def __iter__(self):
-        _LOG.info('fetching url:[%s]', self.url)
-        response = requests.get(self.url, auth=self.credentials)
-        response.raise_for_status()
-        data = response.json()
-        self.iterable = iter(data)
+        # consumers like itertools.islice call iter() again on the fetcher, which mustn't fetch the data again
+        if self.iterable is None:
+            self.iterable = iter(self.project(self.get_json(self.url)))
         return self
 
     def next(self):
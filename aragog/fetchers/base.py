@@ -1,9 +1,52 @@
+import json
+import time
+
+
 class Fetcher(object):
-    def __init__(self, url):
+    def __init__(self, url, cache=None, metrics=None, fields=None):
         self.url = url
+        self.cache = cache
+        self.metrics = metrics
+        # keys kept in the records, all of them when `None`
+        self.fields = fields
 
     def __iter__(self):
         return self
 
     def next(self):
         pass
+
+    def request(self, url, headers=None):
+        raise NotImplementedError
+
+    def project(self, records):
+        """
+        drops the keys of `records` that aren't in `fields` as soon as they are decoded
+        """
+        if self.fields is None:
+            return records
+        return [dict((k, record[k]) for k in self.fields if k in record) for record in records]
+
+    def send(self, url, headers=None):
+        """
+        `request`, recording its latency, retries and size in `metrics`
+        """
+        start = time.time()
+        response = self.request(url, headers)
+        if self.metrics is not None:
+            # urllib3 keeps the retries of a request on its response
+            retries = getattr(response.raw, 'retries', None)
+            self.metrics.record_request(time.time() - start, len(retries.history) if retries else 0,
+                                        len(response.content))
+        return response
+
+    def get_json(self, url):
+        """
+        fetches `url` through the response cache, if there is one
+        """
+        if self.cache is None:
+            response = self.send(url)
+            response.raise_for_status()
+            return response.json()
+        body = self.cache.get(url, self.send, getattr(self, 'credentials', None))
+        return json.loads(body.decode('utf-8'))
@@ -0,0 +1,133 @@
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+
+_LOG = logging.getLogger(__name__)
+
+
+class CacheMiss(Exception):
+    pass
+
+
+class ResponseCache(object):
+    """
+    On-disk cache of raw response bodies keyed by url. Entries older than `ttl` seconds are revalidated
+    with `If-None-Match`/`If-Modified-Since`, and the least recently used ones are evicted once the cache
+    grows past `max_size` bytes. In `offline` mode, responses are only ever replayed from the cache
+    """
+    def __init__(self, cache_dir, ttl=0, max_size=None, offline=False):
+        self.cache_dir = cache_dir
+        self.ttl = ttl
+        self.max_size = max_size
+        self.offline = offline
+        self.lock = threading.Lock()
+        if not os.path.isdir(cache_dir):
+            os.makedirs(cache_dir)
+        self.size = sum(entry['size'] for entry in self.get_entries())
+
+    def get_key(self, url, credentials=None):
+        user = credentials[0] if credentials else ''
+        return hashlib.sha1(('%s|%s' % (user, url)).encode('utf-8')).hexdigest()
+
+    def get_paths(self, key):
+        path = os.path.join(self.cache_dir, key)
+        return path + '.body', path + '.json'
+
+    def get_entries(self):
+        for filename in os.listdir(self.cache_dir):
+            if filename.endswith('.json'):
+                entry = self.read_entry(filename[:-len('.json')])
+                if entry is not None:
+                    yield entry
+
+    def read_entry(self, key):
+        _, meta_path = self.get_paths(key)
+        try:
+            with open(meta_path) as meta_file:
+                return json.load(meta_file)
+        except (IOError, OSError, ValueError):
+            return None
+
+    def read_body(self, entry):
+        body_path, meta_path = self.get_paths(entry['key'])
+        with open(body_path, 'rb') as body_file:
+            body = body_file.read()
+        # the modification time of the metadata file doubles as the last access time for eviction
+        os.utime(meta_path, None)
+        return body
+
+    def write_entry(self, entry, body=None):
+        body_path, meta_path = self.get_paths(entry['key'])
+        if body is not None:
+            with open(body_path, 'wb') as body_file:
+                body_file.write(body)
+        with open(meta_path, 'w') as meta_file:
+            json.dump(entry, meta_file)
+
+    def remove_entry(self, entry):
+        for path in self.get_paths(entry['key']):
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+    def is_fresh(self, entry):
+        return time.time() - entry['fetched_at'] < self.ttl
+
+    def store(self, key, url, response):
+        body = response.content
+        entry = {
+            'key': key,
+            'url': url,
+            'etag': response.headers.get('ETag'),
+            'last_modified': response.headers.get('Last-Modified'),
+            'fetched_at': time.time(),
+            'size': len(body),
+        }
+        with self.lock:
+            old_entry = self.read_entry(key)
+            self.write_entry(entry, body)
+            self.size += entry['size'] - (old_entry['size'] if old_entry else 0)
+            if self.max_size is not None and self.size > self.max_size:
+                self.evict()
+        return body
+
+    def evict(self):
+        entries = sorted(self.get_entries(),
+                         key=lambda entry: os.path.getmtime(self.get_paths(entry['key'])[1]))
+        target_size = self.max_size * 0.9
+        for entry in entries:
+            if self.size <= target_size:
+                break
+            self.remove_entry(entry)
+            self.size -= entry['size']
+            _LOG.info('evicted url:[%s] from the response cache', entry['url'])
+
+    def get(self, url, request, credentials=None):
+        """
+        returns the body for `url`, calling `request(url, headers)` if it needs to be fetched or revalidated
+        """
+        key = self.get_key(url, credentials)
+        entry = self.read_entry(key)
+        if entry is not None and (self.offline or self.is_fresh(entry)):
+            return self.read_body(entry)
+        if self.offline:
+            raise CacheMiss('url:[%s] is not cached' % url)
+
+        headers = {}
+        if entry is not None:
+            if entry['etag']:
+                headers['If-None-Match'] = entry['etag']
+            if entry['last_modified']:
+                headers['If-Modified-Since'] = entry['last_modified']
+        response = request(url, headers)
+        if response.status_code == 304 and entry is not None:
+            _LOG.info('url:[%s] not modified', url)
+            entry['fetched_at'] = time.time()
+            self.write_entry(entry)
+            return self.read_body(entry)
+        response.raise_for_status()
+        return self.store(key, url, response)
@@ -0,0 +1,173 @@
+import copy
+import logging
+import threading
+import time
+import traceback
+try:
+    from urllib.parse import urlparse
+except ImportError:
+    from urlparse import urlparse
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+
+_LOG = logging.getLogger(__name__)
+SUCCEEDED = 'succeeded'
+FAILED = 'failed'
+# not run because a dataset it depends on failed
+SKIPPED = 'skipped'
+# keys of a dataset's config that a `multi` dataset referencing it by name uses as its source
+SOURCE_KEYS = ('name', 'type', 'params')
+
+
+def resolve_source_references(configs):
+    """
+    replaces the sources of `multi` datasets that are given as the name of another dataset with its config
+    """
+    by_name = dict((config['name'], config) for config in configs)
+
+    def resolve(config, path):
+        if config.get('type') != 'multi':
+            return config
+        config = copy.deepcopy(config)
+        sources = []
+        for source in config['params']['sources']:
+            if not isinstance(source, dict):
+                if source not in by_name:
+                    raise ImproperlyConfigured('%s references unknown dataset:%s' % (config['name'], source))
+                if source in path:
+                    raise ImproperlyConfigured('circular dataset references:%s' % ' -> '.join(path + (source,)))
+                source = resolve(dict((k, v) for k, v in by_name[source].items() if k in SOURCE_KEYS),
+                                 path + (source,))
+            sources.append(source)
+        config['params']['sources'] = sources
+        return config
+
+    return [resolve(config, (config['name'],)) for config in configs]
+
+
+def get_dependencies(config, names):
+    """
+    returns the datasets among `names` that `config` reads from: those of the sources of `multi` datasets
+    """
+    if config.get('type') != 'multi':
+        return set()
+    dependencies = set()
+    for source in config['params']['sources']:
+        if source.get('name') in names and source['name'] != config['name']:
+            dependencies.add(source['name'])
+        dependencies |= get_dependencies(source, names)
+    return dependencies
+
+
+def get_hosts(config):
+    """
+    returns the hosts of the APIs a dataset is fetched from
+    """
+    params = config.get('params', {})
+    if config.get('type') == 'multi':
+        return set().union(*[get_hosts(source) for source in params['sources']])
+    if 'url' in params:
+        return set([urlparse(params['url']).netloc])
+    return set()
+
+
+class DatasetScheduler(object):
+    """
+    Ingests datasets concurrently, up to `concurrency` at a time and `host_concurrency` per API host, and every
+    dataset only once all the datasets it depends on have succeeded
+    """
+    def __init__(self, configs, concurrency=None, host_concurrency=None):
+        self.configs = configs
+        self.concurrency = concurrency or settings.INGEST_CONCURRENCY
+        self.host_concurrency = host_concurrency or settings.INGEST_HOST_CONCURRENCY
+        names = set(config['name'] for config in configs)
+        self.dependencies = dict((config['name'], get_dependencies(config, names)) for config in configs)
+        self.hosts = dict((config['name'], get_hosts(config)) for config in configs)
+        self.check_cycles()
+        self.condition = threading.Condition()
+
+    def check_cycles(self):
+        visited = set()
+
+        def visit(name, path):
+            if name in path:
+                raise ImproperlyConfigured('circular dataset dependencies:%s' % ' -> '.join(path + (name,)))
+            if name in visited:
+                return
+            for dependency in sorted(self.dependencies[name]):
+                visit(dependency, path + (name,))
+            visited.add(name)
+
+        for config in self.configs:
+            visit(config['name'], ())
+
+    def get_startable(self, results, running, host_counts):
+        """
+        returns the first dataset (in config order) whose dependencies succeeded and whose hosts have a free slot
+        """
+        for config in self.configs:
+            name = config['name']
+            if name in results or name in running:
+                continue
+            if not all(results.get(dependency) == SUCCEEDED for dependency in self.dependencies[name]):
+                continue
+            if all(host_counts.get(host, 0) < self.host_concurrency for host in self.hosts[name]):
+                return config
+        return None
+
+    def skip_dependents(self, results):
+        skipped = True
+        while skipped:
+            skipped = False
+            for config in self.configs:
+                name = config['name']
+                if name not in results and any(results.get(dependency) in (FAILED, SKIPPED)
+                                               for dependency in self.dependencies[name]):
+                    _LOG.warning('skipping dataset:%s, a dataset it depends on failed', name)
+                    results[name] = SKIPPED
+                    skipped = True
+
+    def run(self, ingest):
+        """
+        calls `ingest` with the config of every dataset, which fails if it raises or returns `False`. returns
+        the outcome (succeeded, failed or skipped) of every dataset, by name
+        """
+        results = {}
+        running = set()
+        host_counts = {}
+
+        def run_one(config):
+            name = config['name']
+            start = time.time()
+            try:
+                succeeded = ingest(config) is not False
+            except Exception:
+                _LOG.error('ingesting dataset:%s failed\n%s', name, traceback.format_exc())
+                succeeded = False
+            _LOG.info('%s dataset:%s in %.2fs', 'ingested' if succeeded else 'failed to ingest', name,
+                      time.time() - start)
+            with self.condition:
+                running.remove(name)
+                for host in self.hosts[name]:
+                    host_counts[host] -= 1
+                results[name] = SUCCEEDED if succeeded else FAILED
+                self.skip_dependents(results)
+                self.condition.notify()
+
+        with self.condition:
+            while len(results) < len(self.configs):
+                config = None
+                if len(running) < self.concurrency:
+                    config = self.get_startable(results, running, host_counts)
+                if config is None:
+                    # with a timeout, so that the wait can be interrupted
+                    self.condition.wait(1)
+                    continue
+                running.add(config['name'])
+                for host in self.hosts[config['name']]:
+                    host_counts[host] = host_counts.get(host, 0) + 1
+                thread = threading.Thread(target=run_one, args=(config,), name='ingest-%s' % config['name'])
+                thread.daemon = True
+                thread.start()
+        return results
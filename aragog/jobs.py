@@ -0,0 +1,103 @@
+import datetime
+
+from sqlalchemy import (Boolean, Column, DateTime, Float, Integer, MetaData, String, Table, Text, and_, func,
+                        select)
+
+PENDING = 'pending'
+LOADING = 'loading'
+READY = 'ready'
+FAILED = 'failed'
+
+metadata = MetaData()
+ingest_jobs = Table(
+    'aragog_ingest_jobs', metadata,
+    Column('id', Integer, primary_key=True),
+    Column('name', String(255), nullable=False, index=True),
+    Column('full', Boolean, nullable=False, default=False),
+    Column('status', String(16), nullable=False),
+    # percent
+    Column('progress', Float, nullable=False, default=0),
+    Column('worker', String(255), nullable=True),
+    Column('error', Text, nullable=True),
+    Column('created_at', DateTime, nullable=False),
+    Column('started_at', DateTime, nullable=True),
+    Column('finished_at', DateTime, nullable=True),
+)
+
+
+class JobQueue(object):
+    """
+    Ingestion jobs, queued by the web process (or `ingest --enqueue`) and run by `ingest_worker` processes.
+    the latest job of a dataset holds its status
+    """
+    table = ingest_jobs
+
+    def __init__(self, engine):
+        self.engine = engine
+        self.table.create(engine, checkfirst=True)
+
+    def update(self, job_id, **values):
+        with self.engine.begin() as conn:
+            conn.execute(self.table.update().where(self.table.c.id == job_id).values(**values))
+
+    def enqueue(self, name, full=False):
+        """
+        returns the id of the new job, or of the job of `name` that is already pending or loading
+        """
+        active = self.table.c.status.in_([PENDING, LOADING])
+        with self.engine.begin() as conn:
+            row = conn.execute(select([self.table.c.id]).where(and_(self.table.c.name == name, active))).fetchone()
+            if row is not None:
+                return row['id']
+            result = conn.execute(self.table.insert(), {
+                'name': name,
+                'full': full,
+                'status': PENDING,
+                'progress': 0,
+                'created_at': datetime.datetime.utcnow(),
+            })
+            return result.inserted_primary_key[0]
+
+    def claim(self, worker, name=None):
+        """
+        marks the oldest pending job (of `name` if set) as loading by `worker` and returns it, or `None` if there is
+        none. a job can only be claimed by one worker
+        """
+        pending = select([self.table.c.id]).where(self.table.c.status == PENDING).order_by(self.table.c.id)
+        if name is not None:
+            pending = pending.where(self.table.c.name == name)
+        while True:
+            with self.engine.connect() as conn:
+                row = conn.execute(pending.limit(1)).fetchone()
+            if row is None:
+                return None
+            with self.engine.begin() as conn:
+                claimed = conn.execute(
+                    self.table.update()
+                    .where(and_(self.table.c.id == row['id'], self.table.c.status == PENDING))
+                    .values(status=LOADING, worker=worker, started_at=datetime.datetime.utcnow())).rowcount
+            if claimed:
+                return self.get(row['id'])
+
+    def get(self, job_id):
+        with self.engine.connect() as conn:
+            row = conn.execute(self.table.select().where(self.table.c.id == job_id)).fetchone()
+        return dict(row) if row is not None else None
+
+    def set_progress(self, job_id, progress):
+        self.update(job_id, progress=progress)
+
+    def finish(self, job_id):
+        self.update(job_id, status=READY, progress=100, finished_at=datetime.datetime.utcnow())
+
+    def fail(self, job_id, error):
+        self.update(job_id, status=FAILED, error=error, finished_at=datetime.datetime.utcnow())
+
+    def get_latest(self):
+        """
+        returns the latest job of every dataset, by name
+        """
+        latest = select([func.max(self.table.c.id)]).group_by(self.table.c.name)
+        with self.engine.connect() as conn:
+            rows = conn.execute(self.table.select().where(self.table.c.id.in_(latest))).fetchall()
+        return dict((row['name'], dict(row)) for row in rows)
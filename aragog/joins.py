@@ -0,0 +1,115 @@
+import logging
+from multiprocessing.pool import ThreadPool
+
+import dask
+import dask.dataframe as dd
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+
+_LOG = logging.getLogger(__name__)
+JOIN_HOWS = ('inner', 'left', 'right', 'outer')
+# joins that keep every row of the left side can broadcast the right side to every left partition
+BROADCAST_HOWS = ('inner', 'left')
+
+
+def get_join_config(join_params):
+    if True in join_params and 'on' not in join_params:
+        # yaml 1.1 reads an unquoted `on` key as `true`
+        join_params = dict([(k, v) for k, v in join_params.items() if k is not True], on=join_params[True])
+    if 'on' not in join_params:
+        raise ImproperlyConfigured('join_params is missing `on`')
+    config = dict({
+        'how': 'inner',
+        'sorted': False,
+        'broadcast_threshold': settings.JOIN_BROADCAST_THRESHOLD,
+        'concurrency': None,
+    }, **join_params)
+    if config['how'] not in JOIN_HOWS:
+        raise ImproperlyConfigured('unknown join how:%s, expected one of %s' % (config['how'], JOIN_HOWS))
+    config['on'] = config['on'] if isinstance(config['on'], list) else [config['on']]
+    return config
+
+
+def build_data_frames(sources, concurrency=None):
+    """
+    builds the dataframe of every source in its own thread, so that API sources are fetched at the same time
+    """
+    pool = ThreadPool(concurrency or len(sources))
+    try:
+        return pool.map(lambda source: source.get_data_frame(), sources)
+    finally:
+        pool.close()
+
+
+def get_broadcast_frame(df, threshold):
+    """
+    returns `df` as a pandas dataframe if it takes less than `threshold` bytes in memory (extrapolated from its
+    first partition), `None` otherwise
+    """
+    first = df.get_partition(0).compute()
+    # an empty first partition says nothing about the size of the others
+    if df.npartitions > 1 and not len(first):
+        return None
+    if first.memory_usage(deep=True).sum() * df.npartitions > threshold:
+        return None
+    return first if df.npartitions == 1 else df.compute()
+
+
+def get_sorted_divisions(df, column):
+    """
+    returns the divisions of `df` indexed by `column` if its partitions hold increasing ranges of it that don't
+    overlap, `None` otherwise
+    """
+    get_bounds = dask.delayed(lambda s: (s.min(), s.max()) if len(s) else (None, None))
+    bounds = dask.compute(*[get_bounds(part) for part in df[column].to_delayed()])
+    mins, maxes = [b[0] for b in bounds], [b[1] for b in bounds]
+    if None in mins or any(maxes[i] >= mins[i + 1] for i in range(len(bounds) - 1)):
+        return None
+    return tuple(mins) + (maxes[-1],)
+
+
+def index_by(df, column, sorted=False):
+    """
+    sources that are already indexed by `column` with known divisions aren't sorted again, and `sorted` ones only
+    need a pass to find their divisions instead of a full shuffle
+    """
+    if df.index.name == column and df.known_divisions:
+        return df
+    if sorted:
+        divisions = get_sorted_divisions(df, column)
+        if divisions is not None:
+            return df.set_index(column, sorted=True, divisions=divisions)
+        _LOG.warning('partitions overlap on %s, sorting them', column)
+    return df.set_index(column)
+
+
+def join_data_frames(dfs, on, how='inner', sorted=False, broadcast_threshold=None):
+    """
+    joins `dfs` from left to right on the `on` columns:
+    - sources smaller than `broadcast_threshold` bytes are joined in a single partition against every partition
+      of the other side, which isn't shuffled
+    - otherwise single column keys are joined on the index, so that sources are sorted at most once and then
+      aligned by their divisions, while multi column keys are hash joined
+    """
+    df = dfs[0]
+    for right in dfs[1:]:
+        small = None
+        if broadcast_threshold and how in BROADCAST_HOWS:
+            small = get_broadcast_frame(right, broadcast_threshold)
+        if small is not None:
+            _LOG.info('broadcasting join source of %s rows', len(small))
+            if len(on) == 1 and df.index.name == on[0]:
+                right = dd.from_pandas(small.set_index(on[0]), npartitions=1)
+                df = df.merge(right, left_index=True, right_index=True, how=how)
+            else:
+                df = df.merge(dd.from_pandas(small, npartitions=1), on=on, how=how)
+        elif len(on) == 1:
+            df = index_by(df, on[0], sorted).merge(index_by(right, on[0], sorted),
+                                                   left_index=True, right_index=True, how=how)
+        else:
+            if df.index.name in on:
+                df = df.reset_index()
+            df = df.merge(right, on=on, how=how)
+    if df.index.name in on:
+        df = df.reset_index()
+    return df
@@ -0,0 +1,172 @@
+import logging
+import time
+
+import dask
+from django.conf import settings
+from sqlalchemy import BigInteger, Column, MetaData, Table
+
+from aragog.coercion import coerce_dataframe
+from aragog.db import get_engine
+from aragog.progress import IngestProgress
+from aragog.type_detection import get_schema_for_dataframe
+from aragog.utils import psql_insert_copy, write_to_db
+
+_LOG = logging.getLogger(__name__)
+# the default insert method runs one `executemany` per chunk, and all chunks of a partition share a transaction
+INSERT_METHODS = {
+    'postgresql': psql_insert_copy,
+}
+STAGING_SUFFIX = '__staging'
+
+
+def get_id_offsets(lengths):
+    offsets = []
+    offset = 0
+    for length in lengths:
+        offsets.append(offset)
+        offset += length
+    return offsets
+
+
+class BulkLoader(object):
+    """
+    Loads a dask dataframe into `table_name`. Partitions are appended in parallel to a staging table that is
+    created once from the inferred schema, and which then replaces the live table in a single transaction.
+    Only `db_url` is shipped to the dask workers, which connect through an engine of their own. The staging table
+    is written through a bulk engine (see `aragog.db.get_engine`) and, on PostgreSQL, isn't logged. Partitions are
+    converted to the types of `coercions` (see `aragog.coercion.get_coercions`) by the task writing them
+    """
+    def __init__(self, db_url, table_name, sqla_schema, chunksize=50000, coercions=None):
+        self.db_url = db_url
+        self.table_name = table_name
+        self.sqla_schema = sqla_schema
+        self.chunksize = chunksize
+        self.coercions = coercions
+
+    @property
+    def engine(self):
+        return get_engine(self.db_url)
+
+    @property
+    def bulk_engine(self):
+        return get_engine(self.db_url, bulk=True)
+
+    @property
+    def unlogged_staging(self):
+        return self.engine.dialect.name == 'postgresql' and settings.INGEST_POSTGRES_UNLOGGED_STAGING
+
+    @property
+    def staging_table_name(self):
+        return self.table_name + STAGING_SUFFIX
+
+    @property
+    def insert_method(self):
+        return INSERT_METHODS.get(self.engine.dialect.name)
+
+    def quote(self, name):
+        return self.engine.dialect.identifier_preparer.quote(name)
+
+    def get_table(self, name, prefixes=()):
+        columns = [Column('id', BigInteger, primary_key=True, autoincrement=False)]
+        for field_name, field_class in self.sqla_schema.items():
+            columns.append(Column(field_name, field_class()))
+        return Table(name, MetaData(), *columns, prefixes=list(prefixes))
+
+    def create_staging_table(self):
+        table = self.get_table(self.staging_table_name, prefixes=['UNLOGGED'] if self.unlogged_staging else [])
+        table.drop(self.bulk_engine, checkfirst=True)
+        table.create(self.bulk_engine)
+
+    def write_partition(self, df_chunk, id_offset, profile=False):
+        if self.coercions:
+            df_chunk = coerce_dataframe(df_chunk, self.coercions)
+        write_to_db(df_chunk, self.staging_table_name, id_offset=id_offset, con=self.bulk_engine,
+                    method=self.insert_method, chunksize=self.chunksize)
+        if profile:
+            return get_schema_for_dataframe(df_chunk)
+        return len(df_chunk)
+
+    def swap(self):
+        with self.engine.begin() as conn:
+            if self.unlogged_staging:
+                # the live table has to survive a crash
+                conn.execute('ALTER TABLE %s SET LOGGED' % self.quote(self.staging_table_name))
+            conn.execute('DROP TABLE IF EXISTS %s' % self.quote(self.table_name))
+            conn.execute('ALTER TABLE %s RENAME TO %s' % (self.quote(self.staging_table_name),
+                                                           self.quote(self.table_name)))
+
+    def merge_staging(self, primary_key):
+        """
+        upserts the staging table into the live table on `primary_key`. updated rows keep their id
+        """
+        names = {
+            'live': self.quote(self.table_name),
+            'staging': self.quote(self.staging_table_name),
+            'pk': self.quote(primary_key),
+            'index': self.quote('%s_%s_upsert' % (self.table_name, primary_key)),
+            'columns': ', '.join(self.quote(c) for c in ['id'] + list(self.sqla_schema.keys())),
+        }
+        with self.engine.begin() as conn:
+            conn.execute('CREATE INDEX IF NOT EXISTS %(index)s ON %(live)s (%(pk)s)' % names)
+            # only the last version of a row in the delta is kept
+            conn.execute('DELETE FROM %(staging)s WHERE id NOT IN '
+                         '(SELECT MAX(id) FROM %(staging)s GROUP BY %(pk)s)' % names)
+            conn.execute('UPDATE %(staging)s SET id = (SELECT %(live)s.id FROM %(live)s '
+                         'WHERE %(live)s.%(pk)s = %(staging)s.%(pk)s) '
+                         'WHERE %(pk)s IN (SELECT %(pk)s FROM %(live)s)' % names)
+            conn.execute('DELETE FROM %(live)s WHERE %(pk)s IN (SELECT %(pk)s FROM %(staging)s)' % names)
+            conn.execute('INSERT INTO %(live)s (%(columns)s) SELECT %(columns)s FROM %(staging)s' % names)
+            conn.execute('DROP TABLE %(staging)s' % names)
+
+    def create_indexes(self, indexes):
+        """
+        creates the missing indexes among `indexes`, a list of `(name, columns)` tuples. this is much faster once
+        the table is loaded than maintaining the indexes while rows are being inserted
+        """
+        start = time.time()
+        with self.engine.begin() as conn:
+            for name, columns in indexes:
+                conn.execute('CREATE INDEX IF NOT EXISTS %s ON %s (%s)' % (
+                    self.quote(name), self.quote(self.table_name), ', '.join(self.quote(c) for c in columns)))
+        _LOG.info('checked %s indexes of table:%s in %.2fs', len(indexes), self.table_name, time.time() - start)
+
+    def get_max_id(self):
+        with self.engine.connect() as conn:
+            return conn.execute('SELECT MAX(id) FROM %s' % self.quote(self.table_name)).scalar() or 0
+
+    def write_staging(self, df, id_start=0, profile=False, progress=None):
+        progress = progress or IngestProgress()
+        with progress.stage('count'):
+            lengths = df.map_partitions(len).compute()
+        self.create_staging_table()
+        id_offsets = [id_start + id_offset for id_offset in get_id_offsets(lengths)]
+        partitions = [dask.delayed(self.write_partition)(partition, id_offset, profile)
+                      for partition, id_offset in zip(df.to_delayed(), id_offsets)]
+        with progress.stage('load'):
+            results = dask.compute(*partitions)
+        return sum(lengths), list(results) if profile else None
+
+    def log_throughput(self, action, num_rows, start):
+        elapsed = time.time() - start
+        _LOG.info('%s %s rows into table:%s in %.2fs (%.0f rows/sec)',
+                  action, num_rows, self.table_name, elapsed, num_rows / elapsed if elapsed else 0)
+
+    def load(self, df, profile=False, progress=None):
+        """
+        returns the number of rows loaded, along with the schema of every partition if `profile` is set
+        """
+        start = time.time()
+        num_rows, schemas = self.write_staging(df, profile=profile, progress=progress)
+        self.swap()
+        self.log_throughput('loaded', num_rows, start)
+        return num_rows, schemas
+
+    def upsert(self, df, primary_key, profile=False, progress=None):
+        """
+        like `load`, but merges `df` into the existing table instead of replacing it
+        """
+        start = time.time()
+        num_rows, schemas = self.write_staging(df, id_start=self.get_max_id(), profile=profile, progress=progress)
+        self.merge_staging(primary_key)
+        self.log_throughput('upserted', num_rows, start)
+        return num_rows, schemas
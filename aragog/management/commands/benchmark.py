@@ -0,0 +1,58 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+
+from aragog.benchmarks.pipeline import SOURCES, find_regressions, run
+
+
+def parse_type_mix(value):
+    """
+    `int:3,string:2` -> {'int': 3, 'string': 2}
+    """
+    type_mix = {}
+    for item in value.split(','):
+        column_type, _, weight = item.partition(':')
+        type_mix[column_type] = float(weight or 1)
+    return type_mix
+
+
+class Command(BaseCommand):
+    help = 'Time every stage of the ingest pipeline on synthetic datasets, optionally against a baseline'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sources', nargs='+', choices=SOURCES, default=list(SOURCES))
+        parser.add_argument('--rows', type=int, default=100000)
+        parser.add_argument('--columns', type=int, default=10)
+        parser.add_argument('--type-mix', type=parse_type_mix, default=None,
+                            help='weights of the column types, eg: int:3,float:1,string:2,bool:1,date:1,datetime:1')
+        parser.add_argument('--null-rate', type=float, default=0.1)
+        parser.add_argument('--cardinality', type=int, default=None,
+                            help='number of distinct values per column (default: one per row)')
+        parser.add_argument('--files', type=int, default=4, help='number of files of the CSV and JSON datasets')
+        parser.add_argument('--page-size', type=int, default=1000, help='page size of the stub DRF API')
+        parser.add_argument('--repeat', type=int, default=1, help='keep the best timings of this many runs')
+        parser.add_argument('--db-url', default=None, help='database to load into (default: a temporary sqlite one)')
+        parser.add_argument('--output', default=None, help='file the results are written to as JSON')
+        parser.add_argument('--baseline', default=None, help='results of a previous run to compare with')
+        parser.add_argument('--threshold', type=float, default=0.25,
+                            help='fail if a stage takes this much longer (as a fraction) than in the baseline')
+
+    def handle(self, *args, **options):
+        results = run(sources=options['sources'], num_rows=options['rows'], num_columns=options['columns'],
+                      type_mix=options['type_mix'], null_rate=options['null_rate'],
+                      cardinality=options['cardinality'], num_files=options['files'],
+                      page_size=options['page_size'], repeat=options['repeat'], db_url=options['db_url'])
+        for result in results['results']:
+            stages = ' '.join('%s:%.3fs' % item for item in result['stages'].items())
+            self.stdout.write('%s total:%.3fs %s' % (result['source'], result['total'], stages))
+        if options['output']:
+            with open(options['output'], 'w') as output_file:
+                json.dump(results, output_file, indent=2)
+        if options['baseline']:
+            with open(options['baseline']) as baseline_file:
+                baseline = json.load(baseline_file)
+            regressions = find_regressions(results, baseline, threshold=options['threshold'])
+            for regression in regressions:
+                self.stderr.write('%(source)s %(stage)s regressed: %(baseline).3fs -> %(seconds).3fs' % regression)
+            if regressions:
+                raise CommandError('%s stage(s) regressed past the threshold' % len(regressions))
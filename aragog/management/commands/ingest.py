@@ -0,0 +1,52 @@
+import os
+import socket
+
+from django.core.management.base import BaseCommand, CommandError
+
+from aragog.ingest_scheduler import SUCCEEDED
+from aragog.models import get_job_queue, get_package_configs, run_ingest_jobs
+
+
+class Command(BaseCommand):
+    help = 'Re-ingest datasets from settings.PACKAGES_FILE and refresh their schema registry entries'
+
+    def add_arguments(self, parser):
+        parser.add_argument('names', nargs='*', help='datasets to ingest (defaults to all)')
+        parser.add_argument('--full', action='store_true', default=False,
+                            help='reload incremental datasets fully instead of only fetching their new rows')
+        parser.add_argument('--enqueue', action='store_true', default=False,
+                            help='queue the datasets for `ingest_worker` instead of ingesting them right away')
+        parser.add_argument('--concurrency', type=int, default=None,
+                            help='number of datasets ingested at the same time (default: settings.INGEST_CONCURRENCY)')
+
+    def handle(self, *args, **options):
+        configs = get_package_configs()
+        names = options['names']
+        if names:
+            unknown = set(names) - set(config['name'] for config in configs)
+            if unknown:
+                raise CommandError('unknown dataset(s):%s' % ', '.join(sorted(unknown)))
+            configs = [config for config in configs if config['name'] in names]
+        job_queue = get_job_queue()
+        if options['enqueue']:
+            for config in configs:
+                job_id = job_queue.enqueue(config['name'], full=options['full'])
+                self.stdout.write('queued %s as job:%s' % (config['name'], job_id))
+            return
+        # the datasets are ingested through their pending jobs, if any, so that workers don't ingest them again
+        worker = 'ingest:%s:%s' % (socket.gethostname(), os.getpid())
+        jobs = []
+        for config in configs:
+            job_queue.enqueue(config['name'])
+            job = job_queue.claim(worker, name=config['name'])
+            if job is None:
+                self.stdout.write('skipped %s, a worker is ingesting it' % config['name'])
+            else:
+                jobs.append(job)
+        results = run_ingest_jobs(jobs, concurrency=options['concurrency'], full=options['full'])
+        for config in configs:
+            if config['name'] in results:
+                self.stdout.write('%s %s' % (results[config['name']], config['name']))
+        failed = sorted(name for name, result in results.items() if result != SUCCEEDED)
+        if failed:
+            raise CommandError('failed to ingest:%s' % ', '.join(failed))
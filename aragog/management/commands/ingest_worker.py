@@ -0,0 +1,48 @@
+import os
+import socket
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from aragog.models import get_job_queue, run_ingest_jobs, sync_indexes
+
+
+class Command(BaseCommand):
+    help = ('Run the ingestion jobs queued by the web process or `ingest --enqueue`. independent datasets are '
+            'ingested concurrently')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--once', action='store_true', default=False,
+                            help='exit once the queue is empty instead of waiting for new jobs')
+        parser.add_argument('--poll-interval', type=float, default=settings.INGEST_WORKER_POLL_INTERVAL,
+                            help='seconds to wait before checking an empty queue again')
+        parser.add_argument('--concurrency', type=int, default=None,
+                            help='number of datasets ingested at the same time (default: settings.INGEST_CONCURRENCY)')
+
+    def handle(self, *args, **options):
+        worker = '%s:%s' % (socket.gethostname(), os.getpid())
+        if not settings.INGEST_ON_STARTUP:
+            sync_indexes()
+        while True:
+            jobs = self.claim_all(worker)
+            if not jobs:
+                if options['once']:
+                    break
+                time.sleep(options['poll_interval'])
+                continue
+            self.run_jobs(jobs, options['concurrency'])
+
+    def claim_all(self, worker):
+        job_queue = get_job_queue()
+        jobs = []
+        job = job_queue.claim(worker)
+        while job is not None:
+            jobs.append(job)
+            job = job_queue.claim(worker)
+        return jobs
+
+    def run_jobs(self, jobs, concurrency=None):
+        results = run_ingest_jobs(jobs, concurrency=concurrency)
+        for name, result in sorted(results.items()):
+            self.stdout.write('%s %s' % (result, name))
@@ -0,0 +1,120 @@
+import json
+import logging
+import os
+import shutil
+import time
+import uuid
+
+import dask.dataframe as dd
+import pandas as pd
+from django.core.exceptions import ImproperlyConfigured
+
+_LOG = logging.getLogger(__name__)
+META_FILENAME = '_aragog.json'
+DATA_DIRNAME = 'data'
+
+
+def get_dir_size(path):
+    return sum(os.path.getsize(os.path.join(root, filename))
+               for root, _, filenames in os.walk(path) for filename in filenames)
+
+
+class MaterializationCache(object):
+    """
+    Local Parquet copies of dataset sources, keyed by a fingerprint of the source, so that re-inferring or
+    re-loading a dataset reads compact columnar files instead of re-parsing or re-fetching the raw source.
+    Entries older than `ttl` seconds (if set) are rebuilt, and the least recently read ones are evicted once
+    the cache grows past `max_size` bytes
+    """
+    def __init__(self, cache_dir, max_size=None, ttl=None):
+        try:
+            pd.io.parquet.get_engine('auto')
+        except ImportError:
+            raise ImproperlyConfigured('materializing sources requires pyarrow or fastparquet to be installed')
+        self.cache_dir = cache_dir
+        self.max_size = max_size
+        self.ttl = ttl
+        if not os.path.isdir(cache_dir):
+            os.makedirs(cache_dir)
+
+    def get_path(self, key):
+        return os.path.join(self.cache_dir, key)
+
+    def get_data_path(self, key):
+        # kept apart from the metadata file, which parquet readers would take for a data file
+        return os.path.join(self.get_path(key), DATA_DIRNAME)
+
+    def get_meta_path(self, key):
+        return os.path.join(self.get_path(key), META_FILENAME)
+
+    def read_entry(self, key):
+        try:
+            with open(self.get_meta_path(key)) as meta_file:
+                return json.load(meta_file)
+        except (IOError, OSError, ValueError):
+            return None
+
+    def get_entries(self):
+        for key in os.listdir(self.cache_dir):
+            entry = self.read_entry(key)
+            if entry is not None:
+                yield entry
+
+    def get_size(self):
+        return sum(entry['size'] for entry in self.get_entries())
+
+    def is_fresh(self, entry):
+        return self.ttl is None or time.time() - entry['created_at'] < self.ttl
+
+    def get(self, key, columns=None):
+        """
+        returns the materialized dataframe or `None` if there is no fresh entry for `key`
+        """
+        entry = self.read_entry(key)
+        if entry is None or not self.is_fresh(entry):
+            return None
+        # the modification time of the metadata file doubles as the last access time for eviction
+        os.utime(self.get_meta_path(key), None)
+        _LOG.info('reading materialized source:%s', entry['name'])
+        return dd.read_parquet(self.get_data_path(key), columns=columns)
+
+    def store(self, key, df, name=None):
+        """
+        writes `df` to the cache and returns it read back from there. sources that can't be written as
+        Parquet (eg: columns of mixed types) are returned as is
+        """
+        start = time.time()
+        tmp_path = os.path.join(self.cache_dir, '%s.tmp-%s' % (key, uuid.uuid4().hex))
+        try:
+            df.to_parquet(os.path.join(tmp_path, DATA_DIRNAME), write_index=False)
+        except (ValueError, TypeError, NotImplementedError) as ex:
+            _LOG.warning('could not materialize source:%s (%s)', name, ex)
+            shutil.rmtree(tmp_path, ignore_errors=True)
+            return df
+        entry = {'key': key, 'name': name, 'created_at': time.time(), 'size': get_dir_size(tmp_path)}
+        with open(os.path.join(tmp_path, META_FILENAME), 'w') as meta_file:
+            json.dump(entry, meta_file)
+        self.remove(key)
+        os.rename(tmp_path, self.get_path(key))
+        _LOG.info('materialized source:%s (%s bytes) in %.2fs', name, entry['size'], time.time() - start)
+        if self.max_size is not None:
+            self.evict(keep=key)
+        return self.get(key)
+
+    def remove(self, key):
+        shutil.rmtree(self.get_path(key), ignore_errors=True)
+
+    def evict(self, keep=None):
+        size = self.get_size()
+        if size <= self.max_size:
+            return
+        entries = sorted(self.get_entries(), key=lambda entry: os.path.getmtime(self.get_meta_path(entry['key'])))
+        target_size = self.max_size * 0.9
+        for entry in entries:
+            if size <= target_size:
+                break
+            if entry['key'] == keep:
+                continue
+            self.remove(entry['key'])
+            size -= entry['size']
+            _LOG.info('evicted materialized source:%s', entry['name'])
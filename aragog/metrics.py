@@ -0,0 +1,210 @@
+"""
+Metrics of every stage of an ingest run (wall time, rows, bytes, partitions, peak RSS and HTTP requests), recorded
+through the sinks of `settings.INGEST_METRICS_SINKS`. The peak RSS is that of the process, not of the run
+"""
+from collections import OrderedDict
+from contextlib import contextmanager
+import datetime
+import logging
+import resource
+import sys
+import threading
+import time
+import uuid
+
+from django.conf import settings
+from django.utils.module_loading import import_string
+from sqlalchemy import BigInteger, Column, DateTime, Float, Integer, MetaData, String, Table, func, select
+
+_LOG = logging.getLogger(__name__)
+# ru_maxrss is in bytes on macOS, in kilobytes elsewhere
+RSS_UNIT = 1 if sys.platform == 'darwin' else 1024
+# sums up the stages of a run
+TOTAL_STAGE = 'total'
+
+metadata = MetaData()
+ingest_metrics = Table(
+    'aragog_ingest_metrics', metadata,
+    Column('id', Integer, primary_key=True),
+    Column('run_id', String(32), nullable=False, index=True),
+    Column('dataset', String(255), nullable=False, index=True),
+    Column('stage', String(32), nullable=False),
+    Column('started_at', DateTime, nullable=False),
+    # seconds
+    Column('wall_time', Float, nullable=False),
+    Column('rows', BigInteger, nullable=True),
+    Column('bytes', BigInteger, nullable=True),
+    Column('partitions', Integer, nullable=True),
+    # bytes, the high-water mark of the whole process when the stage ended, which includes the earlier runs and
+    # those running concurrently
+    Column('peak_rss', BigInteger, nullable=True),
+    Column('http_requests', Integer, nullable=False, default=0),
+    Column('http_retries', Integer, nullable=False, default=0),
+    Column('http_latency', Float, nullable=False, default=0),
+    Column('http_max_latency', Float, nullable=False, default=0),
+)
+
+
+def get_peak_rss():
+    """
+    returns the peak resident memory, in bytes, of this process or of its largest finished child (eg: a dask
+    worker) since it started. the kernel only keeps this high-water mark, so it can't be measured per run
+    """
+    return RSS_UNIT * max(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+                          resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss)
+
+
+class LogSink(object):
+    def __init__(self, engine):
+        pass
+
+    def record(self, metric):
+        _LOG.info('dataset:%(dataset)s stage:%(stage)s took %(wall_time).2fs rows:%(rows)s bytes:%(bytes)s '
+                  'partitions:%(partitions)s process_peak_rss:%(peak_rss)s http_requests:%(http_requests)s '
+                  'http_retries:%(http_retries)s http_latency:%(http_latency).2fs', metric)
+
+
+class DatabaseSink(object):
+    """
+    keeps the metrics of every run in the `aragog_ingest_metrics` table
+    """
+    table = ingest_metrics
+
+    def __init__(self, engine):
+        self.engine = engine
+        self.table.create(engine, checkfirst=True)
+
+    def record(self, metric):
+        with self.engine.begin() as conn:
+            conn.execute(self.table.insert(), metric)
+
+    def get_runs(self, dataset=None, limit=20):
+        """
+        returns the metrics of the latest `limit` runs, of `dataset` or of every dataset, latest first
+        """
+        latest = select([self.table.c.run_id]).group_by(self.table.c.run_id)
+        if dataset is not None:
+            latest = latest.where(self.table.c.dataset == dataset)
+        latest = latest.order_by(func.max(self.table.c.id).desc()).limit(limit)
+        with self.engine.connect() as conn:
+            run_ids = [row['run_id'] for row in conn.execute(latest)]
+            rows = conn.execute(self.table.select().where(self.table.c.run_id.in_(run_ids))
+                                .order_by(self.table.c.id)).fetchall()
+        runs = OrderedDict((run_id, None) for run_id in run_ids)
+        for row in rows:
+            if runs[row['run_id']] is None:
+                runs[row['run_id']] = {'run_id': row['run_id'], 'dataset': row['dataset'],
+                                       'started_at': row['started_at'], 'stages': []}
+            stage = dict((k, v) for k, v in row.items() if k not in ('id', 'run_id', 'dataset'))
+            runs[row['run_id']]['stages'].append(stage)
+        return list(runs.values())
+
+
+def get_sinks(engine):
+    return [import_string(path)(engine) for path in settings.INGEST_METRICS_SINKS]
+
+
+class IngestMetrics(object):
+    """
+    records the metrics of the stages of one ingest run of `dataset`. HTTP requests and the rows and bytes added
+    while a stage runs (from any thread) count towards it
+    """
+    def __init__(self, dataset, sinks=()):
+        self.dataset = dataset
+        self.sinks = sinks
+        self.run_id = uuid.uuid4().hex
+        self.current = None
+        self.stages = []
+        self.lock = threading.Lock()
+
+    def new_metric(self, stage):
+        return {
+            'run_id': self.run_id,
+            'dataset': self.dataset,
+            'stage': stage,
+            'started_at': datetime.datetime.utcnow(),
+            'wall_time': 0,
+            'rows': None,
+            'bytes': None,
+            'partitions': None,
+            'peak_rss': None,
+            'http_requests': 0,
+            'http_retries': 0,
+            'http_latency': 0,
+            'http_max_latency': 0,
+        }
+
+    def add(self, **counts):
+        """
+        adds `rows` and `bytes` to the current stage, or sets its number of `partitions`
+        """
+        with self.lock:
+            if self.current is None:
+                return
+            for key, value in counts.items():
+                if key == 'partitions':
+                    self.current[key] = value
+                else:
+                    self.current[key] = (self.current[key] or 0) + value
+
+    def record_request(self, latency, retries, num_bytes):
+        with self.lock:
+            if self.current is None:
+                return
+            self.current['http_requests'] += 1
+            self.current['http_retries'] += retries
+            self.current['http_latency'] += latency
+            self.current['http_max_latency'] = max(self.current['http_max_latency'], latency)
+            self.current['bytes'] = (self.current['bytes'] or 0) + num_bytes
+
+    def emit(self, metric):
+        for sink in self.sinks:
+            try:
+                sink.record(metric)
+            except Exception:
+                # metrics must not fail an ingest
+                _LOG.exception('recording metrics of %s in %s failed', self.dataset, type(sink).__name__)
+
+    @contextmanager
+    def stage(self, name):
+        """
+        stages are recorded once they finish, failed ones included
+        """
+        metric = self.new_metric(name)
+        start = time.time()
+        with self.lock:
+            self.current = metric
+        try:
+            yield metric
+        finally:
+            with self.lock:
+                self.current = None
+            metric['wall_time'] = time.time() - start
+            metric['peak_rss'] = get_peak_rss()
+            self.stages.append(metric)
+            self.emit(metric)
+
+    @contextmanager
+    def run(self):
+        """
+        records the `total` of the stages run in this context, with the rows and partitions of the last stage
+        that had some
+        """
+        total = self.new_metric(TOTAL_STAGE)
+        start = time.time()
+        del self.stages[:]
+        try:
+            yield total
+        finally:
+            for metric in self.stages:
+                for key in ('rows', 'partitions'):
+                    if metric[key] is not None:
+                        total[key] = metric[key]
+                for key in ('http_requests', 'http_retries', 'http_latency'):
+                    total[key] += metric[key]
+                if metric['bytes'] is not None:
+                    total['bytes'] = (total['bytes'] or 0) + metric['bytes']
+                total['http_max_latency'] = max(total['http_max_latency'], metric['http_max_latency'])
+            total['wall_time'] = time.time() - start
+            total['peak_rss'] = get_peak_rss()
+            self.emit(total)
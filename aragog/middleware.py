@@ -0,0 +1,51 @@
+import threading
+import time
+
+from django.conf import settings
+from django.urls import clear_url_caches
+
+from aragog.models import init_models, register_models
+from aragog.urls import URLConf
+
+
+class ModelRefreshMiddleware(object):
+    """
+    loads the models of the datasets on the first request, then registers those (re-)ingested since, at most every
+    `settings.MODEL_REFRESH_INTERVAL` seconds. requests are routed through a url conf of the registered models
+    (`request.urlconf`), which is replaced by a new one when they change. the url conf module is never reloaded
+    since other threads may be resolving urls from it
+    """
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.last_refresh = None
+        self.urlconf = None
+        self.lock = threading.Lock()
+
+    def init(self):
+        # requests wait for the models to be loaded, once
+        with self.lock:
+            if self.last_refresh is None:
+                init_models()
+                self.urlconf = URLConf()
+                self.last_refresh = time.time()
+
+    def refresh(self):
+        # one thread refreshes while the others carry on
+        if time.time() - self.last_refresh < settings.MODEL_REFRESH_INTERVAL or not self.lock.acquire(False):
+            return
+        try:
+            self.last_refresh = time.time()
+            if register_models():
+                # drops the resolvers of the previous url confs, those in use are kept by their requests
+                clear_url_caches()
+                self.urlconf = URLConf()
+        finally:
+            self.lock.release()
+
+    def __call__(self, request):
+        if self.last_refresh is None:
+            self.init()
+        else:
+            self.refresh()
+        request.urlconf = self.urlconf
+        return self.get_response(request)
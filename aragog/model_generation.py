@@ -1,3 +1,5 @@
+import hashlib
+
 from django.db import models
 from sqlalchemy import types
 # from django.contrib.postgres.fields import ArrayField, JSONField
@@ -44,6 +46,10 @@ def normalize_genson_field_types(field_types):
             field_type = 'string'
         elif len(field_types) == 2 and any([1 for d in field_types if d['type'] == 'null']):
             field_type = [d for d in field_types if d['type'] != 'null'][0]['type']
+        elif set(d['type'] for d in field_types) & set(['date', 'datetime']):
+            # dates are datetimes at midnight, while dates mixed with numbers or booleans were parsed from strings
+            types = set(d['type'] for d in field_types if d['type'] != 'null')
+            field_type = 'datetime' if types == set(['date', 'datetime']) else 'string'
         else:
             raise ValueError('dont know how to resolve field type among %s' % field_types)
     if field_type == 'null':
@@ -74,6 +80,16 @@ def get_model_config_from_schema(schema):
     return model_config
 
 
+def get_index_name(table_name, columns):
+    # same shape as django's generated names, which are limited to 30 characters
+    digest = hashlib.sha1(('%s|%s' % (table_name, ','.join(columns))).encode('utf-8')).hexdigest()
+    return '%s_%s_%s_idx' % (table_name[:11], columns[0][:7], digest[:6])
+
+
+def get_meta_indexes(table_name, indexes):
+    return [models.Index(fields=list(columns), name=get_index_name(table_name, columns)) for columns in indexes]
+
+
 def get_model_from_model_config(name, model_config, meta_config, schema):
     name = str(name)
     bases = (models.Model,)
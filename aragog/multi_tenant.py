@@ -1,99 +1,186 @@
 import copy
-from subprocess import call
+import logging
+from multiprocessing.pool import ThreadPool
 
 from django.db import connections
+from sqlalchemy.dialects import postgresql
+from sqlalchemy.engine.url import make_url
+
+from aragog.db import get_django_database_url, get_engine
+
+_LOG = logging.getLogger(__name__)
+# database the cluster-wide statements (roles, databases, default permissions) are run from
+MAINTENANCE_DB = 'template1'
+_PREPARER = postgresql.dialect().identifier_preparer
+
+
+def quote(name):
+    """
+    identifiers can't be bound as parameters, they are always quoted instead (and their quotes escaped)
+    """
+    return _PREPARER.quote_identifier(name)
 
 
 class MultiTenantProvisioner(object):
-    def __init__(self, super_user, db_name, users=[], create_db=False):
+    """
+    Provisions a PostgreSQL database shared by tenants: every user gets a login role and a schema of its own, and
+    reads the tables of the schema of `super_user`. Statements are run in process over the pooled connections of
+    the `using` database (with the database name swapped), and those of every step or tenant in one transaction so
+    that a failure leaves nothing behind. With `dry_run`, statements are only logged. Either way they are added
+    to `plan`, as `(database, statements)` tuples
+    """
+    def __init__(self, super_user, db_name, users=(), create_db=False, using='default', dry_run=False,
+                 concurrency=4):
         self.super_user = super_user
         self.db_name = db_name
-        self.users = users
+        self.users = list(users)
         self.create_db = create_db
+        self.using = using
+        self.dry_run = dry_run
+        self.concurrency = concurrency
+        self.plan = []
+
+    @property
+    def users_role(self):
+        return '%s_users' % self.super_user
+
+    def get_engine(self, database):
+        url = make_url(get_django_database_url(connections.databases[self.using]))
+        url.database = database
+        return get_engine(str(url))
 
-    def execute_many_django(self, using, queries):
-        with connections[using].cursor() as cursor:
-            for query, params in self.process_queries(queries):
-                cursor.execute(query, params)
-
-    def execute_many_subprocess(self, using, queries):
-        new_queries = [query % params for query, params in self.process_queries(queries)]
-        call('psql', '-d %s' % using, '-c %s' % '\n'.join(new_queries))
-
-    def process_queries(self, queries):
-        new_queries = []
-        for query in queries:
-            if len(query) == 1:
-                params = []
-            else:
-                query, params = query
-            if not query.endswith(';'):
-                query += ';'
-            new_queries.append((query, params))
-        return new_queries
-
-    def execute_many(self, using, queries):
-        self.execute_many_subprocess(using, queries)
-
-    def execute(self, using, query):
-        self.execute_many(using, [query])
+    def execute_many(self, database, statements, atomic=True):
+        """
+        runs `statements` on `database` in a single transaction, or one by one in autocommit mode for those that
+        can't run in a transaction (eg: CREATE DATABASE)
+        """
+        self.plan.append((database, list(statements)))
+        if self.dry_run:
+            for statement in statements:
+                _LOG.info('[dry run] database:%s %s', database, statement)
+            return
+        engine = self.get_engine(database)
+        if not atomic:
+            engine = engine.execution_options(isolation_level='AUTOCOMMIT')
+        with engine.begin() as conn:
+            # on the DBAPI cursor, so that statements aren't parsed for parameters
+            cursor = conn.connection.cursor()
+            try:
+                for statement in statements:
+                    cursor.execute(statement)
+            finally:
+                cursor.close()
+
+    def execute(self, database, statement, atomic=True):
+        self.execute_many(database, [statement], atomic=atomic)
 
     def reset(self):
-        self.execute(self.db_name, ('drop schema %s', [self.super_user]))
-        queries = [
-            ('drop role %s_users', [self.super_user])
-        ]
-        for user in self.users:
-            queries.append('drop role %s', (user,))
-        self.execute_many(self.db_name, queries)
+        """
+        drops the schemas and roles of the users, then those of `super_user`. expects a provisioned database
+        """
+        self.map_users(self.remove_user, self.users)
+        self.execute_many(self.db_name, [
+            'DROP SCHEMA IF EXISTS %s CASCADE' % quote(self.super_user),
+            'DROP OWNED BY %s' % quote(self.users_role),
+            'DROP ROLE %s' % quote(self.users_role),
+        ])
 
     def harden_default_perms(self):
-        self.execute_many('template1', [
-            'REVOKE ALL ON DATABASE template1 FROM public',
+        self.execute_many(MAINTENANCE_DB, [
+            'REVOKE ALL ON DATABASE %s FROM public' % quote(MAINTENANCE_DB),
             'REVOKE ALL ON SCHEMA public FROM public',
             'GRANT ALL ON SCHEMA public TO postgres',
-            ('GRANT ALL ON SCHEMA public TO %s', [self.super_user]),
-        ])
-        self.execute_many('template1', [
-            'REVOKE ALL ON pg_user FROM public'
-            'REVOKE ALL ON pg_roles FROM public'
-            'REVOKE ALL ON pg_group FROM public'
-            'REVOKE ALL ON pg_authid FROM public'
-            'REVOKE ALL ON pg_auth_members FROM public'
-            'REVOKE ALL ON pg_database FROM public'
-            'REVOKE ALL ON pg_tablespace FROM public'
-            'REVOKE ALL ON pg_settings FROM public'
-        ])
+            'GRANT ALL ON SCHEMA public TO %s' % quote(self.super_user),
+        ] + ['REVOKE ALL ON %s FROM public' % catalog for catalog in (
+            'pg_user', 'pg_roles', 'pg_group', 'pg_authid', 'pg_auth_members', 'pg_database', 'pg_tablespace',
+            'pg_settings')])
 
     def init_db(self):
-        queries = [
-            ('CREATE ROLE %s_users NOSUPERUSER NOCREATEDB NOCREATEROLE NOINHERIT NOLOGIN', [self.super_user]),
-            ('REVOKE ALL ON DATABASE %s FROM public', [self.db_name]),
-        ]
-        if not self.create_db:
-            queries.insert(0, ('CREATE DATABASE %s WITH OWNER=%s', [self.db_name, self.super_user]))
-        self.execute_many('template1', queries)
+        if self.create_db:
+            self.execute(MAINTENANCE_DB, 'CREATE DATABASE %s WITH OWNER = %s' % (
+                quote(self.db_name), quote(self.super_user)), atomic=False)
+        self.execute_many(MAINTENANCE_DB, [
+            'CREATE ROLE %s NOSUPERUSER NOCREATEDB NOCREATEROLE NOINHERIT NOLOGIN' % quote(self.users_role),
+            'REVOKE ALL ON DATABASE %s FROM public' % quote(self.db_name),
+        ])
+        schema = quote(self.super_user)
         self.execute_many(self.db_name, [
-            ('CREATE SCHEMA %s', [self.super_user]),
-            ('GRANT USAGE ON SCHEMA %s TO %s WITH GRANT OPTION', [self.super_user, self.super_user]),
-            ('GRANT SELECT ON ALL TABLES IN SCHEMA %s TO %s', [self.super_user, self.super_user]),
-            ('GRANT %s_users TO %s', [self.super_user, super_user]),
-            ('ALTER DATABASE %s SET search_path="\$user",%s', [self.db_name, self.db_name]),
+            'CREATE SCHEMA %s' % schema,
+            'GRANT USAGE ON SCHEMA %s TO %s WITH GRANT OPTION' % (schema, quote(self.super_user)),
+            'GRANT SELECT ON ALL TABLES IN SCHEMA %s TO %s' % (schema, quote(self.super_user)),
+            'GRANT %s TO %s' % (quote(self.users_role), quote(self.super_user)),
+            # tables are looked up in the user's schema, then in the shared one
+            'ALTER DATABASE %s SET search_path = "$user", %s' % (quote(self.db_name), schema),
         ])
 
+    def get_user_statements(self, user):
+        schema = quote(self.super_user)
+        return [
+            'CREATE ROLE %s NOSUPERUSER NOCREATEDB NOCREATEROLE NOINHERIT LOGIN' % quote(user),
+            'CREATE SCHEMA %s' % quote(user),
+            'GRANT USAGE ON SCHEMA %s TO %s WITH GRANT OPTION' % (quote(user), quote(user)),
+            'GRANT USAGE ON SCHEMA %s TO %s WITH GRANT OPTION' % (schema, quote(user)),
+            'GRANT SELECT ON ALL TABLES IN SCHEMA %s TO %s' % (schema, quote(user)),
+            'GRANT CONNECT, TEMPORARY ON DATABASE %s TO %s' % (quote(self.db_name), quote(user)),
+            'GRANT %s TO %s' % (quote(self.users_role), quote(user)),
+        ]
+
     def add_user(self, user):
+        self.execute_many(self.db_name, self.get_user_statements(user))
+
+    def remove_user(self, user):
         self.execute_many(self.db_name, [
-            ('CREATE ROLE %s NOSUPERUSER NOCREATEDB NOCREATEROLE NOINHERIT LOGIN', [user]),
-            ('CREATE SCHEMA %s', [user]),
-            ('GRANT USAGE ON SCHEMA %s TO %s WITH GRANT OPTION', [user, user]),
-            ('GRANT USAGE ON SCHEMA %s TO %s WITH GRANT OPTION', [self.super_user, user]),
-            ('GRANT SELECT ON ALL TABLES IN SCHEMA %s TO %s', [self.super_user, user]),
-            ('GRANT CONNECT,TEMPORARY ON DATABASE %s TO %s', [self.db_name, user]),
-            ('GRANT %s_users TO %s', [self.super_user, user]),
+            'DROP SCHEMA IF EXISTS %s CASCADE' % quote(user),
+            # the privileges granted to the user
+            'DROP OWNED BY %s' % quote(user),
+            'DROP ROLE %s' % quote(user),
         ])
 
+    def map_users(self, func, users):
+        """
+        runs `func` for every user, `concurrency` at a time. every user has its own transaction: the users whose
+        statements failed are logged and the first error is raised once all of them are done
+        """
+        if self.dry_run or self.concurrency <= 1:
+            errors = []
+            for user in users:
+                errors.append(self.run_for_user(func, user))
+        else:
+            # created once, rather than by every thread
+            self.get_engine(self.db_name)
+            pool = ThreadPool(self.concurrency)
+            try:
+                errors = pool.map(lambda user: self.run_for_user(func, user), users)
+            finally:
+                pool.close()
+        errors = [error for error in errors if error is not None]
+        if errors:
+            raise errors[0]
+
+    def run_for_user(self, func, user):
+        try:
+            func(user)
+        except Exception as e:
+            _LOG.exception('provisioning user:%s failed', user)
+            return e
+        return None
+
+    def add_users(self, users=None):
+        self.map_users(self.add_user, self.users if users is None else users)
+
+    def provision(self):
+        """
+        initializes the database and adds every user
+        """
+        self.init_db()
+        self.add_users()
+
     def get_connection(self, user):
-        db_conf = copy.deepcopy(connections.databases[self.db_name])
-        db_conf['USER'] = user
-        connections.databases[user] = db_conf
+        """
+        returns the django connection of `user`, whose alias is only registered once
+        """
+        if user not in connections.databases:
+            db_conf = copy.deepcopy(connections.databases[self.using])
+            db_conf.update(NAME=self.db_name, USER=user)
+            connections.databases[user] = db_conf
         return connections[user]
@@ -0,0 +1,89 @@
+import itertools
+import logging
+import os
+import shutil
+import tempfile
+import uuid
+
+import dask
+import dask.dataframe as dd
+import pandas as pd
+from django.core.exceptions import ImproperlyConfigured
+
+_LOG = logging.getLogger(__name__)
+SPILL_FORMATS = ('pickle', 'parquet')
+
+
+def read_spilled_partition(path, spill_format):
+    if spill_format == 'parquet':
+        return pd.read_parquet(path)
+    return pd.read_pickle(path)
+
+
+class PartitionBuilder(object):
+    """
+    Turns a stream of records (eg: a fetcher) into a dask dataframe, `partition_size` records at a time, so
+    that the records are never all held as python dicts. Partitions are kept in memory as pandas dataframes
+    or, with `spill`, written to local files so that memory use is bounded by the partition size
+    """
+    def __init__(self, partition_size=10000, spill=False, spill_format='pickle', spill_dir=None):
+        if spill_format not in SPILL_FORMATS:
+            raise ImproperlyConfigured('unknown spill format:%s' % spill_format)
+        if spill and spill_format == 'parquet':
+            try:
+                pd.io.parquet.get_engine('auto')
+            except ImportError:
+                raise ImproperlyConfigured('spilling to parquet requires pyarrow or fastparquet to be installed')
+        self.partition_size = partition_size
+        self.spill = spill
+        self.spill_format = spill_format
+        self.spill_dir = spill_dir
+        self.prefix = 'partition-builder-%s' % uuid.uuid4().hex
+
+    def get_spill_dir(self):
+        if self.spill_dir is None:
+            self.spill_dir = tempfile.mkdtemp(prefix='aragog-spill-')
+        return self.spill_dir
+
+    def get_chunks(self, records):
+        records = iter(records)
+        while True:
+            chunk = list(itertools.islice(records, self.partition_size))
+            if not chunk:
+                return
+            yield chunk
+
+    def make_partition(self, idx, df_chunk):
+        name = '%s-%s' % (self.prefix, idx)
+        if not self.spill:
+            return dask.delayed(df_chunk, name=name)
+        path = os.path.join(self.get_spill_dir(), '%s.%s' % (idx, self.spill_format))
+        if self.spill_format == 'parquet':
+            df_chunk.to_parquet(path)
+        else:
+            df_chunk.to_pickle(path)
+        return dask.delayed(read_spilled_partition, name=name)(path, self.spill_format)
+
+    def get_data_frame(self, records, columns=None):
+        """
+        columns default to the keys of the first record
+        """
+        partitions = []
+        meta = None
+        for idx, chunk in enumerate(self.get_chunks(records)):
+            if columns is None:
+                columns = list(chunk[0].keys())
+            df_chunk = pd.DataFrame.from_records(chunk, columns=columns)
+            if meta is None:
+                meta = df_chunk.iloc[:0]
+            partitions.append(self.make_partition(idx, df_chunk))
+        _LOG.info('built %s partitions of up to %s records', len(partitions), self.partition_size)
+
+        if not partitions:
+            return dd.from_pandas(pd.DataFrame(columns=columns or []), npartitions=1)
+        return dd.from_delayed(partitions, meta=meta, prefix=self.prefix)
+
+    def cleanup(self):
+        if self.spill_dir is not None:
+            shutil.rmtree(self.spill_dir, ignore_errors=True)
+            self.spill_dir = None
@@ -0,0 +1,75 @@
+import logging
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Avg, Count, Max, Min
+
+_LOG = logging.getLogger(__name__)
+NUMERIC_FIELD_TYPES = ('BigIntegerField', 'FloatField', 'IntegerField', 'DecimalField')
+
+
+def get_profiled_fields(model):
+    return [field for field in model._meta.concrete_fields if not field.primary_key]
+
+
+def get_aggregates(model):
+    aggregates = {'total': Count('*')}
+    for field in get_profiled_fields(model):
+        field_type = field.get_internal_type()
+        aggregates['%s__count' % field.name] = Count(field.name)
+        if field_type != 'BooleanField':
+            aggregates['%s__min' % field.name] = Min(field.name)
+            aggregates['%s__max' % field.name] = Max(field.name)
+        if field_type in NUMERIC_FIELD_TYPES:
+            aggregates['%s__avg' % field.name] = Avg(field.name)
+    return aggregates
+
+
+def get_grouped_fields(model):
+    """
+    only low cardinality fields (those with choices at ingest time) and booleans are grouped by
+    """
+    properties = model.source_config['schema'].get('properties', {})
+    return [field for field in get_profiled_fields(model)
+            if field.get_internal_type() == 'BooleanField' or properties.get(field.name, {}).get('choices')]
+
+
+def compute_profile(model, top_n=10):
+    """
+    computes the stats of every field of `model` with a single multi-aggregate query, plus a top-n GROUP BY
+    query for every low cardinality field
+    """
+    start = time.time()
+    row = model.objects.aggregate(**get_aggregates(model))
+    total = row['total']
+    fields = OrderedDict()
+    for field in get_profiled_fields(model):
+        count = row['%s__count' % field.name]
+        fields[field.name] = {
+            'count': count,
+            'fill_rate': 100.0 * count / total if total else None,
+            'min': row.get('%s__min' % field.name),
+            'max': row.get('%s__max' % field.name),
+            'avg': row.get('%s__avg' % field.name),
+            'top': None,
+        }
+    for field in get_grouped_fields(model):
+        top = (model.objects.values_list(field.name).annotate(count=Count('*')).order_by('-count')[:top_n])
+        fields[field.name]['top'] = [list(value_count) for value_count in top]
+    _LOG.info('profiled table:%s (%s rows) in %.2fs', model._meta.db_table, total, time.time() - start)
+    return {'total': total, 'fields': fields}
+
+
+def get_profile(model, version=None):
+    """
+    returns the cached profile of `model`. `version` (eg: the time of its last ingest) is part of the cache key,
+    so that profiles are recomputed as soon as the table is reloaded
+    """
+    key = 'aragog-profile:%s:%s' % (model._meta.db_table, version)
+    profile = cache.get(key)
+    if profile is None:
+        profile = compute_profile(model, settings.PROFILE_TOP_N)
+        cache.set(key, profile, settings.PROFILE_CACHE_TTL)
+    return profile
@@ -0,0 +1,71 @@
+from collections import OrderedDict
+from contextlib import contextmanager
+import time
+
+from dask.callbacks import Callback
+
+from aragog.scheduler import thread_callbacks
+
+# share of the progress of an ingest (in percent) covered by every stage
+INGEST_STAGES = OrderedDict([
+    ('fetch', 5),
+    ('infer', 35),
+    ('count', 10),
+    ('load', 45),
+    ('index', 5),
+])
+
+
+class TaskProgress(Callback):
+    """
+    calls `on_fraction` with the fraction of the tasks of a dask computation that are finished. only the local
+    schedulers run callbacks
+    """
+    def __init__(self, on_fraction):
+        super(TaskProgress, self).__init__()
+        self.on_fraction = on_fraction
+
+    def _posttask(self, key, result, dsk, state, worker_id):
+        num_finished = len(state['finished'])
+        num_tasks = num_finished + sum(len(state[k]) for k in ('ready', 'waiting', 'running'))
+        self.on_fraction(num_finished / float(num_tasks))
+
+
+class IngestProgress(object):
+    """
+    reports the progress of an ingest, in percent, to `report` at most every `interval` seconds. every stage
+    covers a fixed share of it, through which it advances as the dask tasks of the stage finish
+    """
+    def __init__(self, report=None, interval=1):
+        self.report = report
+        self.interval = interval
+        self.percent = 0
+        self.last_report = None
+
+    def get_stage_range(self, name):
+        start = 0
+        for stage, share in INGEST_STAGES.items():
+            if stage == name:
+                return start, start + share
+            start += share
+        raise KeyError(name)
+
+    def update(self, percent, force=False):
+        # the tasks of a stage can be computed in several passes, so progress never goes back
+        if self.report is None or percent <= self.percent:
+            return
+        self.percent = percent
+        now = time.time()
+        if force or self.last_report is None or now - self.last_report >= self.interval:
+            self.last_report = now
+            self.report(round(percent, 1))
+
+    @contextmanager
+    def stage(self, name):
+        start, end = self.get_stage_range(name)
+        if self.report is None:
+            yield
+            return
+        with thread_callbacks(TaskProgress(lambda fraction: self.update(start + fraction * (end - start)))):
+            yield
+        self.update(end, force=True)
@@ -0,0 +1,74 @@
+import datetime
+import hashlib
+import json
+
+from sqlalchemy import Column, DateTime, MetaData, PickleType, String, Table, inspect
+
+# bump this whenever the shape of the stored schema/model config changes so
+# that existing entries are treated as stale and re-ingested
+REGISTRY_VERSION = 3
+
+metadata = MetaData()
+schema_registry = Table(
+    'aragog_schema_registry', metadata,
+    Column('name', String(255), primary_key=True),
+    Column('fingerprint', String(40), nullable=False),
+    Column('schema', PickleType, nullable=False),
+    Column('model_config', PickleType, nullable=False),
+    Column('meta_config', PickleType, nullable=False),
+    Column('updated_at', DateTime, nullable=False),
+    # last value of the watermark column of incrementally ingested datasets
+    Column('watermark', PickleType, nullable=True),
+)
+
+
+def get_fingerprint(source_config):
+    source_config = dict(source_config, registry_version=REGISTRY_VERSION)
+    serialized = json.dumps(source_config, sort_keys=True, default=str)
+    return hashlib.sha1(serialized.encode('utf-8')).hexdigest()
+
+
+class SchemaRegistry(object):
+    """
+    Persists the merged schema + model config of every ingested dataset so that
+    model classes can be rebuilt on startup without re-ingesting the data
+    """
+    table = schema_registry
+
+    def __init__(self, engine):
+        self.engine = engine
+        self.table.create(engine, checkfirst=True)
+        self.add_missing_columns()
+
+    def add_missing_columns(self):
+        existing = set(c['name'] for c in inspect(self.engine).get_columns(self.table.name))
+        for column in self.table.columns:
+            if column.name not in existing:
+                self.engine.execute('ALTER TABLE %s ADD COLUMN %s %s' % (
+                    self.table.name, column.name, column.type.compile(dialect=self.engine.dialect)))
+
+    def get(self, name, fingerprint=None):
+        query = self.table.select().where(self.table.c.name == name)
+        with self.engine.connect() as conn:
+            row = conn.execute(query).fetchone()
+        if row is None or (fingerprint is not None and row['fingerprint'] != fingerprint):
+            return None
+        return dict(row)
+
+    def save(self, name, fingerprint, schema, model_config, meta_config, watermark=None):
+        values = {
+            'name': name,
+            'fingerprint': fingerprint,
+            'schema': schema,
+            'model_config': model_config,
+            'meta_config': meta_config,
+            'updated_at': datetime.datetime.utcnow(),
+            'watermark': watermark,
+        }
+        with self.engine.begin() as conn:
+            conn.execute(self.table.delete().where(self.table.c.name == name))
+            conn.execute(self.table.insert(), values)
+
+    def delete(self, name):
+        with self.engine.begin() as conn:
+            conn.execute(self.table.delete().where(self.table.c.name == name))
@@ -0,0 +1,192 @@
+import logging
+import random
+
+import dask
+import numpy
+import pandas as pd
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+
+from aragog.type_detection import get_schema_for_dataframe, get_types_for_dataframe, merge_schemas
+
+_LOG = logging.getLogger(__name__)
+INFERENCE_MODES = ('full', 'head', 'fraction', 'reservoir')
+INFERENCE_DEFAULTS = {
+    'mode': 'full',
+    'size': 10000,
+    'fraction': 0.01,
+    'verify': False,
+    'random_state': None,
+}
+SAMPLE_KEY_COLUMN = '__sample_key'
+
+
+def get_inference_config(config=None):
+    config = dict(INFERENCE_DEFAULTS, **(config or {}))
+    if config['mode'] not in INFERENCE_MODES:
+        raise ImproperlyConfigured('unknown inference mode:%s' % config['mode'])
+    return config
+
+
+class Reservoir(object):
+    """
+    uniform sample of `size` items from a stream of unknown length (Algorithm R)
+    """
+    def __init__(self, size, random_state=None):
+        self.size = size
+        self.seen = 0
+        self.items = []
+        self.random = random.Random(random_state)
+
+    def add(self, item):
+        self.seen += 1
+        if len(self.items) < self.size:
+            self.items.append(item)
+        else:
+            idx = self.random.randint(0, self.seen - 1)
+            if idx < self.size:
+                self.items[idx] = item
+
+    def tap(self, iterable):
+        """
+        samples items as they are consumed from `iterable`
+        """
+        for item in iterable:
+            self.add(item)
+            yield item
+
+    def __iter__(self):
+        return iter(self.items)
+
+    def __len__(self):
+        return len(self.items)
+
+
+def get_partition_seed(random_state, idx):
+    return None if random_state is None else random_state + idx
+
+
+def bottom_k_sample(df_chunk, size, random_state=None):
+    # keeping the rows with the `size` smallest random keys is a uniform sample and, unlike
+    # Algorithm R, the samples of separate partitions can be merged by doing it again
+    if SAMPLE_KEY_COLUMN not in df_chunk.columns:
+        keys = numpy.random.RandomState(random_state).random_sample(len(df_chunk))
+        df_chunk = df_chunk.assign(**{SAMPLE_KEY_COLUMN: keys})
+    return df_chunk.nsmallest(size, SAMPLE_KEY_COLUMN)
+
+
+def merge_bottom_k_samples(samples, size):
+    return bottom_k_sample(pd.concat(samples), size).drop(SAMPLE_KEY_COLUMN, axis=1)
+
+
+def reservoir_sample_dataframe(df, size, random_state=None):
+    samples = [dask.delayed(bottom_k_sample)(part, size, get_partition_seed(random_state, idx))
+               for idx, part in enumerate(df.to_delayed())]
+    return dask.delayed(merge_bottom_k_samples)(samples, size).compute()
+
+
+def head_sample(df, size):
+    """
+    the first `size` rows of `df`. unlike `df.head(size, npartitions=-1)`, which computes every partition, they are
+    computed one at a time until there are enough rows
+    """
+    parts = []
+    rows = 0
+    for part in df.to_delayed():
+        if rows >= size:
+            break
+        parts.append(part.compute().head(size - rows))
+        rows += len(parts[-1])
+    return pd.concat(parts) if parts else df._meta
+
+
+def merge_partition_schemas(schemas):
+    # partial results of a reduction are pandas Series, with one schema per partition or per partial merge
+    return merge_schemas(schemas.tolist())
+
+
+def reduce_schemas(df, split_every=None):
+    """
+    returns the merged schema of the partitions of `df`. schemas are merged on the workers, `split_every` at a time
+    (default settings.SCHEMA_MERGE_SPLIT_EVERY), so that only the final schema is sent back
+    """
+    return df.reduction(get_schema_for_dataframe, aggregate=merge_partition_schemas,
+                        split_every=split_every or settings.SCHEMA_MERGE_SPLIT_EVERY, meta=object).compute()
+
+
+def widen_type(inferred_type, observed_type):
+    if observed_type is None or inferred_type == observed_type:
+        return inferred_type
+    if inferred_type == 'null':
+        return observed_type
+    if set([inferred_type, observed_type]) == set(['integer', 'number']):
+        return 'number'
+    if set([inferred_type, observed_type]) == set(['date', 'datetime']):
+        return 'datetime'
+    return 'string'
+
+
+def verify_schema(df, schema):
+    """
+    checks that the types in `schema` hold for every row of `df` and widens the ones that don't
+    """
+    schema.setdefault('properties', {})
+    schema.setdefault('required', [])
+    for partition_types in df.map_partitions(get_types_for_dataframe, meta=('types', object)).compute():
+        for field, observed_type in partition_types.items():
+            field_config = schema['properties'].setdefault(field, {'type': 'null'})
+            field_type = widen_type(field_config.get('type'), observed_type)
+            if field_type != field_config.get('type'):
+                _LOG.info('widening type of field:%s from %s to %s', field, field_config.get('type'), field_type)
+                field_config['type'] = field_type
+            if field not in schema['required']:
+                schema['required'].append(field)
+    return schema
+
+
+def get_field_type(field_config):
+    return field_config.get('type', field_config.get('anyOf'))
+
+
+def apply_load_profile(schema, profile):
+    """
+    returns the sampled `schema` with the exact stats of `profile`, the merged schema of the partitions that were
+    loaded. the types and required fields of `schema`, which the table and model were generated from, are kept:
+    a field whose loaded values don't fit its sampled type (`verify` widens it beforehand) keeps its sample stats
+    """
+    loaded = profile.get('properties', {})
+    properties = {}
+    for field, field_config in schema['properties'].items():
+        field_profile = loaded.get(field)
+        if field_profile is not None and get_field_type(field_profile) == get_field_type(field_config):
+            properties[field] = field_profile
+        else:
+            _LOG.warning('field:%s was loaded as %s, keeping its sampled type %s', field,
+                         field_profile and get_field_type(field_profile), get_field_type(field_config))
+            properties[field] = field_config
+    return dict(profile, properties=properties, required=list(schema['required']))
+
+
+def infer_schema(df, config, reservoir=None):
+    """
+    infers the schema of `df` from all of it or from a sample, as specified by the dataset's `inference` config.
+    `reservoir` is a `Reservoir` that has already sampled the records `df` was built from
+    """
+    mode = config['mode']
+    if mode == 'full':
+        schema = reduce_schemas(df, config.get('split_every'))
+    elif mode == 'head':
+        schema = merge_schemas([get_schema_for_dataframe(head_sample(df, config['size']))])
+    elif mode == 'fraction':
+        sample = df.sample(frac=config['fraction'], random_state=config['random_state'])
+        schema = reduce_schemas(sample, config.get('split_every'))
+    elif reservoir is not None:
+        schema = merge_schemas([get_schema_for_dataframe(pd.DataFrame(list(reservoir), columns=df.columns))])
+    else:
+        sample = reservoir_sample_dataframe(df, config['size'], config['random_state'])
+        schema = merge_schemas([get_schema_for_dataframe(sample)])
+    _LOG.info('schema inferred from %s partitions with inference mode:%s', df.npartitions, mode)
+
+    if mode != 'full' and config['verify']:
+        schema = verify_schema(df, schema)
+    return schema
@@ -0,0 +1,94 @@
+from contextlib import contextmanager
+import logging
+import threading
+
+import dask
+from dask.base import named_schedulers
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+
+_LOG = logging.getLogger(__name__)
+SCHEDULERS = ('single-threaded', 'threads', 'processes', 'distributed')
+_CLIENT = None
+_THREAD_STATE = threading.local()
+
+
+def get_thread_callbacks():
+    return getattr(_THREAD_STATE, 'callbacks', ())
+
+
+@contextmanager
+def thread_callbacks(*callbacks):
+    """
+    registers dask callbacks for the computations of the current thread only
+    """
+    previous = get_thread_callbacks()
+    _THREAD_STATE.callbacks = previous + tuple(callback._callback for callback in callbacks)
+    try:
+        yield
+    finally:
+        _THREAD_STATE.callbacks = previous
+
+
+def with_thread_callbacks(get):
+    """
+    dask swaps its global callbacks out while a computation runs, so they get lost when several threads compute
+    at the same time (eg: datasets ingested concurrently). instead, the local schedulers are handed the
+    callbacks of the thread they are called from
+    """
+    def get_with_thread_callbacks(dsk, keys, **kwargs):
+        callbacks = get_thread_callbacks()
+        if callbacks:
+            kwargs.setdefault('callbacks', list(callbacks))
+        return get(dsk, keys, **kwargs)
+    return get_with_thread_callbacks
+
+
+def get_local_cluster_client(num_workers=None, memory_limit='auto'):
+    try:
+        from dask.distributed import Client, LocalCluster
+    except ImportError:
+        raise ImproperlyConfigured('the distributed scheduler requires dask.distributed to be installed')
+    cluster = LocalCluster(n_workers=num_workers, threads_per_worker=1, memory_limit=memory_limit,
+                           processes=True)
+    return Client(cluster)
+
+
+def configure_scheduler(scheduler=None, num_workers=None, memory_limit=None):
+    """
+    sets the default dask scheduler used for ingestion. defaults to `settings.DASK_SCHEDULER`
+    """
+    global _CLIENT
+    scheduler = scheduler or settings.DASK_SCHEDULER
+    num_workers = num_workers or settings.DASK_NUM_WORKERS
+    memory_limit = memory_limit or settings.DASK_MEMORY_LIMIT
+    if scheduler not in SCHEDULERS:
+        raise ImproperlyConfigured('unknown dask scheduler:%s' % scheduler)
+
+    if scheduler == 'distributed':
+        if _CLIENT is None:
+            # the client registers itself as the default scheduler
+            _CLIENT = get_local_cluster_client(num_workers, memory_limit)
+            _LOG.info('started dask cluster:%s', _CLIENT)
+    else:
+        dask.config.set(scheduler=with_thread_callbacks(named_schedulers[scheduler]), num_workers=num_workers)
+        _LOG.info('using dask scheduler:%s num_workers:%s', scheduler, num_workers)
+
+
+@contextmanager
+def scheduler_context(scheduler, num_workers=None, memory_limit='auto'):
+    """
+    temporarily switches the dask scheduler. a LocalCluster is started and torn down for `distributed`
+    """
+    if scheduler not in SCHEDULERS:
+        raise ImproperlyConfigured('unknown dask scheduler:%s' % scheduler)
+    if scheduler == 'distributed':
+        client = get_local_cluster_client(num_workers, memory_limit)
+        try:
+            yield client
+        finally:
+            client.close()
+            client.cluster.close()
+    else:
+        with dask.config.set(scheduler=with_thread_callbacks(named_schedulers[scheduler]), num_workers=num_workers):
+            yield None
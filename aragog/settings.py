@@ -47,6 +47,8 @@ INSTALLED_APPS = [
 ] + PROJECT_APPS
 
 MIDDLEWARE = [
+    # first, so that the other middlewares resolve urls from the url conf of the current models
+    'aragog.middleware.ModelRefreshMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -150,3 +152,76 @@ LOGGING = {
 }
 
 PACKAGES_FILE = os.path.join(BASE_DIR, 'packages.yml.example')
+
+# Dask scheduler used for ingestion. One of single-threaded, threads, processes or distributed
+# (a dask.distributed LocalCluster, needs the distributed package). Parallel schedulers are opt-in, through
+# ARAGOG_DASK_SCHEDULER
+DASK_SCHEDULER = os.environ.get('ARAGOG_DASK_SCHEDULER', 'single-threaded')
+# Defaults to the number of cores
+DASK_NUM_WORKERS = None
+# Memory limit of every LocalCluster worker, eg: '4GB'
+DASK_MEMORY_LIMIT = 'auto'
+
+# On-disk cache of API responses, enabled per dataset with `cache: true` or `cache: {ttl: <seconds>}` in `params`
+FETCHER_CACHE_DIR = os.path.join(BASE_DIR, '.fetcher_cache')
+FETCHER_CACHE_MAX_SIZE = 1024 ** 3
+# Replay every API dataset from the cache without touching the network
+FETCHER_CACHE_OFFLINE = os.environ.get('ARAGOG_FETCHER_CACHE_OFFLINE') == '1'
+
+# Profiles computed by the describe view are cached for PROFILE_CACHE_TTL seconds, or until the dataset is re-ingested
+PROFILE_CACHE_TTL = 60 * 60
+# Number of most frequent values shown for low cardinality fields
+PROFILE_TOP_N = 10
+
+# Local Parquet copies of the sources of datasets with `materialize: true` in `params`
+MATERIALIZATION_CACHE_DIR = os.path.join(BASE_DIR, '.materialized')
+MATERIALIZATION_CACHE_MAX_SIZE = 10 * 1024 ** 3
+
+# Sources of `multi` datasets that take less than this many bytes in memory are broadcast to every partition of the
+# other side of a join instead of being shuffled with it
+JOIN_BROADCAST_THRESHOLD = 64 * 1024 ** 2
+
+# Ingest every stale dataset in a background thread of the web process, started by its first request. Otherwise
+# they are queued for `./manage.py ingest_worker`. Either way, models are registered from their last known schema
+INGEST_ON_STARTUP = os.environ.get('ARAGOG_INGEST_ON_STARTUP') == '1'
+# Seconds between two checks for datasets ingested by a worker since the web process started
+MODEL_REFRESH_INTERVAL = 5
+# Seconds a worker waits before checking an empty job queue again
+INGEST_WORKER_POLL_INTERVAL = 5
+
+# Database datasets are loaded into, along with the schema registry, job queue and metrics: INGEST_DATABASE_URL (a
+# sqlalchemy url) or, by default, the INGEST_DATABASE alias of DATABASES, which the admin reads
+INGEST_DATABASE = 'default'
+INGEST_DATABASE_URL = os.environ.get('ARAGOG_INGEST_DATABASE_URL')
+# Connections kept open by the ingest engines of every process, and opened on top of those when they are all in use
+INGEST_DATABASE_POOL_SIZE = 5
+INGEST_DATABASE_MAX_OVERFLOW = 10
+# Page cache and memory map, in bytes, of the SQLite connections that load staging tables
+INGEST_SQLITE_CACHE_SIZE = 256 * 1024 ** 2
+INGEST_SQLITE_MMAP_SIZE = 1024 ** 3
+# PostgreSQL staging tables aren't written to the WAL until they replace the live table
+INGEST_POSTGRES_UNLOGGED_STAGING = True
+
+# Number of datasets ingested at the same time, and of those fetched from the same API host
+INGEST_CONCURRENCY = 4
+INGEST_HOST_CONCURRENCY = 2
+
+# Sinks the metrics of every ingest stage are recorded through: classes taking the engine of the ingest database,
+# with a `record(metric)` method. The metrics page and endpoint read them from DatabaseSink's table
+INGEST_METRICS_SINKS = ['aragog.metrics.DatabaseSink', 'aragog.metrics.LogSink']
+
+# Number of partition schemas merged together by every task of the tree reduction of schemas during inference. The
+# `split_every` of a dataset's `inference` config overrides it
+SCHEMA_MERGE_SPLIT_EVERY = 8
+
+# Strings detected as booleans, case insensitive
+TYPE_DETECTION_TRUE_TOKENS = ('true', 't', 'yes', 'y')
+TYPE_DETECTION_FALSE_TOKENS = ('false', 'f', 'no', 'n')
+# Formats, tried in order on a sample of every string column that looks like dates, of date and datetime columns
+TYPE_DETECTION_DATE_FORMATS = ('%Y-%m-%d', '%Y/%m/%d', '%d/%m/%Y', '%m/%d/%Y', '%d.%m.%Y')
+TYPE_DETECTION_DATETIME_FORMATS = ('%Y-%m-%dT%H:%M:%S', '%Y-%m-%d %H:%M:%S', '%Y-%m-%dT%H:%M:%S.%f',
+                                   '%Y-%m-%d %H:%M:%S.%f', '%Y-%m-%dT%H:%M:%SZ', '%Y-%m-%dT%H:%M:%S.%fZ',
+                                   '%Y-%m-%dT%H:%M', '%Y-%m-%d %H:%M')
+# Share of the values of a string column that have to parse as numbers, booleans or dates for it to be typed as
+# such. The values that don't are loaded as nulls
+TYPE_DETECTION_MIN_PARSE_RATE = 1.0
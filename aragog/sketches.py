@@ -0,0 +1,364 @@
+"""
+fixed size summaries of a column that can be built one partition at a time and merged through `add_schema`.
+all of them are deterministic, so merging the same partitions in the same order gives the same result
+"""
+from collections import Counter
+import math
+
+import numpy
+import pandas as pd
+
+HASH_BITS = 64
+
+
+def to_string(v):
+    if isinstance(v, basestring):
+        return v
+    return repr(v) if isinstance(v, float) else str(v)
+
+
+def hash_values(values):
+    # values are hashed through their string representation so that `1` hashes the same in a typed column
+    # as it does in a column of strings
+    values = numpy.asarray(values)
+    if values.dtype.kind in 'iuf':
+        strings = values.astype(str)
+    else:
+        strings = [to_string(v) for v in values]
+    return pd.util.hash_array(numpy.asarray(strings, dtype=object), categorize=False)
+
+
+class HyperLogLog(object):
+    """
+    distinct count estimate within ~1.04 / sqrt(2 ** precision) (1.6% by default) of the real one
+    """
+    def __init__(self, precision=12):
+        self.precision = precision
+        self.registers = numpy.zeros(2 ** precision, dtype=numpy.uint8)
+
+    def __eq__(self, other):
+        return (isinstance(other, HyperLogLog) and self.precision == other.precision and
+                numpy.array_equal(self.registers, other.registers))
+
+    def __ne__(self, other):
+        return not self == other
+
+    def __repr__(self):
+        return '<HyperLogLog estimate:%s>' % self.estimate()
+
+    def add(self, obj):
+        self.update([obj])
+
+    def update(self, values):
+        if not len(values):
+            return
+        hashes = hash_values(values)
+        num_bits = HASH_BITS - self.precision
+        indexes = (hashes >> numpy.uint64(num_bits)).astype(numpy.intp)
+        rest = hashes & numpy.uint64((1 << num_bits) - 1)
+        # the remaining bits fit in a float64 mantissa, so frexp gives their exact bit length
+        _, bit_lengths = numpy.frexp(rest.astype(numpy.float64))
+        ranks = (num_bits - bit_lengths + 1).astype(numpy.uint8)
+        numpy.maximum.at(self.registers, indexes, ranks)
+
+    def merge(self, other):
+        numpy.maximum(self.registers, other.registers, out=self.registers)
+
+    def estimate(self):
+        num_registers = len(self.registers)
+        alpha = 0.7213 / (1 + 1.079 / num_registers)
+        estimate = alpha * num_registers ** 2 / numpy.sum(numpy.ldexp(1.0, -self.registers.astype(int)))
+        num_zeros = int(numpy.count_nonzero(self.registers == 0))
+        if estimate <= 2.5 * num_registers and num_zeros:
+            # linear counting is more accurate for small cardinalities
+            estimate = num_registers * math.log(num_registers / float(num_zeros))
+        return int(round(estimate))
+
+
+class QuantileSketch(object):
+    """
+    KLL sketch of a numeric column. compactors alternate between keeping the odd and even items instead of
+    flipping a coin, so that results don't depend on the order in which partitions are scheduled
+    """
+    SUMMARY_QUANTILES = (0.05, 0.25, 0.5, 0.75, 0.95)
+
+    def __init__(self, k=200):
+        self.k = k
+        self.count = 0
+        self.levels = [numpy.empty(0)]
+        self.num_compactions = [0]
+
+    def __eq__(self, other):
+        return (isinstance(other, QuantileSketch) and self.count == other.count and
+                len(self.levels) == len(other.levels) and
+                all(numpy.array_equal(a, b) for a, b in zip(self.levels, other.levels)))
+
+    def __ne__(self, other):
+        return not self == other
+
+    def __repr__(self):
+        return '<QuantileSketch count:%s>' % self.count
+
+    def get_capacity(self, level):
+        depth = len(self.levels) - level - 1
+        return max(int(math.ceil(self.k * (2 / 3.0) ** depth)), 2)
+
+    def add(self, obj):
+        self.update([obj])
+
+    def update(self, values):
+        values = numpy.asarray(values, dtype=numpy.float64)
+        self.levels[0] = numpy.concatenate([self.levels[0], values])
+        self.count += len(values)
+        self.compress()
+
+    def merge(self, other):
+        for level, items in enumerate(other.levels):
+            if level == len(self.levels):
+                self.levels.append(numpy.empty(0))
+                self.num_compactions.append(0)
+            self.levels[level] = numpy.concatenate([self.levels[level], items])
+        self.count += other.count
+        self.compress()
+
+    def compress(self):
+        level = 0
+        while level < len(self.levels):
+            items = self.levels[level]
+            if len(items) > self.get_capacity(level):
+                if level + 1 == len(self.levels):
+                    self.levels.append(numpy.empty(0))
+                    self.num_compactions.append(0)
+                items = numpy.sort(items)
+                # an odd item out stays at this level
+                kept, items = items[len(items) - len(items) % 2:], items[:len(items) - len(items) % 2]
+                offset = self.num_compactions[level] % 2
+                self.num_compactions[level] += 1
+                self.levels[level] = kept
+                self.levels[level + 1] = numpy.concatenate([self.levels[level + 1], items[offset::2]])
+            level += 1
+
+    def quantiles(self, quantiles):
+        if not self.count:
+            return [None] * len(quantiles)
+        items = numpy.concatenate(self.levels)
+        weights = numpy.concatenate([numpy.full(len(level_items), 2 ** level, dtype=numpy.float64)
+                                     for level, level_items in enumerate(self.levels)])
+        order = numpy.argsort(items, kind='mergesort')
+        items, cumulative_weights = items[order], numpy.cumsum(weights[order])
+        indexes = numpy.searchsorted(cumulative_weights, numpy.asarray(quantiles) * cumulative_weights[-1])
+        return [float(items[min(idx, len(items) - 1)]) for idx in indexes]
+
+    def quantile(self, quantile):
+        return self.quantiles([quantile])[0]
+
+    def summary(self):
+        return self.quantiles(self.SUMMARY_QUANTILES)
+
+
+class HeavyHitters(object):
+    """
+    mergeable Misra-Gries (aka Space-Saving) summary of the most frequent values, which unlike `choices` is kept
+    for columns of any cardinality. counts are underestimated by at most total / (size + 1)
+    """
+    def __init__(self, size=50):
+        self.size = size
+        self.counts = Counter()
+
+    def __eq__(self, other):
+        self.prune()
+        if isinstance(other, HeavyHitters):
+            other.prune()
+        return isinstance(other, HeavyHitters) and self.size == other.size and self.counts == other.counts
+
+    def __ne__(self, other):
+        return not self == other
+
+    def __repr__(self):
+        return '<HeavyHitters %s>' % self.top()
+
+    def __len__(self):
+        return len(self.counts)
+
+    def add(self, obj):
+        self.counts[obj] += 1
+        # pruning is amortized over `size` additions
+        if len(self.counts) > 2 * self.size:
+            self.prune()
+
+    def update(self, counts):
+        for value, count in counts.items():
+            self.counts[value] += count
+        self.prune()
+
+    def merge(self, other):
+        self.update(other.counts)
+
+    def prune(self):
+        if len(self.counts) <= self.size:
+            return
+        threshold = sorted(self.counts.values(), reverse=True)[self.size]
+        self.counts = Counter(dict((value, count - threshold) for value, count in self.counts.items()
+                                   if count > threshold))
+
+    def top(self, k=10):
+        self.prune()
+        return sorted(self.counts.items(), key=lambda item: (-item[1], item[0]))[:k]
+
+
+class Histogram(object):
+    """
+    adaptive histogram of at most `max_bins` (centroid, count) bins, merged by joining the closest bins
+    (Ben-Haim & Tom-Tov)
+    """
+    def __init__(self, max_bins=20):
+        self.max_bins = max_bins
+        self.centroids = numpy.empty(0)
+        self.counts = numpy.empty(0)
+
+    def __eq__(self, other):
+        if not isinstance(other, Histogram):
+            return False
+        return self.bins() == other.bins()
+
+    def __ne__(self, other):
+        return not self == other
+
+    def __repr__(self):
+        return '<Histogram %s>' % self.bins()
+
+    def add(self, obj):
+        self.add_bins(numpy.asarray([obj], dtype=numpy.float64), numpy.ones(1), lazy=True)
+
+    def update(self, values):
+        values = numpy.asarray(values, dtype=numpy.float64)
+        if not len(values):
+            return
+        counts, edges = numpy.histogram(values, bins=self.max_bins)
+        sums, _ = numpy.histogram(values, bins=edges, weights=values)
+        non_empty = counts > 0
+        self.add_bins(sums[non_empty] / counts[non_empty], counts[non_empty].astype(numpy.float64))
+
+    def merge(self, other):
+        self.add_bins(other.centroids, other.counts)
+
+    def add_bins(self, centroids, counts, lazy=False):
+        centroids = numpy.concatenate([self.centroids, centroids])
+        counts = numpy.concatenate([self.counts, counts])
+        order = numpy.argsort(centroids, kind='mergesort')
+        self.centroids, self.counts = centroids[order], counts[order]
+        # single values are compressed once there are enough of them
+        if len(self.centroids) > (2 * self.max_bins if lazy else self.max_bins):
+            self.compress()
+
+    def compress(self):
+        centroids, counts = list(self.centroids), list(self.counts)
+        while len(centroids) > self.max_bins:
+            idx = int(numpy.argmin(numpy.diff(centroids)))
+            count = counts[idx] + counts[idx + 1]
+            centroids[idx] = (centroids[idx] * counts[idx] + centroids[idx + 1] * counts[idx + 1]) / count
+            counts[idx] = count
+            del centroids[idx + 1], counts[idx + 1]
+        self.centroids, self.counts = numpy.asarray(centroids), numpy.asarray(counts)
+
+    def bins(self):
+        if len(self.centroids) > self.max_bins:
+            self.compress()
+        return [(float(c), int(n)) for c, n in zip(self.centroids, self.counts)]
+
+
+class NumericProfile(object):
+    """
+    count, min/max, mean and variance (Welford for single values, Chan et al. to merge partitions), the number of
+    zero, negative and NaN values and a histogram of a numeric field. NaNs are only counted
+    """
+    def __init__(self):
+        self.count = 0
+        self.min_value = None
+        self.max_value = None
+        self.mean = 0.0
+        self.m2 = 0.0
+        self.num_zero = 0
+        self.num_negative = 0
+        self.num_nan = 0
+        self.histogram = Histogram()
+
+    def __eq__(self, other):
+        return isinstance(other, NumericProfile) and self.__dict__ == other.__dict__
+
+    def __ne__(self, other):
+        return not self == other
+
+    def __repr__(self):
+        return '<NumericProfile %s>' % self.get_stats()
+
+    def add(self, obj):
+        if obj != obj:
+            self.num_nan += 1
+            return
+        self.count += 1
+        delta = obj - self.mean
+        self.mean += delta / float(self.count)
+        self.m2 += delta * (obj - self.mean)
+        self.min_value = obj if self.min_value is None else min(self.min_value, obj)
+        self.max_value = obj if self.max_value is None else max(self.max_value, obj)
+        self.num_zero += obj == 0
+        self.num_negative += obj < 0
+        self.histogram.add(obj)
+
+    def update(self, values):
+        """
+        profiles an array of values in one vectorized pass
+        """
+        values = numpy.asarray(values)
+        if values.dtype.kind not in 'iuf':
+            values = values.astype(numpy.float64)
+        if values.dtype.kind == 'f':
+            nan_mask = numpy.isnan(values)
+            self.num_nan += int(nan_mask.sum())
+            values = values[~nan_mask]
+        if not len(values):
+            return
+        other = NumericProfile()
+        other.count = len(values)
+        other.min_value = values.min().item()
+        other.max_value = values.max().item()
+        other.mean = float(values.mean())
+        other.m2 = float(((values - other.mean) ** 2).sum())
+        other.num_zero = int((values == 0).sum())
+        other.num_negative = int((values < 0).sum())
+        other.histogram.update(values)
+        self.merge(other)
+
+    def merge(self, other):
+        self.num_nan += other.num_nan
+        self.histogram.merge(other.histogram)
+        if not other.count:
+            return
+        count = self.count + other.count
+        delta = other.mean - self.mean
+        self.mean += delta * other.count / float(count)
+        self.m2 += other.m2 + delta ** 2 * self.count * other.count / float(count)
+        self.count = count
+        self.min_value = other.min_value if self.min_value is None else min(self.min_value, other.min_value)
+        self.max_value = other.max_value if self.max_value is None else max(self.max_value, other.max_value)
+        self.num_zero += other.num_zero
+        self.num_negative += other.num_negative
+
+    @property
+    def variance(self):
+        # sample variance, like pandas
+        return self.m2 / (self.count - 1) if self.count > 1 else None
+
+    def get_stats(self):
+        variance = self.variance
+        return {
+            'total': self.count,
+            'min_value': self.min_value,
+            'max_value': self.max_value,
+            'mean_value': self.mean if self.count else None,
+            'std_value': math.sqrt(variance) if variance is not None else None,
+            'num_zero': self.num_zero,
+            'num_negative': self.num_negative,
+            'num_nan': self.num_nan,
+        }
@@ -12,3 +12,878 @@ class CheckUtils(TestCase):
             pass
 
         inject_base(Q, W)
+
+
+class CheckSchemaRegistry(TestCase):
+    def test_fingerprint_staleness(self):
+        from sqlalchemy import create_engine
+        from aragog.registry import SchemaRegistry, get_fingerprint
+
+        registry = SchemaRegistry(create_engine('sqlite://'))
+        config = {'type': 'csv', 'name': 'Q', 'params': {'path': 'q.csv'}}
+        fingerprint = get_fingerprint(config)
+        registry.save('Q', fingerprint, {'properties': {}}, {}, {'db_table': 'q'})
+        self.assertEqual(registry.get('Q', fingerprint)['schema'], {'properties': {}})
+
+        config['params']['path'] = 'w.csv'
+        self.assertIsNone(registry.get('Q', get_fingerprint(config)))
+
+
+class CheckTypeDetection(TestCase):
+    def test_columnar_schema_matches_row_schema(self):
+        import pandas as pd
+        from aragog.type_detection import get_schema_for_data, get_schema_for_dataframe
+        from aragog.utils import get_dicts_pandas
+
+        df = pd.DataFrame({
+            'name': ['a', None, 'b', ''],
+            'count': ['1', '2', None, '4'],
+            'score': [1.5, 2.0, 3.0, 4.0],
+            'flag': [True, False, True, True],
+        })
+        columnar = get_schema_for_dataframe(df)
+        row_wise = get_schema_for_data(get_dicts_pandas(df))
+        self.assertEqual(columnar['total'], row_wise['total'])
+        self.assertEqual(columnar['required'], row_wise['required'])
+        for field in ('name', 'count', 'score', 'flag'):
+            self.assertEqual(columnar['properties'][field].get('type'), row_wise['properties'][field].get('type'))
+        count = [s for s in columnar['properties']['count']['anyOf'] if s['type'] == 'integer'][0]
+        self.assertEqual((count['min_value'], count['max_value'], count['total']), (1, 4, 3))
+        self.assertEqual(columnar['properties']['name']['anyOf'][1], {'type': 'null', 'num_null': 2})
+
+
+    def test_numeric_profiles_merge_exactly(self):
+        import numpy
+        import pandas as pd
+        from aragog.type_detection import get_schema_for_dataframe, merge_schemas
+
+        values = numpy.random.RandomState(0).normal(1e9, 1, 1000)
+        values[::10] = numpy.nan
+        values[[1, 2]] = [0, -1]
+        df = pd.DataFrame({'x': values})
+        chunks = numpy.array_split(df, 4)
+        schema = merge_schemas([get_schema_for_dataframe(c) for c in chunks])
+        x = schema['properties']['x']
+        self.assertEqual((x['min_value'], x['max_value']), (-1, df['x'].max()))
+        self.assertAlmostEqual(x['mean_value'], df['x'].mean(), places=3)
+        self.assertAlmostEqual(x['std_value'], df['x'].std(), places=3)
+        self.assertEqual((x['num_zero'], x['num_negative'], x['num_nan'], x['num_null']), (1, 1, 100, 100))
+        self.assertEqual(sum(count for _, count in x['profile'].histogram.bins()), 900)
+
+        # merged schemas can be merged again
+        halves = [merge_schemas([get_schema_for_dataframe(c) for c in chunks[:2]]),
+                  merge_schemas([get_schema_for_dataframe(c) for c in chunks[2:]])]
+        merged = merge_schemas(halves)['properties']['x']
+        for key in ('total', 'num_null', 'min_value', 'max_value', 'num_zero', 'num_negative', 'num_nan'):
+            self.assertEqual(merged[key], x[key])
+        self.assertAlmostEqual(merged['std_value'], x['std_value'], places=3)
+
+
+    def test_strings_are_coerced_to_native_types(self):
+        import datetime
+        import pandas as pd
+        from django.test import override_settings
+        from aragog.coercion import coerce_dataframe, get_coercions
+        from aragog.type_detection import get_schema_for_dataframe, merge_schemas
+
+        df = pd.DataFrame({
+            'day': ['2020-01-%02d' % i for i in range(1, 9)],
+            'at': ['2020-01-01T10:00:%02d' % i for i in range(8)],
+            'us_day': ['01/%02d/2020' % i for i in range(13, 21)],
+            'flag': ['yes', 'No', 'y', 'n', None, 'YES', 'no', 'yes'],
+            'count': ['1', '2', None, '4', '', '6', '7', '8'],
+            'mixed': ['2020-01-01', '2020-01-02', '2020-01-03', '2020-01-04', '1', '2', '3', '4'],
+        })
+        schema = merge_schemas([get_schema_for_dataframe(df.iloc[:4]), get_schema_for_dataframe(df.iloc[4:])])
+        fields = schema['properties']
+        self.assertEqual(dict((f, fields[f]['type']) for f in fields), {
+            'day': 'date', 'at': 'datetime', 'us_day': 'date', 'flag': 'boolean', 'count': 'integer',
+            'mixed': 'string'})
+        self.assertEqual((fields['us_day']['format'], fields['flag']['num_null']), ('%m/%d/%Y', 1))
+
+        coerced = coerce_dataframe(df, get_coercions(schema))
+        self.assertEqual(coerced['day'][0], datetime.date(2020, 1, 1))
+        self.assertEqual(coerced['us_day'][7], datetime.date(2020, 1, 20))
+        self.assertEqual(coerced['at'].dtype.kind, 'M')
+        self.assertEqual(coerced['flag'].tolist(), [True, False, True, False, None, True, False, True])
+        self.assertEqual(coerced['count'].tolist(), [1, 2, None, 4, None, 6, 7, 8])
+        self.assertEqual(coerced['mixed'].tolist(), df['mixed'].tolist())
+
+        with override_settings(TYPE_DETECTION_MIN_PARSE_RATE=0.5):
+            mixed = get_schema_for_dataframe(df[['mixed']].iloc[2:])['properties']['mixed']
+        self.assertEqual([s['type'] for s in mixed['anyOf']], ['integer', 'null'])
+        self.assertEqual(mixed['anyOf'][1]['num_null'], 2)
+
+    def test_date_formats_are_detected_per_column_and_ambiguous_ones_left_as_strings(self):
+        import datetime
+        import pandas as pd
+        from aragog.coercion import coerce_dataframe
+        from aragog.type_detection import get_schema_for_dataframe
+
+        def get_field(values):
+            return get_schema_for_dataframe(pd.DataFrame({'day': values}))['properties']['day']
+
+        self.assertEqual(get_field(['02/13/2020', '02/14/2020'])['format'], '%m/%d/%Y')
+        # the same column of another dataset isn't parsed with the format detected above
+        self.assertEqual(get_field(['13/02/2020', '14/02/2020'])['format'], '%d/%m/%Y')
+        self.assertEqual(get_field(['01/02/2020', '03/04/2020'])['type'], 'string')
+        self.assertEqual(get_field(['01/01/2020', '02/02/2020'])['type'], 'date')
+        # partitions are loaded with the format of the schema
+        coerced = coerce_dataframe(pd.DataFrame({'day': ['01/02/2020']}), {'day': ('date', '%d/%m/%Y')})
+        self.assertEqual(coerced['day'][0], datetime.date(2020, 2, 1))
+
+
+class CheckSketches(TestCase):
+    def test_sketches_merge_across_partitions(self):
+        import numpy
+        import pandas as pd
+        from aragog.type_detection import get_schema_for_data, get_schema_for_dataframe, merge_schemas
+        from aragog.utils import get_dicts_pandas
+
+        df = pd.DataFrame({
+            'code': ['c%s' % (i % 1000) for i in range(5000)],
+            'score': numpy.arange(5000) / 10.0,
+            'size': [1] * 2500 + list(range(2500)),
+        })
+        chunks = numpy.array_split(df, 5)
+        schema = merge_schemas([get_schema_for_dataframe(c) for c in chunks])
+        code, score, size = [schema['properties'][field] for field in ('code', 'score', 'size')]
+        self.assertNotIn('choices', code)
+        self.assertAlmostEqual(code['distinct'].estimate(), 1000, delta=50)
+        self.assertAlmostEqual(score['distinct'].estimate(), 5000, delta=250)
+        for estimate, exact in zip(score['quantiles'].summary(), numpy.percentile(df['score'], [5, 25, 50, 75, 95])):
+            self.assertAlmostEqual(estimate, exact, delta=25)
+        self.assertEqual(size['heavy_hitters'].top(1)[0][0], 1)
+        self.assertGreater(size['heavy_hitters'].top(1)[0][1], 2400)
+
+        # rows typed by genson give the same sketches as the columnar path
+        row_wise = merge_schemas([get_schema_for_data(get_dicts_pandas(c)) for c in chunks])
+        self.assertEqual(row_wise['properties']['code']['distinct'], code['distinct'])
+
+
+class CheckProfiling(TestCase):
+    def test_profile_is_computed_in_sql_and_cached_per_version(self):
+        import pandas as pd
+        from django.db import connection
+        from aragog.model_generation import get_model_from_schema
+        from aragog.profiling import get_profile
+        from aragog.type_detection import get_schema_for_dataframe, normalize_schema
+
+        df = pd.DataFrame({'kind': ['a', 'b', 'a', 'c'], 'size': [1, 2, 3, None]})
+        schema = normalize_schema(get_schema_for_dataframe(df))
+        schema['required'] = ['kind']
+        model = get_model_from_schema('ProfileCheck', schema, {'app_label': 'aragog', 'db_table': 'profile_check'})
+        with connection.schema_editor() as editor:
+            editor.create_model(model)
+        model.objects.bulk_create([model(kind=kind, size=None if size != size else size)
+                                   for kind, size in zip(df['kind'], df['size'])])
+
+        profile = get_profile(model, version=1)
+        self.assertEqual(profile['total'], 4)
+        size = profile['fields']['size']
+        self.assertEqual((size['count'], size['fill_rate'], size['min'], size['max'], size['avg']), (3, 75.0, 1, 3, 2))
+        self.assertEqual(profile['fields']['kind']['top'][0], ['a', 2])
+
+        model.objects.filter(kind='a').delete()
+        self.assertEqual(get_profile(model, version=1)['total'], 4)
+        self.assertEqual(get_profile(model, version=2)['total'], 2)
+
+
+class CheckFastAdmin(TestCase):
+    def test_paginator_counts_approximately_and_seeks_deep_pages(self):
+        from django.db import connection
+        from aragog.fast_admin import FastPaginator, get_approximate_count
+        from aragog.model_generation import get_model_from_schema
+
+        schema = {'properties': {'kind': {'type': 'string'}}, 'required': ['kind'], 'total': 95}
+        model = get_model_from_schema('FastAdminCheck', schema, {'app_label': 'aragog', 'db_table': 'fast_admin_check'})
+        with connection.schema_editor() as editor:
+            editor.create_model(model)
+        model.objects.bulk_create([model(id=i, kind='ab'[i % 2]) for i in range(1, 101)])
+        self.assertEqual(get_approximate_count(model, 'statistics'), 100)
+        self.assertEqual(get_approximate_count(model, 'metadata'), 95)
+
+        queryset = model.objects.order_by('-pk')
+        paginator = FastPaginator(queryset, 10, approximate_count=lambda: 95, keyset_after_page=2)
+        self.assertEqual(paginator.count, 95)
+        self.assertEqual(FastPaginator(queryset.filter(kind='a'), 10, approximate_count=lambda: 95).count, 50)
+        for number in (1, 3, 9):
+            page = paginator.page(number)
+            self.assertEqual([o.pk for o in page.object_list], list(range(100 - (number - 1) * 10, 90 - (number - 1) * 10, -1)))
+
+
+class CheckSampling(TestCase):
+    def test_reservoir_is_bounded(self):
+        from aragog.sampling import Reservoir
+
+        reservoir = Reservoir(10, random_state=1)
+        self.assertEqual(list(reservoir.tap(range(1000))), list(range(1000)))
+        self.assertEqual(len(reservoir), 10)
+        self.assertEqual(reservoir.seen, 1000)
+
+    def test_verify_widens_sampled_types(self):
+        import dask.dataframe as dd
+        import pandas as pd
+        from aragog.sampling import get_inference_config, infer_schema
+
+        pdf = pd.DataFrame({'code': ['1'] * 50 + ['x'] * 50, 'count': range(100)})
+        df = dd.from_pandas(pdf, npartitions=4)
+        config = get_inference_config({'mode': 'head', 'size': 10})
+        self.assertEqual(infer_schema(df, config)['properties']['code']['type'], 'integer')
+        config['verify'] = True
+        schema = infer_schema(df, config)
+        self.assertEqual(schema['properties']['code']['type'], 'string')
+        self.assertEqual(schema['properties']['count']['type'], 'integer')
+
+    def test_head_only_computes_the_partitions_it_needs(self):
+        import dask
+        import dask.dataframe as dd
+        import pandas as pd
+        from aragog.sampling import head_sample
+
+        def get_part(idx):
+            if idx > 1:
+                raise AssertionError('partition:%s was computed' % idx)
+            return pd.DataFrame({'a': range(idx * 10, idx * 10 + 10)})
+
+        df = dd.from_delayed([dask.delayed(get_part)(idx) for idx in range(5)], meta={'a': 'int64'})
+        self.assertEqual(head_sample(df, 5)['a'].tolist(), list(range(5)))
+        self.assertEqual(head_sample(df, 15)['a'].tolist(), list(range(15)))
+
+    def test_load_profile_keeps_the_sampled_model(self):
+        import dask.dataframe as dd
+        import pandas as pd
+        from aragog.model_generation import get_model_config_from_schema
+        from aragog.sampling import apply_load_profile, get_inference_config, infer_schema
+
+        pdf = pd.DataFrame({'code': ['1'] * 50 + ['x'] * 50, 'count': range(100)})
+        df = dd.from_pandas(pdf, npartitions=4)
+        schema = infer_schema(df, get_inference_config({'mode': 'head', 'size': 10}))
+        profiled = apply_load_profile(schema, infer_schema(df, get_inference_config()))
+        self.assertEqual(get_model_config_from_schema(profiled), get_model_config_from_schema(schema))
+        self.assertEqual(profiled['total'], 100)
+        self.assertEqual(profiled['properties']['count']['max_value'], 99)
+        # the loaded values of code don't fit its sampled type
+        self.assertEqual(profiled['properties']['code'], schema['properties']['code'])
+
+    def test_partition_schemas_are_tree_reduced(self):
+        import dask.dataframe as dd
+        import pandas as pd
+        from aragog.sampling import reduce_schemas
+        from aragog.type_detection import get_schema_for_dataframe, merge_schemas
+
+        def exact(schema):
+            # the numeric profile and the approximate sketches depend on the merge order
+            return dict((field, dict((k, v) for k, v in config.items()
+                                     if k not in ('profile', 'heavy_hitters', 'quantiles', 'std_value')))
+                        for field, config in schema['properties'].items())
+
+        pdf = pd.DataFrame({'kind': ['a', 'b', None, 'c'] * 25, 'count': range(100), 'ratio': [0.5, None] * 50})
+        df = dd.from_pandas(pdf, npartitions=9)
+        expected = merge_schemas(df.map_partitions(get_schema_for_dataframe).compute())
+        for split_every in (2, 3, 100):
+            schema = reduce_schemas(df, split_every)
+            self.assertEqual(exact(schema), exact(expected))
+            self.assertAlmostEqual(schema['properties']['count']['std_value'], pdf['count'].std())
+        # empty partitions have no properties
+        self.assertEqual(reduce_schemas(df[df['count'] < 20], 2)['properties']['count']['max_value'], 19)
+
+class CheckBulkLoader(TestCase):
+    def test_load_assigns_global_ids_and_replaces_table(self):
+        import os
+        import tempfile
+        import dask.dataframe as dd
+        import pandas as pd
+        from sqlalchemy import types
+        from aragog.loader import BulkLoader
+
+        loader = BulkLoader('sqlite:///%s' % os.path.join(tempfile.mkdtemp(), 'test.db'), 'q', {'name': types.Text, 'count': types.BigInteger})
+        df = dd.from_pandas(pd.DataFrame({'name': list('abcdefghij'), 'count': range(10)}), npartitions=3)
+        for _ in range(2):
+            num_rows, _ = loader.load(df)
+            self.assertEqual(num_rows, 10)
+            rows = loader.engine.execute('SELECT id, name FROM q ORDER BY id').fetchall()
+            self.assertEqual([tuple(r) for r in rows], list(zip(range(1, 11), 'abcdefghij')))
+        self.assertFalse(loader.engine.has_table(loader.staging_table_name))
+
+    def test_ingest_engine_is_shared_and_tuned_for_loads(self):
+        import os
+        import tempfile
+        from django.core.exceptions import ImproperlyConfigured
+        from django.test import override_settings
+        from aragog.db import get_database_url, get_engine
+
+        path = os.path.join(tempfile.mkdtemp(), 'test.db')
+        databases = {'default': {'ENGINE': 'django.db.backends.sqlite3', 'NAME': path},
+                     'pg': {'ENGINE': 'django.db.backends.postgresql', 'NAME': 'aragog', 'USER': 'u', 'PASSWORD': 'p',
+                            'HOST': 'db', 'PORT': 5433},
+                     'oracle': {'ENGINE': 'django.db.backends.oracle', 'NAME': 'aragog'}}
+        with override_settings(DATABASES=databases, INGEST_DATABASE_URL=None):
+            self.assertEqual(get_database_url(), 'sqlite:///%s' % path)
+            with override_settings(INGEST_DATABASE='pg'):
+                self.assertEqual(get_database_url(), 'postgresql://u:p@db:5433/aragog')
+            with override_settings(INGEST_DATABASE='oracle'):
+                self.assertRaises(ImproperlyConfigured, get_database_url)
+            with override_settings(INGEST_DATABASE_URL='sqlite://'):
+                self.assertEqual(get_database_url(), 'sqlite://')
+
+        engine = get_engine('sqlite:///%s' % path)
+        self.assertIs(get_engine('sqlite:///%s' % path), engine)
+        bulk_engine = get_engine('sqlite:///%s' % path, bulk=True)
+        with engine.connect() as conn, bulk_engine.connect() as bulk_conn:
+            self.assertEqual(conn.execute('PRAGMA journal_mode').scalar(), 'wal')
+            self.assertEqual(conn.execute('PRAGMA synchronous').scalar(), 2)
+            self.assertEqual(bulk_conn.execute('PRAGMA synchronous').scalar(), 0)
+            self.assertEqual(bulk_conn.execute('PRAGMA mmap_size').scalar(), 1024 ** 3)
+
+    def test_upsert_updates_rows_in_place(self):
+        import os
+        import tempfile
+        import dask.dataframe as dd
+        import pandas as pd
+        from sqlalchemy import types
+        from aragog.loader import BulkLoader
+
+        loader = BulkLoader('sqlite:///%s' % os.path.join(tempfile.mkdtemp(), 'test.db'), 'q', {'key': types.BigInteger, 'name': types.Text})
+        loader.load(dd.from_pandas(pd.DataFrame({'key': [1, 2, 3], 'name': list('abc')}), npartitions=2))
+        delta = pd.DataFrame({'key': [2, 4, 4], 'name': ['B', 'd', 'D']})
+        num_rows, _ = loader.upsert(dd.from_pandas(delta, npartitions=2), 'key')
+        self.assertEqual(num_rows, 3)
+        rows = loader.engine.execute('SELECT id, key, name FROM q ORDER BY id').fetchall()
+        self.assertEqual([tuple(r) for r in rows], [(1, 1, 'a'), (2, 2, 'B'), (3, 3, 'c'), (6, 4, 'D')])
+        self.assertFalse(loader.engine.has_table(loader.staging_table_name))
+
+
+    def test_indexes_are_created_from_config_and_schema(self):
+        import os
+        import tempfile
+        import dask.dataframe as dd
+        import pandas as pd
+        from sqlalchemy import inspect, types
+        from aragog.loader import BulkLoader
+        from aragog.model_generation import get_index_name, get_meta_indexes
+        from aragog.models import Dataset, get_index_columns
+
+        ds = Dataset('csv', {}, name='Q', admin={'list_filter': ['kind'], 'ordering': ['-size', 'id']},
+                     indexes=[['kind', 'size'], 'name'])
+        schema = {'properties': {'name': {'type': 'string'}, 'kind': {'type': 'string', 'choices': {'a': 2}},
+                                 'size': {'type': 'integer'}, 'flag': {'type': 'boolean', 'choices': {True: 2}}}}
+        indexes = get_index_columns(ds, schema)
+        self.assertEqual(indexes, [('kind', 'size'), ('name',), ('kind',), ('size',), ('flag',)])
+        self.assertTrue(all(len(index.name) <= 30 for index in get_meta_indexes('q', indexes)))
+
+        loader = BulkLoader('sqlite:///%s' % os.path.join(tempfile.mkdtemp(), 'test.db'), 'q',
+                            {'name': types.Text, 'kind': types.Text, 'size': types.BigInteger, 'flag': types.Boolean})
+        loader.load(dd.from_pandas(pd.DataFrame({'name': ['x', 'y'], 'kind': ['a', 'a'], 'size': [1, 2],
+                                                 'flag': [True, True]}), npartitions=1))
+        for _ in range(2):
+            loader.create_indexes([(get_index_name('q', columns), columns) for columns in indexes])
+        created = dict((index['name'], tuple(index['column_names'])) for index in inspect(loader.engine).get_indexes('q'))
+        self.assertEqual(sorted(created.values()), sorted(indexes))
+
+
+class CheckMaterialization(TestCase):
+    def test_sources_are_materialized_per_fingerprint_and_evicted(self):
+        import os
+        import tempfile
+        from django.test import override_settings
+        from aragog.materialization import MaterializationCache
+        from aragog.models import Dataset
+
+        tmp_dir = tempfile.mkdtemp()
+        path = os.path.join(tmp_dir, 'source.csv')
+        with open(path, 'w') as source_file:
+            source_file.write('name,count\na,1\nb,2\n')
+        cache_dir = os.path.join(tmp_dir, 'cache')
+        with override_settings(MATERIALIZATION_CACHE_DIR=cache_dir, MATERIALIZATION_CACHE_MAX_SIZE=None):
+            ds = Dataset('csv', {'path': path, 'columns': ['count'], 'materialize': True}, name='M')
+            key = ds.get_source_fingerprint()
+            self.assertEqual(ds.get_data_frame().compute()['count'].tolist(), [1, 2])
+            cached = MaterializationCache(cache_dir).get(key)
+            self.assertEqual(list(cached.columns), ['count'])
+            self.assertEqual(ds.get_data_frame().compute()['count'].tolist(), [1, 2])
+
+            with open(path, 'a') as source_file:
+                source_file.write('c,3\n')
+            self.assertNotEqual(ds.get_source_fingerprint(), key)
+            self.assertEqual(ds.get_data_frame().compute()['count'].tolist(), [1, 2, 3])
+
+            # the projected read of a `multi` source isn't reused by the standalone dataset
+            source = Dataset('csv', {'path': path, 'materialize': True}, name='S')
+            source.projection = ['count']
+            self.assertEqual(list(source.get_data_frame().columns), ['count'])
+            source.projection = None
+            self.assertEqual(list(source.get_data_frame().columns), ['name', 'count'])
+
+        # only the entry that was just stored fits in the budget
+        cache = MaterializationCache(cache_dir, max_size=1)
+        cache.store('other', cached)
+        self.assertEqual([entry['key'] for entry in cache.get_entries()], ['other'])
+
+
+class CheckJoins(TestCase):
+    def test_join_strategies_give_the_same_rows(self):
+        import dask.dataframe as dd
+        import pandas as pd
+        from aragog.joins import index_by, join_data_frames
+
+        # sorted sources are indexed from the bounds of their partitions
+        df = index_by(dd.from_pandas(pd.DataFrame({'k': range(10)}), npartitions=3, sort=False), 'k', sorted=True)
+        self.assertEqual(df.divisions, (0, 4, 8, 9))
+
+        facts = pd.DataFrame({'user': [i % 7 for i in range(50)], 'day': [i % 3 for i in range(50)],
+                              'amount': range(50)})
+        users = pd.DataFrame({'user': range(5), 'name': ['u%s' % i for i in range(5)]})
+        days = pd.DataFrame({'user': range(7) * 3, 'day': sorted(range(3) * 7), 'weight': range(21)})
+
+        def rows(df):
+            df = df.compute().fillna('-')
+            return sorted(map(tuple, df[sorted(df.columns)].values.tolist()))
+
+        expected = facts.merge(users, on='user', how='left')
+        for broadcast_threshold in (None, 1024 ** 2):
+            for sorted_sources in (False, True):
+                dfs = [dd.from_pandas(df.sort_values('user'), npartitions=3, sort=False) for df in (facts, users)]
+                joined = join_data_frames(dfs, ['user'], how='left', sorted=sorted_sources,
+                                          broadcast_threshold=broadcast_threshold)
+                self.assertEqual(rows(joined), rows(dd.from_pandas(expected, npartitions=1)))
+
+        expected = facts.merge(days, on=['user', 'day'])
+        for broadcast_threshold in (None, 1024 ** 2):
+            dfs = [dd.from_pandas(df, npartitions=3) for df in (facts, days)]
+            joined = join_data_frames(dfs, ['user', 'day'], broadcast_threshold=broadcast_threshold)
+            self.assertEqual(rows(joined), rows(dd.from_pandas(expected, npartitions=1)))
+
+
+class CheckIngestionJobs(TestCase):
+    def test_jobs_are_claimed_once_and_report_progress(self):
+        import dask
+        import dask.dataframe as dd
+        import pandas as pd
+        from sqlalchemy import create_engine
+        from aragog.jobs import FAILED, LOADING, READY, JobQueue
+        from aragog.progress import IngestProgress
+        from aragog.scheduler import scheduler_context
+
+        queue = JobQueue(create_engine('sqlite://'))
+        job_id = queue.enqueue('A')
+        self.assertEqual(queue.enqueue('A'), job_id)
+        other_id = queue.enqueue('B', full=True)
+        job = queue.claim('worker-1')
+        self.assertEqual((job['id'], job['status'], job['worker']), (job_id, LOADING, 'worker-1'))
+        self.assertEqual(queue.claim('worker-2')['id'], other_id)
+        self.assertIsNone(queue.claim('worker-3'))
+
+        reported = []
+        progress = IngestProgress(reported.append, interval=0)
+        df = dd.from_pandas(pd.DataFrame({'a': range(100)}), npartitions=10)
+        with scheduler_context('single-threaded'):
+            with progress.stage('fetch'):
+                pass
+            with progress.stage('infer'):
+                df.a.sum().compute()
+        self.assertEqual(reported[0], 5)
+        self.assertEqual(reported[-1], 40)
+        self.assertGreater(len(reported), 5)
+        self.assertEqual(reported, sorted(set(reported)))
+
+        queue.finish(job_id)
+        queue.fail(other_id, 'Traceback')
+        self.assertNotEqual(queue.enqueue('A'), job_id)
+        latest = queue.get_latest()
+        self.assertEqual(latest['A']['status'], 'pending')
+        self.assertEqual((latest['B']['status'], latest['B']['error']), (FAILED, 'Traceback'))
+        self.assertEqual(queue.get(job_id)['status'], READY)
+
+    def test_stores_are_created_on_first_use(self):
+        import os
+        import shutil
+        import tempfile
+        from django.test import override_settings
+        from aragog import models
+
+        tmp_dir = tempfile.mkdtemp()
+        try:
+            path = os.path.join(tmp_dir, 'ingest.db')
+            with override_settings(INGEST_DATABASE_URL='sqlite:///%s' % path):
+                self.assertFalse(os.path.exists(path))
+                job_queue = models.get_job_queue()
+                self.assertTrue(os.path.exists(path))
+                self.assertIs(models.get_job_queue(), job_queue)
+        finally:
+            shutil.rmtree(tmp_dir)
+
+
+
+    def test_failed_jobs_keep_a_short_error(self):
+        import os
+        import shutil
+        import tempfile
+        from django.test import override_settings
+        from aragog import models
+        from aragog.jobs import FAILED
+
+        tmp_dir = tempfile.mkdtemp()
+        packages_file = os.path.join(tmp_dir, 'packages.yml')
+        with open(packages_file, 'w') as f:
+            f.write('- {name: Missing, type: csv, params: {path: %s}}\n' % os.path.join(tmp_dir, 'missing.csv'))
+        db_url = 'sqlite:///%s' % os.path.join(tmp_dir, 'ingest.db')
+        try:
+            with override_settings(INGEST_DATABASE_URL=db_url, PACKAGES_FILE=packages_file):
+                job_queue = models.get_job_queue()
+                job_queue.enqueue('Missing')
+                self.assertFalse(models.run_ingest_job(job_queue.claim('worker')))
+                job = job_queue.get_latest()['Missing']
+                self.assertEqual(job['status'], FAILED)
+                self.assertNotIn('Traceback', job['error'])
+                self.assertEqual(len(job['error'].splitlines()), 1)
+        finally:
+            shutil.rmtree(tmp_dir)
+
+    def test_ingest_command_runs_pending_jobs(self):
+        import os
+        import shutil
+        import tempfile
+        from django.core.management import call_command
+        from django.test import override_settings
+        from django.utils.six import StringIO
+        from aragog import models
+        from aragog.jobs import READY
+
+        tmp_dir = tempfile.mkdtemp()
+        packages_file = os.path.join(tmp_dir, 'packages.yml')
+        with open(packages_file, 'w') as f:
+            f.write('- {name: Small, type: csv, params: {path: %s}}\n' % os.path.join(tmp_dir, 'small.csv'))
+        with open(os.path.join(tmp_dir, 'small.csv'), 'w') as f:
+            f.write('a,b\n1,x\n2,y\n')
+        db_url = 'sqlite:///%s' % os.path.join(tmp_dir, 'ingest.db')
+        try:
+            with override_settings(INGEST_DATABASE_URL=db_url, PACKAGES_FILE=packages_file):
+                job_queue = models.get_job_queue()
+                job_id = job_queue.enqueue('Small')
+                call_command('ingest', stdout=StringIO())
+                job = job_queue.get(job_id)
+                self.assertEqual(job['status'], READY)
+                self.assertTrue(job['worker'].startswith('ingest:'))
+                self.assertIsNone(job_queue.claim('worker'))
+                self.assertIsNotNone(models.get_registry().get('Small'))
+        finally:
+            shutil.rmtree(tmp_dir)
+
+class CheckModelRegistration(TestCase):
+    def test_models_are_replaced_when_reingested(self):
+        import os
+        import shutil
+        import tempfile
+        from django.apps import apps
+        from django.contrib import admin
+        from django.test import override_settings
+        from aragog import models
+        from aragog.model_generation import get_model_config_from_schema
+
+        tmp_dir = tempfile.mkdtemp()
+        packages_file = os.path.join(tmp_dir, 'packages.yml')
+        with open(packages_file, 'w') as f:
+            f.write('- {name: Refreshed, type: csv, params: {path: x.csv}, admin: {list_display: [name]}}\n')
+        db_url = 'sqlite:///%s' % os.path.join(tmp_dir, 'ingest.db')
+        try:
+            with override_settings(INGEST_DATABASE_URL=db_url, PACKAGES_FILE=packages_file):
+                self.assertEqual(models.register_models(), [])
+                for properties in ({'name': {'type': 'string'}},
+                                   {'name': {'type': 'string'}, 'size': {'type': 'integer'}}):
+                    schema = {'properties': properties, 'required': ['name']}
+                    models.get_registry().save('Refreshed', 'f', schema, get_model_config_from_schema(schema), {})
+                    self.assertEqual(models.register_models(), ['Refreshed'])
+                    self.assertEqual(models.register_models(), [])
+                    model_class = apps.get_model('aragog', 'refreshed')
+                    self.assertEqual(sorted(field.name for field in model_class._meta.fields),
+                                     ['id'] + sorted(properties))
+                    self.assertTrue(admin.site.is_registered(model_class))
+        finally:
+            models.unregister_model('Refreshed')
+            shutil.rmtree(tmp_dir)
+
+class CheckIngestMetrics(TestCase):
+    def test_stages_and_requests_are_recorded_per_run(self):
+        from sqlalchemy import create_engine
+        from aragog.benchmarks.stub_server import StubAPIServer, make_records
+        from aragog.fetchers.api import DRFFetcher
+        from aragog.metrics import DatabaseSink, IngestMetrics
+
+        sink = DatabaseSink(create_engine('sqlite://'))
+        for run in range(2):
+            metrics = IngestMetrics('A', [sink])
+            with metrics.run():
+                with StubAPIServer(make_records(30), page_size=10) as server:
+                    with metrics.stage('fetch') as metric:
+                        metric['partitions'] = 1
+                        self.assertEqual(len(list(DRFFetcher(server.base_url + '/drf/', metrics=metrics))), 30)
+                with metrics.stage('load') as metric:
+                    metric['rows'] = 30
+        with IngestMetrics('B', [sink]).stage('fetch'):
+            pass
+        self.assertEqual(len(sink.get_runs()), 3)
+
+        runs = sink.get_runs(dataset='A')
+        self.assertEqual(len(runs), 2)
+        self.assertEqual(runs[0]['run_id'], metrics.run_id)
+        stages = dict((stage['stage'], stage) for stage in runs[0]['stages'])
+        self.assertEqual(sorted(stages), ['fetch', 'load', 'total'])
+        self.assertEqual((stages['fetch']['http_requests'], stages['fetch']['http_retries']), (3, 0))
+        self.assertGreater(stages['fetch']['bytes'], 0)
+        self.assertEqual(stages['load']['http_requests'], 0)
+        total = stages['total']
+        self.assertEqual((total['rows'], total['partitions'], total['http_requests']), (30, 1, 3))
+        self.assertEqual(total['bytes'], stages['fetch']['bytes'])
+        self.assertGreaterEqual(total['wall_time'], stages['fetch']['wall_time'] + stages['load']['wall_time'])
+        self.assertGreater(total['peak_rss'], 0)
+
+
+class CheckIngestScheduler(TestCase):
+    def test_datasets_run_concurrently_after_their_dependencies(self):
+        import threading
+        import time
+        from django.core.exceptions import ImproperlyConfigured
+        from aragog.ingest_scheduler import (FAILED, SKIPPED, SUCCEEDED, DatasetScheduler,
+                                             resolve_source_references)
+
+        def api(name, host):
+            return {'name': name, 'type': 'api_generic', 'params': {'url': 'http://%s/%s' % (host, name)}}
+
+        configs = resolve_source_references([
+            {'name': 'Joined', 'type': 'multi', 'params': {'sources': ['A', 'B'], 'join_params': {'on': 'k'}}},
+            api('A', 'a.com'), api('B', 'b.com'), api('C', 'a.com'), api('D', 'a.com'), api('E', 'e.com'),
+        ])
+        self.assertEqual(configs[0]['params']['sources'][0], api('A', 'a.com'))
+        lock = threading.Lock()
+        running = set()
+        max_running = {}
+        order = []
+
+        def ingest(config):
+            with lock:
+                running.add(config['name'])
+                order.append(config['name'])
+                max_running['all'] = max(max_running.get('all', 0), len(running))
+                on_a = len([name for name in running if name in ('A', 'C', 'D')])
+                max_running['a.com'] = max(max_running.get('a.com', 0), on_a)
+            time.sleep(0.05)
+            with lock:
+                running.remove(config['name'])
+            return config['name'] != 'E'
+
+        scheduler = DatasetScheduler(configs, concurrency=4, host_concurrency=2)
+        start = time.time()
+        results = scheduler.run(ingest)
+        self.assertLess(time.time() - start, 0.05 * 4)
+        self.assertEqual(results, {'Joined': SUCCEEDED, 'A': SUCCEEDED, 'B': SUCCEEDED, 'C': SUCCEEDED,
+                                   'D': SUCCEEDED, 'E': FAILED})
+        self.assertGreater(order.index('Joined'), max(order.index('A'), order.index('B')))
+        self.assertEqual(max_running, {'all': 4, 'a.com': 2})
+
+        configs[1] = dict(configs[1], params={'url': 'http://a.com/A', 'fail': True})
+        results = DatasetScheduler(configs).run(lambda config: 'fail' not in config['params'])
+        self.assertEqual((results['A'], results['Joined']), (FAILED, SKIPPED))
+
+        with self.assertRaises(ImproperlyConfigured):
+            resolve_source_references([{'name': 'A', 'type': 'multi', 'params': {'sources': ['A']}}])
+
+
+class CheckSchedulers(TestCase):
+    def get_results(self, db_url, df):
+        from aragog.loader import BulkLoader
+        from aragog.model_generation import get_sqla_schema_from_schema
+        from aragog.sampling import get_inference_config, infer_schema
+        from aragog.type_detection import merge_schemas
+
+        schema = infer_schema(df, get_inference_config())
+        loader = BulkLoader(db_url, 'q', get_sqla_schema_from_schema(schema))
+        num_rows, schemas = loader.load(df, profile=True)
+        rows = loader.engine.execute('SELECT * FROM q ORDER BY id').fetchall()
+        return schema, merge_schemas(schemas), num_rows, [tuple(r) for r in rows]
+
+    def test_results_are_identical_across_schedulers(self):
+        import os
+        import tempfile
+        import dask.dataframe as dd
+        import pandas as pd
+        from aragog.scheduler import scheduler_context
+
+        pdf = pd.DataFrame({
+            'name': ['a', 'b', None, 'c'] * 25,
+            'count': [str(i) for i in range(100)],
+            'score': [i / 3.0 for i in range(100)],
+        })
+        df = dd.from_pandas(pdf, npartitions=4)
+        schedulers = ['single-threaded', 'threads', 'processes']
+        try:
+            import dask.distributed
+            schedulers.append('distributed')
+        except ImportError:
+            pass
+
+        results = {}
+        for scheduler in schedulers:
+            db_url = 'sqlite:///%s' % os.path.join(tempfile.mkdtemp(), 'test.db')
+            with scheduler_context(scheduler, num_workers=2):
+                results[scheduler] = self.get_results(db_url, df)
+        for scheduler in schedulers[1:]:
+            self.assertEqual(results[scheduler], results['single-threaded'], scheduler)
+
+
+class CheckFetchers(TestCase):
+    def test_concurrent_drf_fetch_keeps_order(self):
+        from aragog.benchmarks.stub_server import StubAPIServer, make_records
+        from aragog.fetchers.api import DRFFetcher
+
+        records = make_records(95)
+        for pagination in ('page', 'limit_offset'):
+            with StubAPIServer(records, page_size=10, pagination=pagination) as server:
+                url = server.base_url + '/drf/'
+                self.assertEqual(list(DRFFetcher(url)), records)
+                self.assertEqual(list(DRFFetcher(url, concurrency=4)), records)
+
+    def test_generic_fetch_is_partitioned_once(self):
+        from aragog.benchmarks.stub_server import StubAPIServer, make_records
+        from aragog.fetchers.api import GenericAPIFetcher
+        from aragog.partitions import PartitionBuilder
+
+        records = make_records(25)
+        with StubAPIServer(records) as server:
+            df = PartitionBuilder(partition_size=10).get_data_frame(GenericAPIFetcher(server.base_url + '/generic/'))
+            self.assertEqual(server.num_requests, 1)
+        self.assertEqual(df.compute().to_dict('records'), records)
+
+    def test_columns_are_projected_at_the_source(self):
+        import os
+        import tempfile
+        from aragog.benchmarks.stub_server import StubAPIServer, make_records
+        from aragog.fetchers.api import DRFFetcher
+        from aragog.models import Dataset
+
+        path = os.path.join(tempfile.mkdtemp(), 'wide.csv')
+        with open(path, 'w') as source_file:
+            source_file.write('a,b,c\n1,x,2.5\n2,y,3.5\n')
+        ds = Dataset('csv', {'path': path, 'columns': ['c', 'a', 'missing']}, name='W')
+        self.assertEqual(sorted(ds.get_reader_params()), ['usecols'])
+        self.assertEqual(ds.get_data_frame().compute().to_dict('records'), [{'a': 1, 'c': 2.5}, {'a': 2, 'c': 3.5}])
+
+        # sources of a multi dataset only read the columns it keeps and its join keys
+        source = Dataset('csv', {'path': path})
+        source.projection = Dataset('multi', {'columns': ['b']}).get_columns(keep=['a'])
+        self.assertEqual(list(source.read_source().columns), ['a', 'b'])
+
+        records = make_records(25)
+        with StubAPIServer(records, page_size=10) as server:
+            ds = Dataset('api_drf', {'url': server.base_url + '/drf/', 'columns': ['name'], 'fields_param': 'fields'})
+            fetcher = DRFFetcher(**ds.get_fetcher_params())
+            self.assertIn('fields=name', fetcher.url)
+            self.assertEqual(list(fetcher), [{'name': r['name']} for r in records])
+            # the keys are dropped by the fetcher when the API returns all of them
+            fetcher = DRFFetcher(server.base_url + '/drf/', fields=['value', 'id'])
+            self.assertEqual(list(fetcher), [{'id': r['id'], 'value': r['value']} for r in records])
+
+
+class CheckPartitionBuilder(TestCase):
+    def test_records_are_streamed_into_partitions(self):
+        from aragog.partitions import PartitionBuilder
+
+        records = [{'name': 'name-%s' % i, 'value': i} for i in range(25)]
+        for spill in (False, True):
+            builder = PartitionBuilder(partition_size=10, spill=spill)
+            df = builder.get_data_frame(iter(records))
+            self.assertEqual(df.npartitions, 3)
+            self.assertEqual(df.compute().to_dict('records'), records)
+            builder.cleanup()
+
+    def test_response_cache_revalidates_and_replays(self):
+        import tempfile
+        from aragog.benchmarks.stub_server import StubAPIServer, make_records
+        from aragog.fetchers.api import DRFFetcher
+        from aragog.fetchers.cache import CacheMiss, ResponseCache
+
+        cache_dir = tempfile.mkdtemp()
+        records = make_records(50)
+        with StubAPIServer(records, page_size=10) as server:
+            url = server.base_url + '/drf/'
+            self.assertEqual(list(DRFFetcher(url, cache=ResponseCache(cache_dir))), records)
+            self.assertEqual(list(DRFFetcher(url, cache=ResponseCache(cache_dir))), records)
+            self.assertEqual((server.num_requests, server.num_not_modified), (10, 5))
+            self.assertEqual(list(DRFFetcher(url, cache=ResponseCache(cache_dir, ttl=60))), records)
+            self.assertEqual(server.num_requests, 10)
+
+        offline_cache = ResponseCache(cache_dir, offline=True)
+        self.assertEqual(list(DRFFetcher(url, cache=offline_cache)), records)
+        with self.assertRaises(CacheMiss):
+            list(DRFFetcher(url + '?page=6', cache=offline_cache))
+
+        small_cache = ResponseCache(cache_dir, max_size=offline_cache.size / 2)
+        small_cache.evict()
+        self.assertLessEqual(small_cache.size, small_cache.max_size)
+
+
+class CheckBenchmarks(TestCase):
+    def test_generated_frames(self):
+        from aragog.benchmarks.generators import make_frame, to_records
+
+        df = make_frame(1000, 12, type_mix={'int': 1, 'string': 1, 'bool': 1}, null_rate=0.2, cardinality=5)
+        self.assertEqual(df.shape, (1000, 12))
+        self.assertEqual(sorted(set(c.split('_')[0] for c in df.columns)), ['bool', 'int', 'string'])
+        self.assertTrue(all(df[c].nunique() <= 5 for c in df.columns))
+        self.assertAlmostEqual(df.isnull().values.mean(), 0.2, delta=0.05)
+        self.assertTrue(make_frame(1000, 12, seed=1).equals(make_frame(1000, 12, seed=1)))
+        record = to_records(df)[0]
+        self.assertTrue(all(value is None or not isinstance(value, float) for value in record.values()))
+
+    def test_regressions(self):
+        from aragog.benchmarks.pipeline import find_regressions
+
+        def get_results(**stages):
+            return {'results': [{'source': 'csv', 'stages': stages}]}
+
+        baseline = get_results(fetch=1.0, merge_schemas=0.01)
+        self.assertEqual(find_regressions(get_results(fetch=1.2, merge_schemas=0.04), baseline), [])
+        regressions = find_regressions(get_results(fetch=1.5, merge_schemas=0.01), baseline)
+        self.assertEqual([(r['source'], r['stage']) for r in regressions], [('csv', 'fetch')])
+
+
+class CheckMultiTenant(TestCase):
+    def test_provisioning_plan_is_quoted_and_grouped_per_tenant(self):
+        from django.db import connections
+        from aragog.multi_tenant import MAINTENANCE_DB, MultiTenantProvisioner
+
+        provisioner = MultiTenantProvisioner('owner', 'tenants', users=['acme', 'x"; DROP DATABASE tenants; --'],
+                                             create_db=True, dry_run=True)
+        provisioner.provision()
+        self.assertEqual([database for database, _ in provisioner.plan],
+                         [MAINTENANCE_DB, MAINTENANCE_DB, 'tenants', 'tenants', 'tenants'])
+        self.assertEqual(provisioner.plan[0][1], ['CREATE DATABASE "tenants" WITH OWNER = "owner"'])
+        # every tenant is provisioned in a transaction of its own
+        self.assertEqual(len(provisioner.plan[3][1]), 7)
+        self.assertEqual(provisioner.plan[4][1][0],
+                         'CREATE ROLE "x""; DROP DATABASE tenants; --" NOSUPERUSER NOCREATEDB NOCREATEROLE NOINHERIT '
+                         'LOGIN')
+
+        try:
+            connection = provisioner.get_connection('acme')
+            self.assertIs(provisioner.get_connection('acme'), connection)
+            self.assertEqual((connection.settings_dict['NAME'], connection.settings_dict['USER']), ('tenants', 'acme'))
+        finally:
+            del connections.databases['acme']
+
+
+class CheckViews(TestCase):
+    def test_views_are_staff_only(self):
+        from django.contrib.auth.models import AnonymousUser
+        from django.test import RequestFactory
+        from aragog import views
+
+        request = RequestFactory().get('/admin/ingestion/')
+        request.user = AnonymousUser()
+        for view in (views.ingestion, views.ingestion_status, views.metrics, views.metrics_runs):
+            response = view(request)
+            self.assertEqual(response.status_code, 302)
+            self.assertIn('/admin/login/', response['Location'])
+        for view in (views.describe, views.profile):
+            response = view(request, 'unknown')
+            self.assertEqual(response.status_code, 302)
@@ -1,16 +1,20 @@
 from collections import Counter
 import copy
+import functools
 from datetime import date, datetime
 
 from genson import SchemaBuilder, SchemaNode
-from genson.schema.generators import GENERATORS
 from genson.schema.generators.object import Object
 from genson.schema.generators.scalar import Number, Boolean, Null, String
 from genson.schema.generators.base import TypedSchemaGenerator
 import numpy
+import pandas as pd
+from pandas.api.types import infer_dtype
 
+from aragog.coercion import coerce_strings
 from aragog.model_generation import normalize_genson_field_types
-from aragog.utils import get_dicts_pandas, inject_base, merge_counters
+from aragog.sketches import HeavyHitters, HyperLogLog, NumericProfile, QuantileSketch
+from aragog.utils import inject_base, merge_counters
 
 
 def match_object(cls, obj):
@@ -24,6 +28,10 @@ Number.PYTHON_TYPES += (numpy.int64, numpy.float64)
 Boolean.PYTHON_TYPES = (Boolean.PYTHON_TYPE, numpy.bool_)
 Boolean.match_object = classmethod(match_object)
 EMPTY_VALUES = ('', None, [], ())
+SCHEMA_URI = 'http://json-schema.org/schema#'
+SKETCH_KEYWORDS = ('distinct', 'heavy_hitters', 'quantiles')
+STATS_KEYWORDS = ('profile', 'min_value', 'max_value', 'mean_value', 'std_value', 'num_zero', 'num_negative',
+                  'num_nan')
 
 
 class FillRateMixin(object):
@@ -48,29 +56,15 @@ class FillRateMixin(object):
 
 
 class StatsMixin(object):
-    total = 0
-    min_value = None
-    max_value = None
-    mean_value = None
+    """
+    min/max/mean/std, zero/negative/NaN counts and a histogram of a number field, merged exactly across partitions
+    """
+    def __init__(self, *args, **kwargs):
+        super(StatsMixin, self).__init__(*args, **kwargs)
+        self.profile = NumericProfile()
 
     def update_stats(self, obj):
-        new_total = self.total + 1
-        if self.min_value is None:
-            self.min_value = obj
-        else:
-            self.min_value = min(self.min_value, obj)
-
-        if self.max_value is None:
-            self.max_value = obj
-        else:
-            self.max_value = max(self.max_value, obj)
-
-        if self.mean_value is None:
-            self.mean_value = obj
-        else:
-            self.mean_value = ((self.mean_value * self.total) + obj) / new_total
-
-        self.total = new_total
+        self.profile.add(obj)
 
 
 def stats_mixin_add_object(self, return_val, obj):
@@ -80,31 +74,14 @@ def stats_mixin_add_object(self, return_val, obj):
 
 def stats_mixin_to_schema(self, return_val):
     d = return_val
-    d['total'] = self.total
-    d['min_value'] = self.min_value
-    d['max_value'] = self.max_value
-    d['mean_value'] = self.mean_value
+    d.update(self.profile.get_stats())
+    d['profile'] = self.profile
     return d
 
 
 def stats_mixin_add_schema(self, return_val, schema):
-    new_total = self.total + schema['total']
-
-    if self.min_value:
-        self.min_value = max(self.min_value, schema['max_value'])
-    else:
-        self.min_value = schema['min_value']
-
-    if self.max_value:
-        self.max_value = max(self.max_value, schema['max_value'])
-    else:
-        self.max_value = schema['max_value']
-
-    if self.mean_value:
-        self.mean_value = ((self.mean_value * self.total) + (schema['mean_value'] * schema['total'])) / new_total
-    else:
-        self.mean_value = schema['mean_value']
-    self.total = new_total
+    if 'profile' in schema:
+        self.profile.merge(schema['profile'])
     return return_val
 
 
@@ -120,9 +97,12 @@ class ChoicesMixin(object):
         # https://stackoverflow.com/questions/35826912/what-is-a-good-heuristic-to-detect-if-a-column-in-a-pandas-dataframe-is-categori
         if not self.too_many_choices:
             self.choices[obj] += 1
-            if len(self.choices) > self.max_choices:
-                self.choices = set()
-                self.too_many_choices = True
+            self.check_choices()
+
+    def check_choices(self):
+        if len(self.choices) > self.max_choices:
+            self.choices = set()
+            self.too_many_choices = True
 
     def add_object(self, obj):
         super(ChoicesMixin, self).add_object(obj)
@@ -134,12 +114,94 @@ class ChoicesMixin(object):
             d['choices'] = self.choices
         return d
 
-    def add_schema(self, schema):
-        if 'choices' in schema:
+    def merge_choices(self, schema):
+        if 'choices' not in schema:
+            # the choices of one partition are enough to go over `max_choices`
+            self.choices = set()
+            self.too_many_choices = True
+        elif not self.too_many_choices:
             self.choices = merge_counters(self.choices, schema['choices'])
+            self.check_choices()
+
+    def add_schema(self, schema):
+        self.merge_choices(schema)
         return super(ChoicesMixin, self).add_schema(schema)
 
 
+def choices_mixin_add_object(self, return_val, obj):
+    self.add_choice(obj)
+    return return_val
+
+
+def choices_mixin_add_schema(self, return_val, schema):
+    self.merge_choices(schema)
+    return return_val
+
+
+class SketchMixin(object):
+    """
+    distinct count and heavy hitters of a field, which unlike `choices` are kept at any cardinality
+    """
+    def __init__(self, *args, **kwargs):
+        super(SketchMixin, self).__init__(*args, **kwargs)
+        self.distinct = HyperLogLog()
+        self.heavy_hitters = HeavyHitters()
+
+    def update_sketches(self, obj):
+        self.distinct.add(obj)
+        self.heavy_hitters.add(obj)
+
+    def merge_sketches(self, schema):
+        if 'distinct' in schema:
+            self.distinct.merge(schema['distinct'])
+        if 'heavy_hitters' in schema:
+            self.heavy_hitters.merge(schema['heavy_hitters'])
+
+    def add_object(self, obj):
+        super(SketchMixin, self).add_object(obj)
+        self.update_sketches(obj)
+
+    def to_schema(self):
+        d = super(SketchMixin, self).to_schema()
+        d['distinct'] = self.distinct
+        d['heavy_hitters'] = self.heavy_hitters
+        return d
+
+    def add_schema(self, schema):
+        self.merge_sketches(schema)
+        return super(SketchMixin, self).add_schema(schema)
+
+
+class NumericSketchMixin(SketchMixin):
+    def __init__(self, *args, **kwargs):
+        super(NumericSketchMixin, self).__init__(*args, **kwargs)
+        self.quantiles = QuantileSketch()
+
+    def update_sketches(self, obj):
+        super(NumericSketchMixin, self).update_sketches(obj)
+        self.quantiles.add(obj)
+
+    def merge_sketches(self, schema):
+        super(NumericSketchMixin, self).merge_sketches(schema)
+        if 'quantiles' in schema:
+            self.quantiles.merge(schema['quantiles'])
+
+    def to_schema(self):
+        d = super(NumericSketchMixin, self).to_schema()
+        d['quantiles'] = self.quantiles
+        return d
+
+
+def sketch_mixin_add_object(self, return_val, obj):
+    self.update_sketches(obj)
+    return return_val
+
+
+def sketch_mixin_add_schema(self, return_val, schema):
+    self.merge_sketches(schema)
+    return return_val
+
+
 class TotalMixin(object):
     total = 0
 
@@ -160,7 +222,44 @@ def total_mixin_add_schema(self, return_val, schema):
     return return_val
 
 
+class FormatMixin(object):
+    """
+    format of a date or datetime field. the first one is kept, partitions in another format are converted using
+    their own
+    """
+    format = None
+
+    def add_schema(self, schema):
+        if self.format is None:
+            self.format = schema.get('format')
+        return super(FormatMixin, self).add_schema(schema)
+
+    def to_schema(self):
+        d = super(FormatMixin, self).to_schema()
+        if self.format is not None:
+            d['format'] = self.format
+        return d
+
+
+class Datetime(ChoicesMixin, FormatMixin, TypedSchemaGenerator):
+    JS_TYPE = 'datetime'
+    PYTHON_TYPE = datetime
+    KEYWORDS = ('type', 'choices', 'format')
+
+
+class Date(ChoicesMixin, FormatMixin, TypedSchemaGenerator):
+    JS_TYPE = 'date'
+    PYTHON_TYPE = date
+    KEYWORDS = ('type', 'choices', 'format')
+
+    @classmethod
+    def match_object(cls, obj):
+        # datetimes are dates too
+        return isinstance(obj, date) and not isinstance(obj, datetime)
+
+
 def monkey_patch(klass, old_method, new_method):
+    @functools.wraps(old_method.im_func)
     def wrapper(self, *args, **kwargs):
         results = old_method.im_func(self, *args, **kwargs)
         return new_method(self, results, *args, **kwargs)
@@ -175,43 +274,53 @@ def add_keyword(klass, keyword):
     klass.KEYWORDS = curr
 
 
-inject_base(Object, TotalMixin)
-monkey_patch(Object, Object.add_object, total_mixin_add_object)
-monkey_patch(Object, Object.to_schema, total_mixin_to_schema)
-monkey_patch(Object, Object.add_schema, total_mixin_add_schema)
-# add_keyword(Object, 'total')
-
-inject_base(SchemaNode, TotalMixin)
-monkey_patch(SchemaNode, SchemaNode.add_object, total_mixin_add_object)
-monkey_patch(SchemaNode, SchemaNode.to_schema, total_mixin_to_schema)
-monkey_patch(SchemaNode, SchemaNode.add_schema, total_mixin_add_schema)
-
-inject_base(Null, FillRateMixin)
-# add_keyword(Null, 'num_null')
-
-inject_base(String, ChoicesMixin)
-inject_base(Boolean, ChoicesMixin)
-
-inject_base(Number, ChoicesMixin, StatsMixin)
-monkey_patch(Number, Number.add_object, stats_mixin_add_object)
-monkey_patch(Number, Number.to_schema, stats_mixin_to_schema)
-monkey_patch(Number, Number.add_schema, stats_mixin_add_schema)
-
-
-class Date(TypedSchemaGenerator):
-    """
-    generator for string schemas - works for ascii and unicode strings
-    """
-    JS_TYPE = 'date'
-    PYTHON_TYPE = date
-
-
-class Datetime(TypedSchemaGenerator):
+def patch_genson():
     """
-    generator for string schemas - works for ascii and unicode strings
+    extends the genson generators with the mixins above. this runs whenever the module is imported, which
+    includes dask worker processes unpickling any of its functions, and is a no-op if the patches are applied
     """
-    JS_TYPE = 'datetime'
-    PYTHON_TYPE = datetime
+    if getattr(SchemaNode, 'aragog_patched', False):
+        return
+    inject_base(Object, TotalMixin)
+    monkey_patch(Object, Object.add_object, total_mixin_add_object)
+    monkey_patch(Object, Object.to_schema, total_mixin_to_schema)
+    monkey_patch(Object, Object.add_schema, total_mixin_add_schema)
+    # add_keyword(Object, 'total')
+
+    inject_base(SchemaNode, TotalMixin)
+    monkey_patch(SchemaNode, SchemaNode.add_object, total_mixin_add_object)
+    monkey_patch(SchemaNode, SchemaNode.to_schema, total_mixin_to_schema)
+    monkey_patch(SchemaNode, SchemaNode.add_schema, total_mixin_add_schema)
+
+    inject_base(Null, FillRateMixin)
+    # add_keyword(Null, 'num_null')
+
+    inject_base(String, SketchMixin, ChoicesMixin)
+    inject_base(Boolean, ChoicesMixin)
+
+    # Number overrides add_object/add_schema without calling super, so the mixins are patched in
+    inject_base(Number, NumericSketchMixin, ChoicesMixin, StatsMixin)
+    monkey_patch(Number, Number.add_object, sketch_mixin_add_object)
+    monkey_patch(Number, Number.add_schema, sketch_mixin_add_schema)
+    monkey_patch(Number, Number.add_object, choices_mixin_add_object)
+    monkey_patch(Number, Number.add_schema, choices_mixin_add_schema)
+    # merged by the mixins rather than kept as extra keywords
+    for klass in (String, Boolean, Number):
+        add_keyword(klass, 'choices')
+    for klass in (String, Number):
+        for keyword in SKETCH_KEYWORDS:
+            add_keyword(klass, keyword)
+    for keyword in STATS_KEYWORDS + ('total',):
+        add_keyword(Number, keyword)
+    monkey_patch(Number, Number.add_object, stats_mixin_add_object)
+    monkey_patch(Number, Number.to_schema, stats_mixin_to_schema)
+    monkey_patch(Number, Number.add_schema, stats_mixin_add_schema)
+    # nodes look generators up from their own copy of genson's GENERATORS
+    SchemaNode.generator_classes = (Datetime, Date) + tuple(SchemaNode.generator_classes)
+    SchemaNode.aragog_patched = True
+
+
+patch_genson()
 
 
 def typecast(v):
@@ -254,19 +363,202 @@ def normalize_schema(schema):
             for _field_type in field_types:
                 if _field_type.get('choices'):
                     field_config['choices'] = dict(_field_type['choices'])
+                if _field_type['type'] == field_type:
+                    field_config.update((k, _field_type[k]) for k in SKETCH_KEYWORDS + STATS_KEYWORDS + ('format',)
+                                        if k in _field_type)
+                elif _field_type['type'] == 'null':
+                    field_config['num_null'] = _field_type['num_null']
+    return schema
+
+
+def denormalize_schema(schema):
+    """
+    splits the null count of nullable fields back out of their type so that a normalized schema can be merged
+    """
+    schema = dict(schema, properties=dict(schema['properties']))
+    for field, field_config in schema['properties'].items():
+        if field_config.get('num_null') and field_config.get('type') not in (None, 'null'):
+            typed = dict((k, v) for k, v in field_config.items() if k not in ('num_null', 'total'))
+            schema['properties'][field] = {
+                'anyOf': [typed, {'type': 'null', 'num_null': field_config['num_null']}],
+                'total': field_config['total'],
+            }
     return schema
 
 
 def merge_schemas(schemas):
+    # empty partitions (eg: filtered out) have no properties to merge
+    schemas = [schema for schema in schemas if 'properties' in schema]
+    if not schemas:
+        return {'$schema': SCHEMA_URI}
     builder = SchemaBuilder()
     for schema in schemas:
-        builder.add_schema(schema)
+        builder.add_schema(denormalize_schema(schema))
     return normalize_schema(builder.to_schema())
 
 
-def get_schema_for_dataframe(df_chunk, *args, **kwargs):
-    dicts = get_dicts_pandas(df_chunk)
-    return get_schema_for_data(dicts)
+def to_python(v):
+    return v.item() if isinstance(v, numpy.generic) else v
+
+
+def get_null_mask(series):
+    mask = series.isnull()
+    if series.dtype == object:
+        mask |= (series == '')
+    return mask
+
+
+def get_choices(values, counts=None):
+    if counts is None:
+        counts = values.value_counts()
+    if len(counts) > ChoicesMixin.max_choices:
+        return None
+    return Counter(dict(zip(counts.index.tolist(), counts.tolist())))
+
+
+def get_sketches(field_type, values, counts):
+    sketches = {'distinct': HyperLogLog(), 'heavy_hitters': HeavyHitters()}
+    sketches['distinct'].update(counts.index)
+    # counts are sorted, and only the top `size + 1` ones matter to a summary of exact counts
+    top_counts = counts.iloc[:sketches['heavy_hitters'].size + 1]
+    sketches['heavy_hitters'].update(dict(zip(top_counts.index.tolist(), top_counts.tolist())))
+    if field_type in ('integer', 'number'):
+        sketches['quantiles'] = QuantileSketch()
+        sketches['quantiles'].update(values)
+    return sketches
+
+
+def get_typed_series(values):
+    """
+    vectorized equivalent of running `typecast` + genson type detection on every value of a null-free series,
+    which also detects booleans and dates among strings. returns a `(json_type, typed_values, format)` tuple, where
+    the values that don't parse (if `settings.TYPE_DETECTION_MIN_PARSE_RATE` allows some) are null, or
+    `(None, None, None)` if the values can't be typed column-wise
+    """
+    if values.dtype == bool:
+        return 'boolean', values, None
+    if values.dtype.kind in 'iu':
+        return 'integer', values, None
+    if values.dtype.kind == 'f':
+        return 'number', values, None
+    if values.dtype.kind == 'M':
+        return 'datetime', values, None
+
+    inferred_type = infer_dtype(values, skipna=True)
+    if inferred_type == 'mixed' and values.map(lambda v: isinstance(v, basestring)).all():
+        inferred_type = 'string'
+
+    if inferred_type in ('string', 'unicode', 'bytes'):
+        return coerce_strings(values)
+    elif inferred_type == 'boolean':
+        return 'boolean', values.astype(bool), None
+    elif inferred_type == 'integer':
+        return 'integer', pd.to_numeric(values), None
+    elif inferred_type in ('floating', 'mixed-integer-float', 'decimal'):
+        return 'number', pd.to_numeric(values), None
+    elif inferred_type in ('datetime', 'datetime64'):
+        return 'datetime', pd.to_datetime(values), None
+    elif inferred_type == 'date':
+        return 'date', pd.to_datetime(values), None
+    return None, None, None
+
+
+def get_schema_for_values(values, num_nan=0):
+    """
+    returns the schema of null-free `values` and the number of them that didn't parse as its type
+    """
+    field_type, typed_values, date_format = get_typed_series(values)
+    if field_type is None:
+        # lists, dicts and mixed types are left to genson
+        node = SchemaNode()
+        for v in values:
+            node.add_object(typecast(v))
+        return node.to_schema(), 0
+
+    unparsed = typed_values.isnull()
+    num_unparsed = int(unparsed.sum())
+    if num_unparsed:
+        typed_values = typed_values[~unparsed]
+    schema = {'type': field_type}
+    if date_format is not None:
+        schema['format'] = date_format
+    counts = typed_values.value_counts()
+    if field_type == 'date':
+        counts.index = counts.index.date
+    choices = get_choices(typed_values, counts)
+    if choices is not None:
+        schema['choices'] = choices
+    if field_type in ('string', 'integer', 'number'):
+        schema.update(get_sketches(field_type, typed_values, counts))
+    if field_type in ('integer', 'number'):
+        profile = NumericProfile()
+        profile.update(typed_values.values)
+        profile.num_nan = num_nan
+        schema.update(profile.get_stats())
+        schema['profile'] = profile
+    return schema, num_unparsed
+
+
+def get_schema_for_series(series):
+    if pd.api.types.is_categorical_dtype(series):
+        series = series.astype(object)
+    null_mask = get_null_mask(series)
+    num_null = int(null_mask.sum())
+
+    subschemas = []
+    if num_null < len(series):
+        # NaNs are stored as nulls, but are still counted by the stats of float columns
+        num_nan = num_null if series.dtype.kind == 'f' else 0
+        schema, num_unparsed = get_schema_for_values(series[~null_mask], num_nan=num_nan)
+        subschemas.append(schema)
+        # values that don't parse are loaded as nulls
+        num_null += num_unparsed
+    if num_null:
+        subschemas.append({'type': 'null', 'num_null': num_null})
+
+    if len(subschemas) == 1:
+        schema = subschemas[0]
+    else:
+        schema = {'anyOf': subschemas}
+    schema['total'] = len(series)
+    return schema
+
 
+def get_types_for_dataframe(df_chunk, *args, **kwargs):
+    """
+    detects the type of every column without computing any stats. columns that are entirely null are skipped
+    """
+    if df_chunk.index.name:
+        df_chunk = df_chunk.reset_index()
+    types = {}
+    for column in df_chunk.columns:
+        series = df_chunk[column]
+        if pd.api.types.is_categorical_dtype(series):
+            series = series.astype(object)
+        values = series[~get_null_mask(series)]
+        if len(values):
+            field_type, _, _ = get_typed_series(values)
+            types[column] = field_type or 'string'
+    return types
+
+
+def get_schema_for_dataframe(df_chunk, *args, **kwargs):
+    """
+    column-wise equivalent of `get_schema_for_data(get_dicts_pandas(df_chunk))`
+    """
+    if len(df_chunk) == 0:
+        return {'$schema': SCHEMA_URI}
+
+    if df_chunk.index.name:
+        df_chunk = df_chunk.reset_index()
+    properties = {}
+    for column in df_chunk.columns:
+        properties[column] = get_schema_for_series(df_chunk[column])
+    return {
+        '$schema': SCHEMA_URI,
+        'type': 'object',
+        'properties': properties,
+        'required': sorted(properties.keys()),
+        'total': len(df_chunk),
+    }
 
-GENERATORS += (Date, Datetime)
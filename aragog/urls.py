@@ -17,7 +17,26 @@ from django.conf.urls import url
 from django.contrib import admin
 from aragog import views
 
-urlpatterns = [
-    url(r'^admin/', admin.site.urls),
-    url(r'^admin/describe/(?P<model_name>[\w.@+-]+)/$', views.describe),
-]
+
+def get_urlpatterns():
+    # the admin urls are those of the models registered when they are generated
+    return [
+        url(r'^admin/ingestion/$', views.ingestion),
+        url(r'^admin/ingestion/status/$', views.ingestion_status),
+        url(r'^admin/metrics/$', views.metrics),
+        url(r'^admin/metrics/runs/$', views.metrics_runs),
+        url(r'^admin/', admin.site.urls),
+        url(r'^admin/describe/(?P<model_name>[\w.@+-]+)/$', views.describe),
+        url(r'^admin/profile/(?P<model_name>[\w.@+-]+)/$', views.profile),
+    ]
+
+
+urlpatterns = get_urlpatterns()
+
+
+class URLConf(object):
+    """
+    a url conf of the models registered so far, which `ModelRefreshMiddleware` routes requests through
+    """
+    def __init__(self):
+        self.urlpatterns = get_urlpatterns()
@@ -1,6 +1,11 @@
 import csv
 from collections import Counter
-from io import StringIO
+try:
+    from cStringIO import StringIO
+except ImportError:
+    from io import StringIO
+
+import pandas as pd
 
 
 def get_dicts(df):
@@ -10,7 +15,9 @@ def get_dicts(df):
     return dicts
 
 
-def get_dicts_pandas(df):
+def get_dicts_pandas(df, columns=None):
+    if columns is not None:
+        df = df[[c for c in df.columns if c in columns]]
     index_name = df.index.name
     for idx, row in df.iterrows():
         d = row.to_dict()
@@ -30,17 +37,18 @@ def psql_insert_copy(table, conn, keys, data_iter):
 
         columns = ', '.join('"{}"'.format(k) for k in keys)
         if table.schema:
-            table_name = '{}.{}'.format(table.schema, table.name)
+            table_name = '"{}"."{}"'.format(table.schema, table.name)
         else:
-            table_name = table.name
+            table_name = '"{}"'.format(table.name)
 
         sql = 'COPY {} ({}) FROM STDIN WITH CSV'.format(
             table_name, columns)
         cur.copy_expert(sql=sql, file=s_buf)
 
 
-def write_to_db(df_chunk, table_name, **kwargs):
-    df_chunk.to_sql(name=table_name, if_exists='replace', index_label='id', **kwargs)
+def write_to_db(df_chunk, table_name, id_offset=0, **kwargs):
+    df_chunk = df_chunk.set_index(pd.RangeIndex(id_offset + 1, id_offset + len(df_chunk) + 1))
+    df_chunk.to_sql(name=table_name, if_exists='append', index_label='id', **kwargs)
 
 
 def ordered_uniques(seq):
@@ -67,3 +75,4 @@ def merge_counters(c1, c2):
     for k, freq in c2.items():
         c[k] += freq
     return c
+
@@ -1,13 +1,64 @@
 from django.apps import apps
-from django.http import Http404
+from django.contrib.admin.views.decorators import staff_member_required
+from django.http import Http404, JsonResponse
 from django.shortcuts import render_to_response
 
+from aragog.models import get_dataset_statuses, get_metrics_store, get_registry
+from aragog.profiling import get_profile
 
-def describe(request, model_name):
-    model_name = model_name.lower()
+
+def get_model(model_name):
+    # the app registry indexes models by their lowercased name
     try:
-        model = [m for m in apps.get_app_config('aragog').get_models() if m.__name__.lower() == model_name][0]
-    except IndexError:
+        return apps.get_model('aragog', model_name)
+    except LookupError:
         raise Http404('Unknown model')
-    else:
-        return render_to_response('aragog/describe.html', context={'model': model})
+
+
+def get_model_profile(model):
+    entry = get_registry().get(model.__name__)
+    return get_profile(model, version=entry['updated_at'].isoformat() if entry else None)
+
+
+@staff_member_required
+def describe(request, model_name):
+    model = get_model(model_name)
+    return render_to_response('aragog/describe.html', context={'model': model, 'dataset': model.__name__,
+                                                               'profile': get_model_profile(model)})
+
+
+@staff_member_required
+def profile(request, model_name):
+    return JsonResponse(get_model_profile(get_model(model_name)))
+
+
+@staff_member_required
+def ingestion(request):
+    return render_to_response('aragog/ingestion.html', context={'statuses': get_dataset_statuses()})
+
+
+@staff_member_required
+def ingestion_status(request):
+    return JsonResponse({'datasets': get_dataset_statuses()})
+
+
+def get_metrics_runs(request):
+    """
+    the latest runs, of the `dataset` query param if there is one
+    """
+    try:
+        limit = int(request.GET.get('limit', 20))
+    except ValueError:
+        limit = 20
+    return get_metrics_store().get_runs(dataset=request.GET.get('dataset') or None, limit=limit)
+
+
+@staff_member_required
+def metrics(request):
+    return render_to_response('aragog/metrics.html', context={'runs': get_metrics_runs(request),
+                                                              'dataset': request.GET.get('dataset')})
+
+
+@staff_member_required
+def metrics_runs(request):
+    return JsonResponse({'runs': get_metrics_runs(request)})